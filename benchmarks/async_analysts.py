@@ -0,0 +1,93 @@
+"""同步 vs 异步执行路径吞吐量基准测试。
+
+使用带固定延迟的模拟聊天模型替换四个Agent，分别以线程池驱动 ``graph.invoke``
+（模拟服务端工作线程池）和以事件循环驱动 ``graph.ainvoke``，比较不同并发下的runs/sec。
+
+用法::
+
+    python benchmarks/async_analysts.py --concurrency 10 100 500 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ["LANGSMITH_TRACING"] = "false"
+
+from agent.simulation import SimulatedChatModel  # noqa: E402
+
+graph_module = importlib.import_module("agent.graph")
+
+
+def install_simulated_agents(latency: float) -> None:
+    """用模拟模型替换所有Agent依赖（仅使用本地模拟工具，不访问网络）"""
+    tools = [
+        graph_module.get_stock_data,
+        graph_module.get_financial_news,
+        graph_module.technical_analysis,
+    ]
+    graph_module.reset_components()
+    graph_module.override_components(
+        model=SimulatedChatModel(latency_seconds=latency),
+        basic_tools=tools,
+        advanced_tools=tools,
+    )
+
+
+def _inputs(i: int) -> dict:
+    return {"original_query": f"请分析模拟标的 DEMO{i} 的投资价值"}
+
+
+def run_sync(graph, concurrency: int, workers: int) -> float:
+    """以线程池并发执行 graph.invoke，返回 runs/sec"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda i: graph.invoke(_inputs(i)), range(concurrency)))
+    return concurrency / (time.perf_counter() - start)
+
+
+async def run_async(graph, concurrency: int) -> float:
+    """在单个事件循环中并发执行 graph.ainvoke，返回 runs/sec"""
+    start = time.perf_counter()
+    await asyncio.gather(*(graph.ainvoke(_inputs(i)) for i in range(concurrency)))
+    return concurrency / (time.perf_counter() - start)
+
+
+def main() -> None:
+    """解析命令行参数并输出各并发度下的基准结果"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="每次模型调用的模拟延迟（秒）"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=min(32, (os.cpu_count() or 1) + 4),
+        help="同步路径的工作线程数（默认与asyncio默认执行器一致）",
+    )
+    args = parser.parse_args()
+
+    import logging
+
+    logging.getLogger(graph_module.__name__).setLevel(logging.WARNING)
+
+    install_simulated_agents(args.latency)
+    graph = graph_module.build_multi_agent_graph()
+
+    print(
+        f"{'concurrency':>12} {'sync runs/s':>12} {'async runs/s':>13} {'speedup':>8}"
+    )
+    for n in args.concurrency:
+        sync_rps = run_sync(graph, n, args.workers)
+        async_rps = asyncio.run(run_async(graph, n))
+        print(
+            f"{n:>12} {sync_rps:>12.2f} {async_rps:>13.2f} {async_rps / sync_rps:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""冷启动导入耗时基准测试。
+
+在全新的子进程中重复执行 ``import agent``，报告耗时的中位数与最小值，
+用于对比延迟初始化前后的worker冷启动成本。
+
+用法::
+
+    python benchmarks/import_time.py --repeat 10
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+_SNIPPET = (
+    "import time; t = time.perf_counter(); import agent; print(time.perf_counter() - t)"
+)
+
+
+def measure(repeat: int) -> list:
+    """在子进程中测量 import agent 的耗时（秒）"""
+    env = {**os.environ, "LANGSMITH_TRACING": "false"}
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", _SNIPPET],
+            check=True,
+            capture_output=True,
+            text=True,
+            env=env,
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return samples
+
+
+def main() -> None:
+    """解析命令行参数并输出导入耗时统计"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    samples = measure(args.repeat)
+    print(
+        f"import agent: median {statistics.median(samples) * 1000:.0f} ms, "
+        f"min {min(samples) * 1000:.0f} ms ({args.repeat} runs)"
+    )
+
+
+if __name__ == "__main__":
+    main()
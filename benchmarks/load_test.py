@@ -0,0 +1,265 @@
+"""多Agent工作流压测驱动。
+
+以模拟聊天模型（或回放录像）驱动编译后的完整工作流，执行 N 次运行、最多 C 个并发，报告：
+
+- 吞吐量（runs/sec）与单次运行耗时的p50/p95/p99
+- 各节点与各节点内LLM调用的耗时p50/p95/p99（来自 agent.metrics）
+- 进程峰值RSS
+- 每次运行的检查点字节数（InMemorySaver，可用 --no-checkpoint 关闭）
+
+``--output`` 将结果写为JSON；``--baseline`` 与之前保存的结果比较，
+吞吐量下降或p95上升超过 ``--tolerance`` 时以非0状态退出，用于发版前的性能回归检查。
+
+用法::
+
+    python benchmarks/load_test.py --runs 200 --concurrency 50 --latency 0.05
+    python benchmarks/load_test.py --cassette .cache/cassette.json --query "分析AAPL" --cassette-latency recorded
+    python benchmarks/load_test.py --output bench.json --baseline bench-main.json
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+os.environ["LANGSMITH_TRACING"] = "false"
+
+from langgraph.checkpoint.memory import InMemorySaver  # noqa: E402
+
+from agent.cassette import Cassette, set_cassette  # noqa: E402
+from agent.metrics import MetricsRecorder, percentile, set_metrics  # noqa: E402
+from agent.simulation import SimulatedChatModel  # noqa: E402
+
+graph_module = importlib.import_module("agent.graph")
+
+
+def install_agents(args: argparse.Namespace) -> None:
+    """用模拟模型或回放录像替换所有Agent依赖"""
+    graph_module.reset_components()
+    if args.cassette:
+        set_cassette(
+            Cassette(args.cassette, mode="replay", latency=args.cassette_latency)
+        )
+        return
+    tools = [
+        graph_module.get_stock_data,
+        graph_module.get_financial_news,
+        graph_module.technical_analysis,
+    ]
+    graph_module.override_components(
+        model=SimulatedChatModel(
+            latency_seconds=args.latency, latency_jitter=args.jitter
+        ),
+        basic_tools=tools,
+        advanced_tools=tools,
+    )
+
+
+def _payload_bytes(value: Any) -> int:
+    """递归统计检查点存储中序列化数据的字节数"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_payload_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_payload_bytes(v) for v in value)
+    return 0
+
+
+def checkpoint_bytes(saver: InMemorySaver) -> int:
+    """InMemorySaver中检查点、通道数据与待写入的总字节数"""
+    return (
+        _payload_bytes(dict(saver.storage))
+        + _payload_bytes(dict(saver.blobs))
+        + _payload_bytes(dict(saver.writes))
+    )
+
+
+def _config(i: int) -> Dict[str, Any]:
+    return {"configurable": {"thread_id": f"load-{i}"}}
+
+
+def _inputs(i: int, query: str) -> Dict[str, Any]:
+    return {"original_query": query.format(i=i)}
+
+
+def run_sync(graph: Any, runs: int, concurrency: int, query: str) -> List[float]:
+    """以线程池并发执行 graph.invoke，返回每次运行的耗时"""
+
+    def one(i: int) -> float:
+        start = time.perf_counter()
+        graph.invoke(_inputs(i, query), _config(i))
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(runs)))
+
+
+async def run_async(graph: Any, runs: int, concurrency: int, query: str) -> List[float]:
+    """在单个事件循环中执行 graph.ainvoke，用信号量限制并发"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            await graph.ainvoke(_inputs(i, query), _config(i))
+            return time.perf_counter() - start
+
+    return list(await asyncio.gather(*(one(i) for i in range(runs))))
+
+
+def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    """执行一次压测并返回结果"""
+    install_agents(args)
+    recorder = MetricsRecorder()
+    set_metrics(recorder)
+    saver = InMemorySaver() if args.checkpoint else None
+    graph = graph_module.build_multi_agent_graph(checkpointer=saver)
+
+    start = time.perf_counter()
+    if args.mode == "async":
+        durations = asyncio.run(
+            run_async(graph, args.runs, args.concurrency, args.query)
+        )
+    else:
+        durations = run_sync(graph, args.runs, args.concurrency, args.query)
+    elapsed = time.perf_counter() - start
+
+    stages = {
+        key: {
+            "count": int(entry["count"]),
+            "p50": entry["p50"],
+            "p95": entry["p95"],
+            "p99": entry["p99"],
+        }
+        for key, entry in recorder.summary().items()
+        if key.startswith(("node:", "llm:"))
+    }
+    return {
+        "mode": args.mode,
+        "runs": args.runs,
+        "concurrency": args.concurrency,
+        "runs_per_second": args.runs / elapsed,
+        "run_latency": {f"p{q}": percentile(durations, q) for q in (50, 95, 99)},
+        "stages": stages,
+        # Linux下ru_maxrss单位为KB，macOS下为字节
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        / (1024 if sys.platform != "darwin" else 1024**2),
+        "checkpoint_bytes_per_run": checkpoint_bytes(saver) / args.runs
+        if saver is not None
+        else None,
+    }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    """打印单次压测结果的延迟与内存统计"""
+    print(
+        f"mode={result['mode']} runs={result['runs']} concurrency={result['concurrency']}"
+    )
+    print(f"throughput: {result['runs_per_second']:.2f} runs/s")
+    latency = result["run_latency"]
+    print(
+        f"run latency: p50 {latency['p50'] * 1000:.0f} ms, p95 {latency['p95'] * 1000:.0f} ms, "
+        f"p99 {latency['p99'] * 1000:.0f} ms"
+    )
+    print(f"peak RSS: {result['peak_rss_mb']:.1f} MB")
+    if result["checkpoint_bytes_per_run"] is not None:
+        print(f"checkpoint bytes/run: {result['checkpoint_bytes_per_run']:.0f}")
+    print(f"\n{'stage':<32} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for key, stage in result["stages"].items():
+        print(
+            f"{key:<32} {stage['count']:>7} {stage['p50'] * 1000:>9.1f} "
+            f"{stage['p95'] * 1000:>9.1f} {stage['p99'] * 1000:>9.1f}"
+        )
+
+
+def compare_with_baseline(
+    result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """返回超出容忍度的回归项"""
+    regressions = []
+    if result["runs_per_second"] < baseline["runs_per_second"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {result['runs_per_second']:.2f} < baseline {baseline['runs_per_second']:.2f} runs/s"
+        )
+    if result["run_latency"]["p95"] > baseline["run_latency"]["p95"] * (1 + tolerance):
+        regressions.append(
+            f"run p95 {result['run_latency']['p95']:.3f}s > baseline {baseline['run_latency']['p95']:.3f}s"
+        )
+    for key, stage in result["stages"].items():
+        base: Optional[Dict[str, Any]] = baseline.get("stages", {}).get(key)
+        if (
+            base
+            and base["p95"] > 0.001
+            and stage["p95"] > base["p95"] * (1 + tolerance)
+        ):
+            regressions.append(
+                f"{key} p95 {stage['p95']:.3f}s > baseline {base['p95']:.3f}s"
+            )
+    return regressions
+
+
+def main() -> None:
+    """解析命令行参数并执行压测"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mode", choices=["async", "sync"], default="async")
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="每次模型调用的模拟延迟（秒）"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="模拟延迟的均匀抖动（秒）"
+    )
+    parser.add_argument(
+        "--query",
+        default="请分析模拟标的 DEMO{i} 的投资价值",
+        help="查询模板，{i}为运行序号；回放录像时需与录制时的查询一致",
+    )
+    parser.add_argument("--cassette", help="回放录像文件（替代模拟模型）")
+    parser.add_argument(
+        "--cassette-latency",
+        default="recorded",
+        help="回放延迟，见 agent.cassette.parse_latency",
+    )
+    parser.add_argument(
+        "--no-checkpoint",
+        dest="checkpoint",
+        action="store_false",
+        help="不挂载检查点存储",
+    )
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    parser.add_argument("--baseline", help="与之前保存的JSON结果比较")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="允许的性能退化比例"
+    )
+    args = parser.parse_args()
+
+    # 模拟模型的评审不含JSON反馈，解析告警对压测没有意义
+    logging.getLogger("agent").setLevel(logging.ERROR)
+
+    result = run_load_test(args)
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(result, json.load(f), args.tolerance)
+        if regressions:
+            print("\nperformance regressions:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\nno regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
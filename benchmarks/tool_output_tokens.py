@@ -0,0 +1,106 @@
+"""比较工具输出格式（text / compact）对提示词token的影响。
+
+逐个打印五个工具在两种格式下的输出token估算，再以模拟聊天模型（本地模拟工具）各运行一次完整工作流，
+比较每次运行中所有LLM调用的提示词token总数（来自 agent.metrics）。
+
+用法::
+
+    python benchmarks/tool_output_tokens.py
+    python benchmarks/tool_output_tokens.py --query "请分析 AAPL 的技术面与风险" --runs 5
+"""
+
+import argparse
+import importlib
+import logging
+import os
+from typing import Any, Dict
+
+os.environ["LANGSMITH_TRACING"] = "false"
+
+from agent.metrics import MetricsRecorder, set_metrics  # noqa: E402
+from agent.simulation import SimulatedChatModel, estimate_tokens  # noqa: E402
+
+graph_module = importlib.import_module("agent.graph")
+
+FORMATS = ("text", "compact")
+SAMPLE_CALLS = [
+    ("get_stock_data", {"symbol": "AAPL"}),
+    ("get_financial_news", {"keyword": "AAPL"}),
+    ("technical_analysis", {"symbol": "AAPL"}),
+    ("portfolio_optimization", {"assets": "股票,债券,现金"}),
+    ("risk_assessment", {"position_size": "10%", "market_cap": "大盘"}),
+]
+
+
+def _format_config(output_format: str) -> Dict[str, Any]:
+    return {"configurable": {"tool_output_format": output_format}}
+
+
+def tool_output_tokens() -> Dict[str, Dict[str, int]]:
+    """每个工具在两种格式下的输出token估算"""
+    return {
+        name: {
+            fmt: estimate_tokens(
+                getattr(graph_module, name).invoke(args, _format_config(fmt))
+            )
+            for fmt in FORMATS
+        }
+        for name, args in SAMPLE_CALLS
+    }
+
+
+def prompt_tokens_per_run(output_format: str, query: str, runs: int) -> float:
+    """以模拟模型运行完整工作流，返回平均每次运行的LLM提示词token"""
+    graph_module.reset_components()
+    # 只使用本地模拟工具，不创建Tavily搜索（离线运行不需要任何API Key）
+    basic_tools = [
+        graph_module.get_stock_data,
+        graph_module.get_financial_news,
+        graph_module.technical_analysis,
+    ]
+    graph_module.override_components(
+        model=SimulatedChatModel(),
+        basic_tools=basic_tools,
+        advanced_tools=basic_tools
+        + [graph_module.portfolio_optimization, graph_module.risk_assessment],
+    )
+    recorder = MetricsRecorder()
+    set_metrics(recorder)
+    graph = graph_module.build_multi_agent_graph()
+    for _ in range(runs):
+        graph.invoke({"original_query": query}, _format_config(output_format))
+    return (
+        sum(
+            entry["prompt_tokens"]
+            for key, entry in recorder.summary().items()
+            if key.startswith("llm:")
+        )
+        / runs
+    )
+
+
+def main() -> None:
+    """解析命令行参数并输出工具结果的token统计"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--query", default="请分析 AAPL 的投资价值")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.getLogger("agent").setLevel(logging.ERROR)
+
+    print(f"{'tool':<26} {'text':>7} {'compact':>8} {'saved':>7}")
+    for name, tokens in tool_output_tokens().items():
+        saved = 1 - tokens["compact"] / tokens["text"]
+        print(f"{name:<26} {tokens['text']:>7} {tokens['compact']:>8} {saved:>7.0%}")
+
+    per_run = {
+        fmt: prompt_tokens_per_run(fmt, args.query, args.runs) for fmt in FORMATS
+    }
+    saved = 1 - per_run["compact"] / per_run["text"]
+    print(
+        f"\nprompt tokens/run: text {per_run['text']:.0f}, compact {per_run['compact']:.0f} ({saved:.1%} saved)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""批量分析：一次调用分析多个标的，用Send按标的扇出并在每个标的完成时流式返回报告。"""
+
+import logging
+import operator
+import re
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import Send
+from typing_extensions import Annotated, TypedDict
+
+from agent.graph import graph as analysis_graph
+from agent.metrics import instrument_node
+
+logger = logging.getLogger(__name__)
+
+# 同时分析的标的数上限（每个标的内部还会并行运行三个分析师）
+DEFAULT_BATCH_CONCURRENCY = 8
+TICKER_QUERY_TEMPLATE = "请分析 {ticker} 的投资价值"
+_TICKER_PATTERN = re.compile(r"^[A-Za-z0-9]{1,10}(\.[A-Za-z]{1,4})?$")
+
+
+class BatchState(TypedDict):
+    """批量分析状态"""
+
+    queries: List[str]
+    reports: Annotated[List[Dict[str, Any]], operator.add]
+
+
+class QueryTask(TypedDict):
+    """单个标的的分析任务（Send载荷）"""
+
+    query: str
+
+
+def as_query(item: str) -> str:
+    """裸股票代码（如 AAPL、600519.SH）转换为分析请求，其他文本原样使用"""
+    item = item.strip()
+    return (
+        TICKER_QUERY_TEMPLATE.format(ticker=item.upper())
+        if _TICKER_PATTERN.match(item)
+        else item
+    )
+
+
+def _report(query: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "query": query,
+        "final_report": result.get("final_report"),
+        "consensus_reached": result.get("consensus_reached"),
+        "workflow_stage": result.get("workflow_stage"),
+    }
+
+
+def _failed_report(query: str, e: Exception) -> Dict[str, Any]:
+    logger.error(f"❌ 批量分析失败: {query} - {e}")
+    return {
+        "query": query,
+        "final_report": None,
+        "consensus_reached": False,
+        "error": str(e),
+    }
+
+
+def analyze_query_node(
+    task: QueryTask, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """对单个标的运行完整的多Agent工作流，单个标的失败不影响其他标的"""
+    try:
+        result = analysis_graph.invoke({"original_query": task["query"]}, config)
+    except Exception as e:
+        return {"reports": [_failed_report(task["query"], e)]}
+    return {"reports": [_report(task["query"], result)]}
+
+
+async def aanalyze_query_node(
+    task: QueryTask, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """analyze_query_node 的异步版本"""
+    try:
+        result = await analysis_graph.ainvoke({"original_query": task["query"]}, config)
+    except Exception as e:
+        return {"reports": [_failed_report(task["query"], e)]}
+    return {"reports": [_report(task["query"], result)]}
+
+
+def fan_out_queries(state: BatchState) -> List[Send]:
+    """每个标的一个Send任务，并发数由 RunnableConfig 的 max_concurrency 限制"""
+    logger.info(f"📦 批量分析启动，共 {len(state['queries'])} 个标的")
+    return [
+        Send("analyze_query", {"query": as_query(query)}) for query in state["queries"]
+    ]
+
+
+def build_batch_graph():
+    """构建批量分析图：START → (Send × 标的) analyze_query → END"""
+    builder = StateGraph(BatchState)
+    builder.add_node(
+        "analyze_query",
+        RunnableLambda(
+            instrument_node("analyze_query", analyze_query_node),
+            afunc=instrument_node("analyze_query", aanalyze_query_node),
+            name="analyze_query",
+        ),
+    )
+    builder.add_conditional_edges(START, fan_out_queries, ["analyze_query"])
+    builder.add_edge("analyze_query", END)
+    return builder.compile()
+
+
+batch_graph = build_batch_graph()
+
+
+def _batch_config(
+    max_concurrency: Optional[int], config: Optional[RunnableConfig]
+) -> RunnableConfig:
+    return {
+        **(config or {}),
+        "max_concurrency": max_concurrency or DEFAULT_BATCH_CONCURRENCY,
+    }
+
+
+def stream_batch(
+    queries: Sequence[str],
+    max_concurrency: Optional[int] = None,
+    config: Optional[RunnableConfig] = None,
+) -> Iterator[Dict[str, Any]]:
+    """批量分析，按完成顺序逐个返回各标的的报告"""
+    inputs = {"queries": list(queries), "reports": []}
+    for chunk in batch_graph.stream(
+        inputs, _batch_config(max_concurrency, config), stream_mode="updates"
+    ):
+        for update in chunk.values():
+            yield from (update or {}).get("reports", [])
+
+
+async def astream_batch(
+    queries: Sequence[str],
+    max_concurrency: Optional[int] = None,
+    config: Optional[RunnableConfig] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """stream_batch 的异步版本"""
+    inputs = {"queries": list(queries), "reports": []}
+    async for chunk in batch_graph.astream(
+        inputs, _batch_config(max_concurrency, config), stream_mode="updates"
+    ):
+        for update in chunk.values():
+            for report in (update or {}).get("reports", []):
+                yield report
@@ -0,0 +1,356 @@
+"""录制/回放LLM与工具调用，脱离DeepSeek与Tavily离线复现完整工作流。"""
+
+import asyncio
+import atexit
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import BaseTool, StructuredTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict
+
+from agent.configuration import load_environment
+from agent.llm_cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_MODES = ("record", "replay")
+
+
+def parse_latency(spec: Optional[str]) -> Callable[[float], float]:
+    """解析回放延迟：none | recorded | recorded*<倍数> | fixed:<秒> | uniform:<最小>,<最大> | lognormal:<中位数>,<sigma>"""
+    spec = (spec or "none").strip().lower()
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",")] if params else []
+    if kind == "none":
+        return lambda recorded: 0.0
+    if kind == "recorded":
+        return lambda recorded: recorded
+    if kind.startswith("recorded*"):
+        factor = float(kind.split("*", 1)[1])
+        return lambda recorded: recorded * factor
+    if kind == "fixed" and len(values) == 1:
+        return lambda recorded: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda recorded: random.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        return lambda recorded: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"无法解析的回放延迟配置: {spec}")
+
+
+def _llm_key(messages: List[BaseMessage], kwargs: Dict[str, Any]) -> str:
+    """LLM请求键：消息列表 + 绑定的工具名 + stop（不含模型参数，录像可在任意模型上回放）"""
+    tools = sorted(
+        (t.get("function") or {}).get("name", "") if isinstance(t, dict) else str(t)
+        for t in kwargs.get("tools") or []
+    )
+    return make_cache_key(
+        dumps(messages),
+        json.dumps({"tools": tools, "stop": kwargs.get("stop")}, sort_keys=True),
+    )
+
+
+def _tool_key(name: str, arguments: Dict[str, Any]) -> str:
+    """工具请求键：工具名 + 参数"""
+    return json.dumps(
+        [name, arguments], sort_keys=True, ensure_ascii=False, default=str
+    )
+
+
+class Cassette:
+    """录像文件：按请求键保存LLM响应与工具结果，同一请求多次出现时按顺序循环回放
+
+    录制时只在内存中追加，调用 flush()/close()（或以 with 使用）时整体写入一次；进程级录像在退出时自动写入。
+    """
+
+    def __init__(self, path: str, mode: str = "replay", latency: Optional[str] = None):
+        """打开录像文件：回放模式下文件必须存在，录制模式下追加到已有录像"""
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"未知的录像模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = parse_latency(latency)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._cursors: Dict[Tuple[str, str], int] = {}
+        self._data: Dict[str, Dict[str, Any]] = {"tools": {}, "llm": {}, "tool": {}}
+        if mode == "replay" or os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._data.update(json.load(f))
+
+    def _write(self) -> None:
+        """原子写入录像文件：先写同目录下的临时文件，再 os.replace 替换（调用方持有锁）"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def save(self) -> None:
+        """立即写入录像文件"""
+        with self._lock:
+            self._write()
+
+    def flush(self) -> None:
+        """有未写入的录制内容时写入录像文件"""
+        with self._lock:
+            if self._dirty:
+                self._write()
+                logger.info(f"📼 录像已保存: {self.path}")
+
+    def close(self) -> None:
+        """结束录制并写入录像文件"""
+        self.flush()
+
+    def __enter__(self) -> "Cassette":
+        """返回录像本身，配合 with 在退出时写入"""
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """退出 with 块时写入录像"""
+        self.close()
+
+    def _append(self, section: str, key: str, entry: Dict[str, Any]) -> None:
+        """在内存中追加一条录制记录，待 flush()/close() 时写入"""
+        with self._lock:
+            self._data[section].setdefault(key, []).append(entry)
+            self._dirty = True
+
+    def _next(self, section: str, key: str) -> Dict[str, Any]:
+        """取出请求键对应的下一条录制记录（按顺序循环）"""
+        with self._lock:
+            entries = self._data[section].get(key)
+            if not entries:
+                raise LookupError(f"录像中没有匹配的{section}请求: {key[:120]}")
+            cursor = self._cursors.get((section, key), 0)
+            self._cursors[(section, key)] = cursor + 1
+            return entries[cursor % len(entries)]
+
+    def record_llm(self, key: str, message: BaseMessage, latency: float) -> None:
+        """录制一次LLM响应及其耗时"""
+        self._append(
+            "llm", key, {"message": message_to_dict(message), "latency": latency}
+        )
+
+    def replay_llm(self, key: str) -> Tuple[BaseMessage, float]:
+        """返回录制的响应消息与本次应模拟的延迟"""
+        entry = self._next("llm", key)
+        return messages_from_dict([entry["message"]])[0], self.latency(entry["latency"])
+
+    def record_tool(
+        self, name: str, arguments: Dict[str, Any], output: Any, latency: float
+    ) -> None:
+        """录制一次工具调用结果及其耗时"""
+        self._append(
+            "tool", _tool_key(name, arguments), {"output": output, "latency": latency}
+        )
+
+    def replay_tool(self, name: str, arguments: Dict[str, Any]) -> Tuple[Any, float]:
+        """返回录制的工具结果与本次应模拟的延迟"""
+        entry = self._next("tool", _tool_key(name, arguments))
+        return entry["output"], self.latency(entry["latency"])
+
+    def register_tool(self, schema: Dict[str, Any]) -> None:
+        """记录工具的OpenAI函数schema，回放时据此重建同名工具"""
+        with self._lock:
+            if self._data["tools"].get(schema["name"]) != schema:
+                self._data["tools"][schema["name"]] = schema
+                self._dirty = True
+
+    def tool_schema(self, name: str) -> Optional[Dict[str, Any]]:
+        """返回录制的工具schema，没有时返回None"""
+        return self._data["tools"].get(name)
+
+
+class CassetteChatModel(BaseChatModel):
+    """录制模式下透传给 inner 并保存响应；回放模式下直接返回录制的响应"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    cassette: Cassette
+    inner: Optional[BaseChatModel] = None
+
+    @property
+    def _llm_type(self) -> str:
+        """录制时沿用内部模型的类型名"""
+        return self.inner._llm_type if self.inner is not None else "cassette"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        """录制时沿用内部模型的标识参数"""
+        return (
+            self.inner._identifying_params
+            if self.inner is not None
+            else {"cassette": self.cassette.path}
+        )
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Any:
+        """录制时沿用内部模型的工具格式转换，回放时转换为OpenAI格式"""
+        if self.inner is not None:
+            return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _replay(
+        self, messages: List[BaseMessage], kwargs: Dict[str, Any]
+    ) -> Tuple[ChatResult, float]:
+        """按请求键取出录制的响应"""
+        message, delay = self.cassette.replay_llm(_llm_key(messages, kwargs))
+        return ChatResult(generations=[ChatGeneration(message=message)]), delay
+
+    def _record(
+        self,
+        messages: List[BaseMessage],
+        kwargs: Dict[str, Any],
+        result: ChatResult,
+        started: float,
+    ) -> None:
+        """录制内部模型的响应"""
+        self.cassette.record_llm(
+            _llm_key(messages, kwargs),
+            result.generations[0].message,
+            time.perf_counter() - started,
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """回放录制的响应或透传给内部模型并录制（同步）"""
+        if self.cassette.mode == "replay":
+            result, delay = self._replay(messages, {**kwargs, "stop": stop})
+            if delay:
+                time.sleep(delay)
+            return result
+        started = time.perf_counter()
+        result = self.inner._generate(
+            messages, stop=stop, run_manager=run_manager, **kwargs
+        )
+        self._record(messages, {**kwargs, "stop": stop}, result, started)
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """回放录制的响应或透传给内部模型并录制（异步）"""
+        if self.cassette.mode == "replay":
+            result, delay = self._replay(messages, {**kwargs, "stop": stop})
+            if delay:
+                await asyncio.sleep(delay)
+            return result
+        started = time.perf_counter()
+        result = await self.inner._agenerate(
+            messages, stop=stop, run_manager=run_manager, **kwargs
+        )
+        self._record(messages, {**kwargs, "stop": stop}, result, started)
+        return result
+
+
+def replay_tool(
+    cassette: Cassette, name: str, schema: Optional[Dict[str, Any]] = None
+) -> BaseTool:
+    """按录制的schema重建工具，调用时返回录制的结果（无需真实工具及其API密钥）"""
+    schema = cassette.tool_schema(name) or schema
+    if schema is None:
+        raise LookupError(f"录像中没有工具: {name}")
+
+    def run(**kwargs: Any) -> Any:
+        output, delay = cassette.replay_tool(name, kwargs)
+        if delay:
+            time.sleep(delay)
+        return output
+
+    async def arun(**kwargs: Any) -> Any:
+        output, delay = cassette.replay_tool(name, kwargs)
+        if delay:
+            await asyncio.sleep(delay)
+        return output
+
+    return StructuredTool.from_function(
+        func=run,
+        coroutine=arun,
+        name=name,
+        description=schema.get("description", ""),
+        args_schema=schema.get("parameters") or {"type": "object", "properties": {}},
+    )
+
+
+def cassette_tool(cassette: Cassette, tool: BaseTool) -> BaseTool:
+    """录制模式下包装真实工具并保存每次调用结果；回放模式下返回同名回放工具"""
+    schema = convert_to_openai_tool(tool)["function"]
+    if cassette.mode == "replay":
+        return replay_tool(cassette, tool.name, schema)
+    cassette.register_tool(schema)
+
+    def run(**kwargs: Any) -> Any:
+        started = time.perf_counter()
+        output = tool.invoke(kwargs)
+        cassette.record_tool(tool.name, kwargs, output, time.perf_counter() - started)
+        return output
+
+    async def arun(**kwargs: Any) -> Any:
+        started = time.perf_counter()
+        output = await tool.ainvoke(kwargs)
+        cassette.record_tool(tool.name, kwargs, output, time.perf_counter() - started)
+        return output
+
+    return StructuredTool.from_function(
+        func=run,
+        coroutine=arun,
+        name=tool.name,
+        description=schema.get("description", ""),
+        args_schema=schema.get("parameters") or {"type": "object", "properties": {}},
+    )
+
+
+_cassette: Optional[Cassette] = None
+_cassette_configured = False
+
+
+def get_cassette() -> Optional[Cassette]:
+    """获取进程级录像（设置 AGENT_CASSETTE 后启用，AGENT_CASSETTE_MODE=record|replay，AGENT_CASSETTE_LATENCY见parse_latency）"""
+    global _cassette, _cassette_configured
+    if not _cassette_configured:
+        load_environment()
+        path = os.getenv("AGENT_CASSETTE")
+        if path:
+            _cassette = Cassette(
+                path,
+                mode=os.getenv("AGENT_CASSETTE_MODE", "replay").lower(),
+                latency=os.getenv("AGENT_CASSETTE_LATENCY"),
+            )
+            if _cassette.mode == "record":
+                atexit.register(_cassette.close)
+            logger.info(f"📼 录像{_cassette.mode}模式: {path}")
+        _cassette_configured = True
+    return _cassette
+
+
+def set_cassette(cassette: Optional[Cassette]) -> None:
+    """替换进程级录像（传入 None 禁用）"""
+    global _cassette, _cassette_configured
+    _cassette = cassette
+    _cassette_configured = True
@@ -0,0 +1,489 @@
+"""本地SQLite检查点存储与断点续跑。
+
+运行中途崩溃后从最后完成的节点继续，已完成的节点不再重复执行；也可基于检查点单独重跑失败的分析师。
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from agent.configuration import load_environment
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_PATH = ".cache/checkpoints.sqlite"
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """SQLite检查点存储（标准库sqlite3实现，进程内多线程共享一个连接）
+
+    通道值按版本单独存储，未变化的通道（如已完成的分析结果）不会在每个检查点重复写入。
+    异步接口直接调用同步实现：单次读写都是本地小事务，不值得切换线程。
+    """
+
+    def __init__(self, database_path: str, **kwargs: Any):
+        """初始化SQLite数据库路径与写入锁"""
+        super().__init__(**kwargs)
+        self.database_path = database_path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(database_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(database_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, "
+            "parent_checkpoint_id TEXT, type TEXT NOT NULL, checkpoint BLOB NOT NULL, "
+            "metadata_type TEXT NOT NULL, metadata BLOB NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id));"
+            "CREATE TABLE IF NOT EXISTS checkpoint_blobs ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, channel TEXT NOT NULL, version TEXT NOT NULL, "
+            "type TEXT NOT NULL, value BLOB NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, channel, version));"
+            "CREATE TABLE IF NOT EXISTS checkpoint_writes ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, "
+            "task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL, "
+            "type TEXT NOT NULL, value BLOB NOT NULL, task_path TEXT NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx));"
+        )
+        self._conn.commit()
+
+    # ============= 读取 =============
+
+    def _load_channel_values(
+        self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions
+    ) -> Dict[str, Any]:
+        values = {}
+        for channel, version in versions.items():
+            row = self._conn.execute(
+                "SELECT type, value FROM checkpoint_blobs "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if row is not None and row[0] != "empty":
+                values[channel] = self.serde.loads_typed((row[0], row[1]))
+        return values
+
+    def _to_tuple(self, row: Tuple[Any, ...]) -> CheckpointTuple:
+        (
+            thread_id,
+            checkpoint_ns,
+            checkpoint_id,
+            parent_id,
+            type_,
+            checkpoint_b,
+            metadata_type,
+            metadata_b,
+        ) = row
+        checkpoint: Checkpoint = self.serde.loads_typed((type_, checkpoint_b))
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM checkpoint_writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_channel_values(
+                    thread_id, checkpoint_ns, checkpoint["channel_versions"]
+                ),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_b)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((t, v)))
+                for task_id, channel, t, v in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """读取指定检查点；未指定checkpoint_id时读取该线程最新的检查点"""
+        configurable = config["configurable"]
+        query = "SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        params: List[Any] = [
+            configurable["thread_id"],
+            configurable.get("checkpoint_ns", ""),
+        ]
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        with self._lock:
+            row = self._conn.execute(
+                query + " ORDER BY checkpoint_id DESC LIMIT 1", params
+            ).fetchone()
+            return self._to_tuple(row) if row is not None else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """按时间倒序列出检查点，可按线程、命名空间、元数据与 before 过滤"""
+        query = "SELECT * FROM checkpoints WHERE 1 = 1"
+        params: List[Any] = []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if (
+                checkpoint_ns := config["configurable"].get("checkpoint_ns")
+            ) is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_id)
+        with self._lock:
+            rows = self._conn.execute(
+                query + " ORDER BY checkpoint_id DESC", params
+            ).fetchall()
+            results = []
+            for row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                item = self._to_tuple(row)
+                if filter and not all(
+                    item.metadata.get(k) == v for k, v in filter.items()
+                ):
+                    continue
+                results.append(item)
+        yield from results
+
+    # ============= 写入 =============
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """保存检查点，只写入本步有新版本的通道值"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        stored = checkpoint.copy()
+        values: Dict[str, Any] = stored.pop("channel_values")  # type: ignore[misc]
+        blobs = [
+            (
+                thread_id,
+                checkpoint_ns,
+                channel,
+                str(version),
+                *(
+                    self.serde.dumps_typed(values[channel])
+                    if channel in values
+                    else ("empty", b"")
+                ),
+            )
+            for channel, version in new_versions.items()
+        ]
+        type_, checkpoint_b = self.serde.dumps_typed(stored)
+        metadata_type, metadata_b = self.serde.dumps_typed(
+            get_checkpoint_metadata(config, metadata)
+        )
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO checkpoint_blobs VALUES (?, ?, ?, ?, ?, ?)",
+                blobs,
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    checkpoint_b,
+                    metadata_type,
+                    metadata_b,
+                ),
+            )
+            self._conn.commit()
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """保存节点的中间写入：同一超步中已成功的并行节点在续跑时直接复用"""
+        configurable = config["configurable"]
+        key = (
+            configurable["thread_id"],
+            configurable.get("checkpoint_ns", ""),
+            configurable["checkpoint_id"],
+        )
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            rows.append(
+                (
+                    write_idx,
+                    (
+                        *key,
+                        task_id,
+                        write_idx,
+                        channel,
+                        *self.serde.dumps_typed(value),
+                        task_path,
+                    ),
+                )
+            )
+        with self._lock:
+            for write_idx, row in rows:
+                # 普通写入保留首次结果，错误/中断等特殊写入以最新为准（与InMemorySaver一致）
+                verb = "INSERT OR IGNORE" if write_idx >= 0 else "INSERT OR REPLACE"
+                self._conn.execute(
+                    f"{verb} INTO checkpoint_writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+            self._conn.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        """删除线程的所有检查点与写入"""
+        with self._lock:
+            for table in ("checkpoints", "checkpoint_blobs", "checkpoint_writes"):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,)
+                )
+            self._conn.commit()
+
+    # ============= 异步接口 =============
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """get_tuple 的异步版本"""
+        return self.get_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """同步 list 的异步版本"""
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """同步 put 的异步版本"""
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """put_writes 的异步版本"""
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """delete_thread 的异步版本"""
+        self.delete_thread(thread_id)
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+# ============= 进程级检查点与可续跑的工作流 =============
+
+_checkpointer: Optional[BaseCheckpointSaver] = None
+_resumable_graph: Any = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer() -> BaseCheckpointSaver:
+    """获取进程级检查点存储（AGENT_CHECKPOINT_PATH 配置SQLite文件路径）"""
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            load_environment()
+            path = os.getenv("AGENT_CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH)
+            _checkpointer = SQLiteCheckpointSaver(path)
+            logger.info(f"💾 已启用检查点存储: {path}")
+        return _checkpointer
+
+
+def set_checkpointer(checkpointer: Optional[BaseCheckpointSaver]) -> None:
+    """替换进程级检查点存储（如改用InMemorySaver或Postgres）"""
+    global _checkpointer, _resumable_graph
+    with _checkpointer_lock:
+        _checkpointer = checkpointer
+        _resumable_graph = None
+
+
+def get_resumable_graph() -> Any:
+    """获取挂载了进程级检查点存储的工作流"""
+    global _resumable_graph
+    checkpointer = get_checkpointer()
+    with _checkpointer_lock:
+        if _resumable_graph is None:
+            from agent.graph import build_multi_agent_graph
+
+            _resumable_graph = build_multi_agent_graph(checkpointer=checkpointer)
+        return _resumable_graph
+
+
+def _thread_config(thread_id: str, config: Optional[RunnableConfig]) -> RunnableConfig:
+    config = dict(config or {})
+    config["configurable"] = {**config.get("configurable", {}), "thread_id": thread_id}
+    return config
+
+
+def pending_nodes(thread_id: str) -> Tuple[str, ...]:
+    """线程中尚未完成的节点；为空表示运行已结束（或线程不存在）"""
+    return get_resumable_graph().get_state(_thread_config(thread_id, None)).next
+
+
+def run(
+    query: str, thread_id: str, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """以指定线程运行完整工作流，每个超步结束时写入检查点"""
+    return get_resumable_graph().invoke(
+        {"original_query": query}, _thread_config(thread_id, config)
+    )
+
+
+async def arun(
+    query: str, thread_id: str, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """同步 run 的异步版本"""
+    return await get_resumable_graph().ainvoke(
+        {"original_query": query}, _thread_config(thread_id, config)
+    )
+
+
+def resume(thread_id: str, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """从线程最后的检查点继续运行，只重新执行未完成的节点"""
+    graph = get_resumable_graph()
+    thread_config = _thread_config(thread_id, config)
+    remaining = graph.get_state(thread_config).next
+    if not remaining:
+        logger.info(f"✅ 线程 {thread_id} 没有未完成的节点，直接返回最终状态")
+        return graph.get_state(thread_config).values
+    logger.info(f"🔁 线程 {thread_id} 从检查点续跑: {', '.join(remaining)}")
+    return graph.invoke(None, thread_config)
+
+
+async def aresume(
+    thread_id: str, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """同步 resume 的异步版本"""
+    graph = get_resumable_graph()
+    thread_config = _thread_config(thread_id, config)
+    state = await graph.aget_state(thread_config)
+    if not state.next:
+        logger.info(f"✅ 线程 {thread_id} 没有未完成的节点，直接返回最终状态")
+        return state.values
+    logger.info(f"🔁 线程 {thread_id} 从检查点续跑: {', '.join(state.next)}")
+    return await graph.ainvoke(None, thread_config)
+
+
+# ============= 单个分析师重跑 =============
+
+
+def failed_analysts(thread_id: str) -> List[str]:
+    """线程中最近一次执行失败（含超时）的分析师"""
+    state = get_resumable_graph().get_state(_thread_config(thread_id, None))
+    return [
+        key
+        for key, ok in (state.values.get("completion_status") or {}).items()
+        if not ok
+    ]
+
+
+def _check_rerunnable(thread_id: str, analyst: str, values: Dict[str, Any]) -> None:
+    if analyst not in (values.get("completion_status") or {}):
+        raise ValueError(f"线程 {thread_id} 中分析师 {analyst} 尚未执行，无法单独重跑")
+
+
+def rerun_analyst(
+    thread_id: str, analyst: str, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """基于检查点只重跑一位分析师，复用其余分析结果，然后重新运行同行评议及下游节点"""
+    from agent.graph import RERUN_AS_NODE, rerun_analyst_update
+
+    graph = get_resumable_graph()
+    thread_config = _thread_config(thread_id, config)
+    values = graph.get_state(thread_config).values
+    _check_rerunnable(thread_id, analyst, values)
+    logger.info(f"🔁 线程 {thread_id} 单独重跑分析师: {analyst}")
+    graph.update_state(
+        thread_config,
+        rerun_analyst_update(values, analyst, thread_config),
+        as_node=RERUN_AS_NODE,
+    )
+    return graph.invoke(None, thread_config)
+
+
+async def arerun_analyst(
+    thread_id: str, analyst: str, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """rerun_analyst 的异步版本"""
+    from agent.graph import RERUN_AS_NODE, arerun_analyst_update
+
+    graph = get_resumable_graph()
+    thread_config = _thread_config(thread_id, config)
+    values = (await graph.aget_state(thread_config)).values
+    _check_rerunnable(thread_id, analyst, values)
+    logger.info(f"🔁 线程 {thread_id} 单独重跑分析师: {analyst}")
+    update = await arerun_analyst_update(values, analyst, thread_config)
+    await graph.aupdate_state(thread_config, update, as_node=RERUN_AS_NODE)
+    return await graph.ainvoke(None, thread_config)
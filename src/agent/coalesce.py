@@ -0,0 +1,234 @@
+"""相同查询的请求合并：并发的相同请求共享同一次运行，完成后短时间内直接复用结果并在后台刷新。"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+
+from agent.configuration import load_environment
+from agent.graph import graph
+from agent.query import query_key
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """按键合并并发调用（同步线程与异步协程共用同一份进行中的结果）
+
+    - 同一键正在运行时，后来者等待并共享其结果（失败时一起收到异常，失败结果不缓存）
+    - 完成后 fresh_seconds 内直接返回结果
+    - 之后 stale_seconds 内仍返回旧结果，同时在后台重新运行一次
+    """
+
+    def __init__(self, fresh_seconds: float = 10.0, stale_seconds: float = 60.0):
+        """初始化结果新鲜期、过期期与进行中的请求表"""
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self._in_flight: Dict[str, Future] = {}
+        self._completed: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._background: Set[Any] = set()
+        self._stats = {"runs": 0, "coalesced": 0, "fresh_hits": 0, "stale_hits": 0}
+
+    def _lookup(self, key: str) -> Tuple[str, Any]:
+        """返回 ("fresh"|"stale", 结果)、("join", Future) 或 ("lead", Future)，需持有锁调用"""
+        now = time.monotonic()
+        for stale_key in [
+            k
+            for k, (done, _) in self._completed.items()
+            if now - done > self.fresh_seconds + self.stale_seconds
+        ]:
+            del self._completed[stale_key]
+
+        completed = self._completed.get(key)
+        if completed is not None:
+            age = now - completed[0]
+            if age <= self.fresh_seconds:
+                self._stats["fresh_hits"] += 1
+                return "fresh", completed[1]
+            self._stats["stale_hits"] += 1
+            return "stale", completed[1]
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self._stats["coalesced"] += 1
+            return "join", future
+        return "lead", self._start(key)
+
+    def _start(self, key: str) -> Future:
+        future: Future = Future()
+        self._in_flight[key] = future
+        self._stats["runs"] += 1
+        return future
+
+    def _finish(
+        self,
+        key: str,
+        future: Future,
+        result: Any = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if error is None:
+                self._completed[key] = (time.monotonic(), result)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def _refresh_future(self, key: str) -> Optional[Future]:
+        """过期结果被使用时启动后台刷新；已有刷新在进行时返回None"""
+        with self._lock:
+            if key in self._in_flight:
+                return None
+            return self._start(key)
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """同步执行：相同键的并发调用只运行一次func"""
+        with self._lock:
+            state, value = self._lookup(key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            future = self._refresh_future(key)
+            if future is not None:
+                threading.Thread(
+                    target=self._refresh, args=(key, future, func), daemon=True
+                ).start()
+            return value
+        if state == "join":
+            return value.result()
+        return self._run(key, value, func)
+
+    def _refresh(self, key: str, future: Future, func: Callable[[], Any]) -> None:
+        try:
+            self._run(key, future, func)
+        except Exception as e:
+            logger.warning(f"⚠️ 后台刷新失败: {key} - {e}")
+
+    def _run(self, key: str, future: Future, func: Callable[[], Any]) -> Any:
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def ado(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """异步执行：相同键的并发调用只运行一次func"""
+        with self._lock:
+            state, value = self._lookup(key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            future = self._refresh_future(key)
+            if future is not None:
+                task = asyncio.ensure_future(self._arefresh(key, future, func))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+            return value
+        if state == "join":
+            return await asyncio.wrap_future(value)
+        return await self._arun(key, value, func)
+
+    async def _arefresh(
+        self, key: str, future: Future, func: Callable[[], Awaitable[Any]]
+    ) -> None:
+        try:
+            await self._arun(key, future, func)
+        except Exception as e:
+            logger.warning(f"⚠️ 后台刷新失败: {key} - {e}")
+
+    async def _arun(
+        self, key: str, future: Future, func: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        try:
+            result = await func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """返回实际运行、合并、新鲜命中与过期命中的次数"""
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self) -> None:
+        """清空已完成的结果与统计（不影响进行中的调用）"""
+        with self._lock:
+            self._completed.clear()
+            self._stats = dict.fromkeys(self._stats, 0)
+
+
+_single_flight: Optional[SingleFlight] = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """获取进程级请求合并器（COALESCE_FRESH_SECONDS / COALESCE_STALE_SECONDS 配置复用窗口）"""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            load_environment()
+            _single_flight = SingleFlight(
+                fresh_seconds=float(os.getenv("COALESCE_FRESH_SECONDS", "10")),
+                stale_seconds=float(os.getenv("COALESCE_STALE_SECONDS", "60")),
+            )
+        return _single_flight
+
+
+def set_single_flight(single_flight: SingleFlight) -> None:
+    """替换进程级请求合并器"""
+    global _single_flight
+    with _single_flight_lock:
+        _single_flight = single_flight
+
+
+# 只标识单次调用、不影响分析结果的配置项，不参与合并键
+_RUN_SCOPED_KEYS = {"thread_id", "checkpoint_id", "checkpoint_ns"}
+
+
+def coalesce_key(query: str, config: Optional[RunnableConfig] = None) -> str:
+    """合并键：查询键 + 运行配置（configurable）的稳定哈希，配置不同的请求不会被合并"""
+    configurable = {
+        k: v
+        for k, v in ((config or {}).get("configurable") or {}).items()
+        if k not in _RUN_SCOPED_KEYS and not k.startswith("__")
+    }
+    digest = hashlib.sha256(
+        json.dumps(
+            configurable, sort_keys=True, ensure_ascii=False, default=repr
+        ).encode("utf-8")
+    ).hexdigest()[:16]
+    return f"{query_key(query)}|{digest}"
+
+
+def analyze(query: str, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """运行完整工作流；相同标的+意图+配置的并发请求共享一次运行，返回最终状态"""
+    key = coalesce_key(query, config)
+    result = get_single_flight().do(
+        key, lambda: graph.invoke({"original_query": query}, config)
+    )
+    return dict(result)
+
+
+async def aanalyze(
+    query: str, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """同步 analyze 的异步版本"""
+    key = coalesce_key(query, config)
+    result = await get_single_flight().ado(
+        key, lambda: graph.ainvoke({"original_query": query}, config)
+    )
+    return dict(result)
@@ -0,0 +1,84 @@
+"""可通过 RunnableConfig["configurable"] 调整的运行参数。"""
+
+from dataclasses import dataclass, fields
+from functools import cache
+from typing import Literal, Optional, get_args, get_origin, get_type_hints
+
+from langchain_core.runnables import RunnableConfig
+
+
+@cache
+def load_environment() -> None:
+    """加载.env中的环境变量（每个进程仅执行一次，已存在的环境变量不会被覆盖）"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+@dataclass
+class Configuration:
+    """多Agent工作流的可配置参数"""
+
+    synthesis_token_budget: Optional[int] = 12000
+    """高级综合分析上下文（分析+评议）的token预算，None表示不限制"""
+
+    analysis_quorum: int = 2
+    """进入同行评议所需的最少成功分析数（共3个分析师），不小于1"""
+
+    analyst_timeout_seconds: Optional[float] = None
+    """单个分析师的超时时间（秒），超时视为失败；None表示不限制。
+    异步路径会取消调用；同步路径无法中断进行中的请求，后台线程在下一次模型/工具调用前中止"""
+
+    approval_confidence_threshold: float = 0.8
+    """所有评审人approval且置信度不低于该值时，直接达成共识、跳过修订"""
+
+    prefetch_enabled: bool = True
+    """分析开始前按股票代码并行预取标准工具数据，并注入所有分析师的任务"""
+
+    analysis_mode: Literal["fixed", "planned", "pipelined"] = "fixed"
+    """fixed: 三位分析师固定并行；planned: 先由模型生成分析计划，再按步骤依赖调度执行；
+    pipelined: 三位分析师并行，每份分析完成即开始评审，评议与较慢的分析重叠执行；
+    逐份评审使每轮评审调用由3次增加到6次，以更多调用换取更短时延"""
+
+    max_plan_steps: int = 6
+    """计划模式下允许的最大步骤数（含为缺席分析师补充的默认步骤），不小于3"""
+
+    analyst_revision_enabled: bool = True
+    """同行评议后各分析师按写给自己的改进建议增量修订分析，再进入高级综合"""
+
+    speculative_synthesis: bool = False
+    """同行评议进行的同时起草综合报告，评议完成后只做一次简短修订（首轮评议有效；流水线模式下全部分析完成即起草）"""
+
+    revision_mode: Literal["full", "targeted"] = "full"
+    """未达成共识时的修订方式：full为整轮重新评议；targeted为只让收到改进建议的分析师修订，复用其余评审意见（没有待处理建议时整轮重新评议）"""
+
+    tool_output_format: Literal["text", "compact"] = "text"
+    """工具输出格式：text为多行文本；compact为最小化JSON，减少ReAct后续轮次重复输入的token"""
+
+    def __post_init__(self) -> None:
+        """校验取值范围，拼写错误的模式直接报错而不是静默退回默认行为"""
+        for f in fields(self):
+            hint = get_type_hints(type(self))[f.name]
+            if get_origin(hint) is Literal and getattr(self, f.name) not in get_args(
+                hint
+            ):
+                raise ValueError(
+                    f"{f.name} 必须是 {', '.join(get_args(hint))} 之一，当前为 {getattr(self, f.name)!r}"
+                )
+        if self.analysis_quorum < 1:
+            raise ValueError(
+                f"analysis_quorum 不能小于1，当前为 {self.analysis_quorum}"
+            )
+        if self.max_plan_steps < 3:
+            raise ValueError(
+                f"max_plan_steps 不能小于3（每位分析师至少一个步骤），当前为 {self.max_plan_steps}"
+            )
+
+    @classmethod
+    def from_runnable_config(
+        cls, config: Optional[RunnableConfig] = None
+    ) -> "Configuration":
+        """从RunnableConfig中读取配置，未知字段忽略"""
+        configurable = (config or {}).get("configurable") or {}
+        names = {f.name for f in fields(cls) if f.init}
+        return cls(**{k: v for k, v in configurable.items() if k in names})
@@ -0,0 +1,75 @@
+"""上下文组装：本地token估算与按预算截断。"""
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# DeepSeek官方给出的换算比例：1个中文字符约0.6个token，1个英文字符约0.3个token
+_CJK_TOKENS_PER_CHAR = 0.6
+_OTHER_TOKENS_PER_CHAR = 0.3
+_CJK_PATTERN = re.compile(
+    r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]"
+)
+
+TRUNCATION_MARKER = "…（内容过长，已截断）"
+
+
+def _char_tokens(char: str) -> float:
+    return _CJK_TOKENS_PER_CHAR if _CJK_PATTERN.match(char) else _OTHER_TOKENS_PER_CHAR
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数（不依赖远程tokenizer）"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return int(
+        round(cjk * _CJK_TOKENS_PER_CHAR + (len(text) - cjk) * _OTHER_TOKENS_PER_CHAR)
+    )
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """将文本截断到token预算以内，保留开头部分"""
+    if estimate_tokens(text) <= budget:
+        return text
+    budget -= estimate_tokens(TRUNCATION_MARKER)
+    used = 0.0
+    for index, char in enumerate(text):
+        used += _char_tokens(char)
+        if used > budget:
+            return text[:index].rstrip() + TRUNCATION_MARKER
+    return text
+
+
+def latest_by_label(entries: Sequence[str], labels: Sequence[str]) -> Dict[str, str]:
+    """按 "标签: 内容" 前缀为每个标签选出最新的一条内容"""
+    latest: Dict[str, str] = {}
+    for entry in entries:
+        for label in labels:
+            prefix = f"{label}: "
+            if entry.startswith(prefix):
+                latest[label] = entry[len(prefix) :]
+                break
+    return {label: latest[label] for label in labels if label in latest}
+
+
+def fit_sections(
+    sections: List[Tuple[str, str]], budget: Optional[int]
+) -> List[Tuple[str, str]]:
+    """在总预算内为各段落公平分配token（短段落用不完的份额让给长段落）"""
+    if budget is None:
+        return sections
+    sizes = [estimate_tokens(body) for _, body in sections]
+    if sum(sizes) <= budget:
+        return sections
+
+    allocation = [0] * len(sections)
+    remaining = budget
+    pending = sorted(range(len(sections)), key=lambda i: sizes[i])
+    while pending:
+        share = remaining // len(pending)
+        index = pending.pop(0)
+        allocation[index] = min(sizes[index], share)
+        remaining -= allocation[index]
+
+    return [
+        (title, truncate_to_tokens(body, allocation[i]))
+        for i, (title, body) in enumerate(sections)
+    ]
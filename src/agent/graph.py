@@ -1,53 +1,81 @@
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
-import os
+import asyncio
+import hashlib
+import json
 import logging
-from typing import List, Literal, Optional, Dict, Any, Callable
-from dotenv import load_dotenv
-from pydantic import BaseModel, ValidationError, Field
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime
+from typing import (
+    Annotated,
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
-from langchain_deepseek import ChatDeepSeek
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
-from langgraph.graph import StateGraph, MessagesState, START, END
-from langgraph.types import Command, interrupt
-from langgraph.prebuilt import create_react_agent
-from langchain_tavily import TavilySearch
-from langchain_core.tools import tool, BaseTool
-from langchain_core.runnables import RunnableConfig
-from typing_extensions import TypedDict
-from typing import Annotated
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import (
+    Runnable,
+    RunnableConfig,
+    RunnableLambda,
+    ensure_config,
+)
+from langchain_core.runnables.config import ContextThreadPoolExecutor, merge_configs
+from langchain_core.tools import BaseTool, tool
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt.interrupt import HumanInterrupt, HumanInterruptConfig
+from pydantic import BaseModel, Field, ValidationError
+from typing_extensions import TypedDict
+
+from agent.configuration import Configuration, load_environment
+from agent.context import (
+    estimate_tokens,
+    fit_sections,
+    latest_by_label,
+    truncate_to_tokens,
+)
+from agent.metrics import instrument_node
+from agent.query import extract_ticker
+from agent.tool_cache import cached_tool
 
 # ============= 日志配置 =============
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     handlers=[
-        logging.FileHandler('multi_agent_analysis.log'),
-        logging.StreamHandler()
-    ]
+        logging.FileHandler(
+            "multi_agent_analysis.log", delay=True
+        ),  # 首次写日志时才打开文件
+        logging.StreamHandler(),
+    ],
 )
 logger = logging.getLogger(__name__)
 
-# ============= 环境配置 =============
-load_dotenv()
-model = ChatDeepSeek(model="deepseek-chat", max_tokens=8000)
-
 # ============= 数据模型定义 =============
 
+
 class AgentFeedback(BaseModel):
     """Agent反馈模型"""
+
     agent_name: str = Field(description="评审Agent名称")
     feedback_type: str = Field(description="反馈类型：critique/suggestion/approval")
     feedback_content: str = Field(description="具体反馈内容")
     confidence_score: float = Field(description="置信度分数 0-1")
     suggested_improvements: List[str] = Field(description="改进建议")
+    target_agents: List[str] = Field(default_factory=list, description="被评审的Agent")
+    improvements_by_agent: Dict[str, List[str]] = Field(
+        default_factory=dict, description="按被评审Agent划分的改进建议"
+    )
 
-from typing import Annotated
-from langgraph.graph.message import add_messages
 
 # 自定义的分析结果聚合函数
 def add_analyses(existing: List[str], new: List[str]) -> List[str]:
@@ -58,15 +86,58 @@ def add_analyses(existing: List[str], new: List[str]) -> List[str]:
         new = [new]
     return existing + new
 
+
 # 添加完成状态跟踪
-def add_completion_status(existing: Dict[str, bool], new: Dict[str, bool]) -> Dict[str, bool]:
+def add_completion_status(
+    existing: Dict[str, bool], new: Dict[str, bool]
+) -> Dict[str, bool]:
     """跟踪各Agent完成状态"""
     if existing is None:
         existing = {}
     return {**existing, **new}
 
+
+class CachedReview(BaseModel):
+    """缓存的单个评审人评议结果"""
+
+    review: str
+    feedback: AgentFeedback
+
+
+def merge_review_cache(
+    existing: Dict[str, CachedReview], new: Dict[str, CachedReview]
+) -> Dict[str, CachedReview]:
+    """合并评议缓存"""
+    return {**(existing or {}), **(new or {})}
+
+
+class SynthesisDraft(BaseModel):
+    """推测执行的综合报告草稿及其所依据分析的哈希"""
+
+    report: str
+    analysis_hashes: Dict[str, str]
+
+
+class FinancialAnalysisStep(BaseModel):
+    step_id: str = Field(default="", description="步骤唯一标识，供 depends_on 引用")
+    step: str = Field(description="分析步骤名称")
+    method: str = Field(description="使用的分析方法")
+    data_needed: str = Field(description="此步骤需要的数据")
+    assigned_agent: str = Field(
+        description="负责的Agent: fundamental / technical / risk"
+    )
+    depends_on: List[str] = Field(
+        default_factory=list, description="必须先完成的步骤 step_id 列表"
+    )
+
+
+class FinancialAnalysisPlan(BaseModel):
+    analysis_steps: List[FinancialAnalysisStep]
+
+
 class MultiAgentState(TypedDict):
     """多Agent系统状态"""
+
     messages: Annotated[list, add_messages]
     original_query: Optional[str]
     analyses: Annotated[List[str], add_analyses]  # 改为可聚合的分析列表
@@ -75,125 +146,369 @@ class MultiAgentState(TypedDict):
     consensus_reached: Optional[bool]
     final_report: Optional[str]
     workflow_stage: Optional[str]
-    completion_status: Annotated[Dict[str, bool], add_completion_status]  # 新增完成状态跟踪
-
-class FinancialAnalysisStep(BaseModel):
-    step: str = Field(description="分析步骤名称")
-    method: str = Field(description="使用的分析方法")
-    data_needed: str = Field(description="此步骤需要的数据")
-    assigned_agent: str = Field(description="负责的Agent")
+    completion_status: Annotated[
+        Dict[str, bool], add_completion_status
+    ]  # 新增完成状态跟踪
+    prefetched_data: Optional[
+        Dict[str, str]
+    ]  # 预取的工具数据（工具名 -> 结果），供所有分析师共享
+    analysis_plan: Optional[FinancialAnalysisPlan]  # 计划模式下规划节点生成的分析计划
+    revision_targets: Optional[
+        List[str]
+    ]  # 定向修订模式下需要修订的分析师，None表示整轮重新评议
+    review_cache: Annotated[
+        Dict[str, CachedReview], merge_review_cache
+    ]  # (评审人, 被评审内容哈希) -> 评审结果，线程内复用
+    synthesis_draft: Optional[
+        SynthesisDraft
+    ]  # 推测综合模式下与同行评议并行生成的报告草稿
 
-class FinancialAnalysisPlan(BaseModel):
-    analysis_steps: List[FinancialAnalysisStep]
 
 # ============= 工具定义 =============
+# 数据获取与输出渲染分离：数据按规范化参数缓存（各工具TTL见装饰器），同一次运行中多个Agent重复调用时直接复用；
+# 输出格式由 Configuration.tool_output_format 选择，text为原有的多行文本，compact为最小化JSON（节省提示词token）
 
-@tool
-def get_stock_data(symbol: str, period: str = "1y") -> str:
-    """获取股票基础数据（模拟实现）"""
-    logger.info(f"获取股票数据: {symbol}, 周期: {period}")
-    return f"""
+
+def render_tool_output(
+    data: Dict[str, Any], text_template: str, **text_fields: Any
+) -> str:
+    """按当前运行配置渲染工具输出"""
+    if (
+        Configuration.from_runnable_config(ensure_config()).tool_output_format
+        == "compact"
+    ):
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return text_template.format(**data, **text_fields)
+
+
+STOCK_DATA_TEXT = """
     股票代码: {symbol}
     时间周期: {period}
     
     基础数据:
-    - 当前价格: 125.50
-    - 市值: 500亿
-    - P/E比率: 18.5
-    - P/B比率: 2.3
-    - ROE: 15.2%
-    - 52周高点: 145.20
-    - 52周低点: 98.30
+    - 当前价格: {price}
+    - 市值: {market_cap}
+    - P/E比率: {pe}
+    - P/B比率: {pb}
+    - ROE: {roe}
+    - 52周高点: {high_52w}
+    - 52周低点: {low_52w}
     
     近期表现:
-    - 日涨跌幅: +2.1%
-    - 周涨跌幅: +5.3%
-    - 月涨跌幅: +12.8%
+    - 日涨跌幅: {change_1d}
+    - 周涨跌幅: {change_1w}
+    - 月涨跌幅: {change_1m}
     """
 
+
+@cached_tool(ttl=60)
+def fetch_stock_data(symbol: str, period: str = "1y") -> Dict[str, Any]:
+    """获取股票基础数据（模拟实现）"""
+    logger.info(f"获取股票数据: {symbol}, 周期: {period}")
+    return {
+        "symbol": symbol,
+        "period": period,
+        "price": "125.50",
+        "market_cap": "500亿",
+        "pe": "18.5",
+        "pb": "2.3",
+        "roe": "15.2%",
+        "high_52w": "145.20",
+        "low_52w": "98.30",
+        "change_1d": "+2.1%",
+        "change_1w": "+5.3%",
+        "change_1m": "+12.8%",
+    }
+
+
 @tool
-def get_financial_news(keyword: str, days: int = 7) -> str:
-    """获取金融新闻信息（模拟实现）"""
-    logger.info(f"获取金融新闻: {keyword}, 天数: {days}")
-    return f"""
+def get_stock_data(symbol: str, period: str = "1y") -> str:
+    """获取股票基础数据（模拟实现）"""
+    return render_tool_output(fetch_stock_data(symbol, period), STOCK_DATA_TEXT)
+
+
+FINANCIAL_NEWS_TEXT = """
     关键词: {keyword}
     时间范围: 最近{days}天
     
     主要新闻:
-    1. 公司发布Q3财报，营收同比增长15%
-    2. 获得重要政府订单，总价值约10亿元
-    3. 董事会批准股份回购计划
-    4. 分析师上调目标价至150元
-    5. 行业政策利好，相关板块普涨
+    {headline_lines}
     """
 
+
+@cached_tool(ttl=600)
+def fetch_financial_news(keyword: str, days: int = 7) -> Dict[str, Any]:
+    """获取金融新闻信息（模拟实现）"""
+    logger.info(f"获取金融新闻: {keyword}, 天数: {days}")
+    return {
+        "keyword": keyword,
+        "days": days,
+        "headlines": [
+            "公司发布Q3财报，营收同比增长15%",
+            "获得重要政府订单，总价值约10亿元",
+            "董事会批准股份回购计划",
+            "分析师上调目标价至150元",
+            "行业政策利好，相关板块普涨",
+        ],
+    }
+
+
 @tool
-def technical_analysis(symbol: str, indicator: str = "MA") -> str:
-    """技术分析工具（模拟实现）"""
-    logger.info(f"技术分析: {symbol}, 指标: {indicator}")
-    return f"""
+def get_financial_news(keyword: str, days: int = 7) -> str:
+    """获取金融新闻信息（模拟实现）"""
+    data = fetch_financial_news(keyword, days)
+    headline_lines = "\n    ".join(
+        f"{i}. {headline}" for i, headline in enumerate(data["headlines"], 1)
+    )
+    return render_tool_output(data, FINANCIAL_NEWS_TEXT, headline_lines=headline_lines)
+
+
+TECHNICAL_ANALYSIS_TEXT = """
     技术指标分析 - {symbol}
     指标类型: {indicator}
     
     移动平均线:
-    - MA5: 123.45 (支撑位)
-    - MA20: 118.20 (强支撑)
-    - MA60: 115.80 (长期趋势线)
+    - MA5: {ma5} (支撑位)
+    - MA20: {ma20} (强支撑)
+    - MA60: {ma60} (长期趋势线)
     
     技术信号:
-    - MACD: 金叉信号，多头排列
-    - RSI: 65 (略偏强势区域)
-    - 成交量: 较前期放大30%
+    - MACD: {macd}
+    - RSI: {rsi} ({rsi_zone})
+    - 成交量: {volume}
     
     关键价位:
-    - 支撑位: 120.00
-    - 阻力位: 130.00
+    - 支撑位: {support}
+    - 阻力位: {resistance}
     """
 
+
+@cached_tool(ttl=300)
+def fetch_technical_analysis(symbol: str, indicator: str = "MA") -> Dict[str, Any]:
+    """技术分析工具（模拟实现）"""
+    logger.info(f"技术分析: {symbol}, 指标: {indicator}")
+    return {
+        "symbol": symbol,
+        "indicator": indicator,
+        "ma5": "123.45",
+        "ma20": "118.20",
+        "ma60": "115.80",
+        "macd": "金叉信号，多头排列",
+        "rsi": "65",
+        "rsi_zone": "略偏强势区域",
+        "volume": "较前期放大30%",
+        "support": "120.00",
+        "resistance": "130.00",
+    }
+
+
 @tool
-def portfolio_optimization(assets: str, risk_level: str = "medium") -> str:
-    """投资组合优化分析"""
-    logger.info(f"组合优化分析: {assets}, 风险水平: {risk_level}")
-    return f"""
+def technical_analysis(symbol: str, indicator: str = "MA") -> str:
+    """技术分析工具（模拟实现）"""
+    return render_tool_output(
+        fetch_technical_analysis(symbol, indicator), TECHNICAL_ANALYSIS_TEXT
+    )
+
+
+PORTFOLIO_OPTIMIZATION_TEXT = """
     投资组合优化结果:
     资产类别: {assets}
     风险水平: {risk_level}
     
     建议配置:
-    - 股票: 60% (蓝筹股40% + 成长股20%)
-    - 债券: 30% (政府债券20% + 企业债10%)  
-    - 现金: 10%
+    - 股票: {stocks}
+    - 债券: {bonds}
+    - 现金: {cash}
     
-    预期收益: 8-12%
-    最大回撤: 15%
-    夏普比率: 1.2
+    预期收益: {expected_return}
+    最大回撤: {max_drawdown}
+    夏普比率: {sharpe}
     """
 
+
+@cached_tool(ttl=3600)
+def fetch_portfolio_optimization(
+    assets: str, risk_level: str = "medium"
+) -> Dict[str, Any]:
+    """投资组合优化分析"""
+    logger.info(f"组合优化分析: {assets}, 风险水平: {risk_level}")
+    return {
+        "assets": assets,
+        "risk_level": risk_level,
+        "stocks": "60% (蓝筹股40% + 成长股20%)",
+        "bonds": "30% (政府债券20% + 企业债10%)",
+        "cash": "10%",
+        "expected_return": "8-12%",
+        "max_drawdown": "15%",
+        "sharpe": "1.2",
+    }
+
+
 @tool
-def risk_assessment(position_size: str, market_cap: str) -> str:
-    """风险评估工具"""
-    logger.info(f"风险评估: 持仓规模={position_size}, 市值={market_cap}")
-    return f"""
+def portfolio_optimization(assets: str, risk_level: str = "medium") -> str:
+    """投资组合优化分析"""
+    return render_tool_output(
+        fetch_portfolio_optimization(assets, risk_level), PORTFOLIO_OPTIMIZATION_TEXT
+    )
+
+
+RISK_ASSESSMENT_TEXT = """
     风险评估报告:
     持仓规模: {position_size}
     市值规模: {market_cap}
     
     风险指标:
-    - VaR (95%): 单日最大损失2.5%
-    - Beta系数: 1.2 (高于市场)
-    - 流动性风险: 低
-    - 信用风险: 中等
-    - 行业集中度: 偏高
+    - VaR (95%): 单日最大损失{var_95}
+    - Beta系数: {beta}
+    - 流动性风险: {liquidity_risk}
+    - 信用风险: {credit_risk}
+    - 行业集中度: {concentration}
     
-    风险建议: 适当分散投资，控制单一持仓比例
+    风险建议: {advice}
     """
 
+
+@cached_tool(ttl=3600)
+def fetch_risk_assessment(position_size: str, market_cap: str) -> Dict[str, Any]:
+    """风险评估工具"""
+    logger.info(f"风险评估: 持仓规模={position_size}, 市值={market_cap}")
+    return {
+        "position_size": position_size,
+        "market_cap": market_cap,
+        "var_95": "2.5%",
+        "beta": "1.2 (高于市场)",
+        "liquidity_risk": "低",
+        "credit_risk": "中等",
+        "concentration": "偏高",
+        "advice": "适当分散投资，控制单一持仓比例",
+    }
+
+
+@tool
+def risk_assessment(position_size: str, market_cap: str) -> str:
+    """风险评估工具"""
+    return render_tool_output(
+        fetch_risk_assessment(position_size, market_cap), RISK_ASSESSMENT_TEXT
+    )
+
+
 # ============= 多Agent定义 =============
 
-# 搜索工具
-search_tool = TavilySearch(max_results=5, topic="general")
-basic_tools = [get_stock_data, get_financial_news, technical_analysis, search_tool]
-advanced_tools = basic_tools + [portfolio_optimization, risk_assessment]
+# 模型、搜索工具和Agent均在首次使用时创建并在进程内复用：
+# 导入本模块不会读取.env、不要求API Key，也不会加载deepseek/tavily等重量级依赖
+_components: Dict[str, Any] = {}
+_components_lock = threading.RLock()
+
+
+def _get_or_create(name: str, factory: Callable[[], Any]) -> Any:
+    """获取已创建的组件，不存在时调用factory创建（线程安全）"""
+    with _components_lock:
+        if name not in _components:
+            _components[name] = factory()
+        return _components[name]
+
+
+def override_components(**components: Any) -> None:
+    """预置组件实例（如测试和基准中使用模拟模型），可选键见各get_*函数"""
+    with _components_lock:
+        _components.update(components)
+
+
+def reset_components() -> None:
+    """清空已创建的组件，下次使用时重新创建"""
+    with _components_lock:
+        _components.clear()
+
+
+def _create_model() -> BaseChatModel:
+    from agent.cassette import CassetteChatModel, get_cassette
+    from agent.llm_cache import create_llm_cache_from_env
+    from agent.rate_limit import GovernedChatModel, get_governor
+
+    load_environment()
+    # 回放录像时不创建真实模型，也不需要DeepSeek API Key
+    cassette = get_cassette()
+    if cassette is not None and cassette.mode == "replay":
+        return GovernedChatModel(
+            inner=CassetteChatModel(cassette=cassette), governor=get_governor()
+        )
+
+    from langchain_deepseek import ChatDeepSeek
+
+    inner: BaseChatModel = ChatDeepSeek(model="deepseek-chat", max_tokens=8000)
+    if cassette is not None:
+        # 录制时不使用响应缓存，保证每个请求都真实调用并写入录像
+        return GovernedChatModel(
+            inner=CassetteChatModel(cassette=cassette, inner=inner),
+            governor=get_governor(),
+        )
+    # 所有Agent共享进程级限流器；缓存挂在外层，命中缓存的请求不占用限流额度
+    # 设置 LLM_CACHE_PATH 后启用磁盘响应缓存，相同请求（模型参数+消息+工具schema）直接复用
+    return GovernedChatModel(
+        inner=inner,
+        governor=get_governor(),
+        cache=create_llm_cache_from_env(),
+    )
+
+
+def get_model() -> BaseChatModel:
+    """获取共享的聊天模型（键: model）"""
+    return _get_or_create("model", _create_model)
+
+
+SEARCH_TOOL_NAME = "tavily_search"
+
+
+def _create_search_tool() -> BaseTool:
+    from agent.cassette import cassette_tool, get_cassette, replay_tool
+
+    load_environment()
+    cassette = get_cassette()
+    if cassette is not None and cassette.mode == "replay":
+        return replay_tool(cassette, SEARCH_TOOL_NAME)
+
+    from langchain_tavily import TavilySearch
+
+    search_tool = TavilySearch(max_results=5, topic="general")
+    return cassette_tool(cassette, search_tool) if cassette is not None else search_tool
+
+
+def get_search_tool() -> BaseTool:
+    """获取搜索工具（键: search_tool）"""
+    return _get_or_create("search_tool", _create_search_tool)
+
+
+def _with_cassette(tools: List[BaseTool]) -> List[BaseTool]:
+    """启用录像时录制/回放本地工具的调用"""
+    from agent.cassette import cassette_tool, get_cassette
+
+    cassette = get_cassette()
+    return (
+        [cassette_tool(cassette, t) for t in tools] if cassette is not None else tools
+    )
+
+
+def get_basic_tools() -> List[BaseTool]:
+    """获取基础工具集（键: basic_tools）"""
+    return _get_or_create(
+        "basic_tools",
+        lambda: (
+            _with_cassette([get_stock_data, get_financial_news, technical_analysis])
+            + [get_search_tool()]
+        ),
+    )
+
+
+def get_advanced_tools() -> List[BaseTool]:
+    """获取高级工具集（键: advanced_tools）"""
+    return _get_or_create(
+        "advanced_tools",
+        lambda: (
+            get_basic_tools()
+            + _with_cassette([portfolio_optimization, risk_assessment])
+        ),
+    )
+
 
 # Agent 1: 基本面分析专家
 FUNDAMENTAL_ANALYST_PROMPT = """
@@ -214,11 +529,6 @@ FUNDAMENTAL_ANALYST_PROMPT = """
 请基于获取的数据进行专业的基本面分析，输出格式要求清晰美观，包含明确的分析结论。
 """
 
-fundamental_agent = create_react_agent(
-    model=model,
-    prompt=FUNDAMENTAL_ANALYST_PROMPT,
-    tools=basic_tools,
-)
 
 # Agent 2: 技术分析专家
 TECHNICAL_ANALYST_PROMPT = """
@@ -240,11 +550,6 @@ TECHNICAL_ANALYST_PROMPT = """
 请基于技术指标提供专业的技术面分析，输出格式要求清晰美观，包含明确的操作建议。
 """
 
-technical_agent = create_react_agent(
-    model=model,
-    prompt=TECHNICAL_ANALYST_PROMPT,
-    tools=basic_tools,
-)
 
 # Agent 3: 风险管理专家
 RISK_ANALYST_PROMPT = """
@@ -266,11 +571,6 @@ RISK_ANALYST_PROMPT = """
 请基于风险管理理论提供专业的风险分析，输出格式要求清晰美观，包含具体的风险控制措施。
 """
 
-risk_agent = create_react_agent(
-    model=model,
-    prompt=RISK_ANALYST_PROMPT,
-    tools=advanced_tools,
-)
 
 # Agent 4: 高级综合分析师（负责综合和质量控制）
 SENIOR_ANALYST_PROMPT = """
@@ -291,19 +591,35 @@ SENIOR_ANALYST_PROMPT = """
 请基于专业经验对其他分析师的工作进行评审和综合，输出格式要求专业美观，包含明确的投资评级。
 """
 
-senior_agent = create_react_agent(
-    model=model,
-    prompt=SENIOR_ANALYST_PROMPT,
-    tools=advanced_tools,
-)
+
+_AGENT_DEFINITIONS: Dict[str, Any] = {
+    "fundamental": (FUNDAMENTAL_ANALYST_PROMPT, get_basic_tools),
+    "technical": (TECHNICAL_ANALYST_PROMPT, get_basic_tools),
+    "risk": (RISK_ANALYST_PROMPT, get_advanced_tools),
+    "senior": (SENIOR_ANALYST_PROMPT, get_advanced_tools),
+}
+
+
+def _create_agent(agent_key: str) -> Runnable:
+    from langgraph.prebuilt import create_react_agent
+
+    prompt, get_tools = _AGENT_DEFINITIONS[agent_key]
+    return create_react_agent(model=get_model(), prompt=prompt, tools=get_tools())
+
+
+def get_agent(agent_key: str) -> Runnable:
+    """按名称获取Agent实例：fundamental/technical/risk/senior（键: <名称>_agent）"""
+    return _get_or_create(f"{agent_key}_agent", lambda: _create_agent(agent_key))
+
 
 # ============= 输出格式化工具 =============
 
+
 def format_analysis_output(title: str, content: str, agent_name: str) -> str:
     """格式化分析输出，使其更美观"""
     separator = "=" * 60
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
+
     formatted_content = f"""
 {separator}
 📊 {title}
@@ -317,11 +633,12 @@ def format_analysis_output(title: str, content: str, agent_name: str) -> str:
 """
     return formatted_content
 
+
 def format_review_output(reviews: List[str]) -> str:
     """格式化评审输出"""
     separator = "=" * 60
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
+
     formatted_content = f"""
 {separator}
 🔍 同行评议阶段
@@ -329,18 +646,19 @@ def format_review_output(reviews: List[str]) -> str:
 {separator}
 
 """
-    
+
     for i, review in enumerate(reviews, 1):
         formatted_content += f"📝 评议 {i}:\n{review}\n\n"
-    
+
     formatted_content += f"{separator}\n"
     return formatted_content
 
+
 def format_final_report(content: str) -> str:
     """格式化最终报告"""
     separator = "=" * 80
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
+
     formatted_content = f"""
 {separator}
 🎯 最终综合投资分析报告
@@ -356,8 +674,10 @@ def format_final_report(content: str) -> str:
 """
     return formatted_content
 
+
 # ============= 多Agent节点函数 =============
 
+
 def coordinator_node(state: MultiAgentState) -> Dict[str, Any]:
     """协调器节点 - 分配任务给各专业Agent"""
     # 从消息中提取用户查询
@@ -366,302 +686,1470 @@ def coordinator_node(state: MultiAgentState) -> Dict[str, Any]:
         user_query = state["original_query"]
     elif state.get("messages") and len(state["messages"]) > 0:
         user_query = state["messages"][0].content
-    
+
     logger.info(f"🚀 协调器启动 - 开始多Agent协作分析任务: {user_query}")
-    
+
     start_message = format_analysis_output(
         "多Agent协作分析启动",
         f"任务内容：{user_query}\n正在调度基本面分析师、技术分析师、风险分析师进行并行分析...",
-        "系统协调器"
+        "系统协调器",
     )
-    
+
     return {
         "messages": [AIMessage(content=start_message)],
         "original_query": user_query,
         "workflow_stage": "coordination_started",
-        "completion_status": {}  # 初始化完成状态
+        "completion_status": {},  # 初始化完成状态
     }
 
-def fundamental_analysis_node(state: MultiAgentState) -> Dict[str, Any]:
-    """基本面分析节点"""
-    # 安全获取查询内容
-    query = state.get("original_query", "")
-    if not query and state.get("messages"):
-        query = state["messages"][0].content
-    
-    logger.info("📊 基本面分析师开始工作")
-    
-    task = f"请对以下投资标的进行深入的基本面分析: {query}"
-    
+
+# ============= 数据预取 =============
+
+
+class PrefetchSpec(NamedTuple):
+    """预取的标准工具调用"""
+
+    tool_name: str
+    argument: str
+    title: str
+
+
+# 三个分析师都会用到的标准数据，在分析开始前按股票代码并行获取一次
+PREFETCH_SPECS: List[PrefetchSpec] = [
+    PrefetchSpec("get_stock_data", "symbol", "股票基础数据"),
+    PrefetchSpec("get_financial_news", "keyword", "近期金融新闻"),
+    PrefetchSpec("technical_analysis", "symbol", "技术指标"),
+]
+PREFETCH_TOKEN_BUDGET = 1500  # 每项预取数据注入提示词的token上限
+
+
+def _prefetch_calls(
+    state: MultiAgentState, config: Optional[RunnableConfig]
+) -> List[Tuple[PrefetchSpec, BaseTool, Dict[str, Any]]]:
+    """确定需要预取的工具调用：未启用、没有识别出股票代码或工具不可用时跳过"""
+    if not Configuration.from_runnable_config(config).prefetch_enabled:
+        return []
+    ticker = extract_ticker(_get_query(state))
+    if ticker is None:
+        logger.info("ℹ️ 未识别出股票代码，跳过数据预取")
+        return []
+    tools = {t.name: t for t in get_advanced_tools()}
+    return [
+        (spec, tools[spec.tool_name], {spec.argument: ticker})
+        for spec in PREFETCH_SPECS
+        if spec.tool_name in tools
+    ]
+
+
+def _prefetch_result(outputs: List[Tuple[PrefetchSpec, Any]]) -> Dict[str, Any]:
+    """构造预取完成时的状态更新，失败的工具调用不写入（分析师仍可自行调用）"""
+    prefetched = {}
+    for spec, output in outputs:
+        if isinstance(output, Exception):
+            logger.warning(f"⚠️ 预取{spec.title}失败: {output}")
+        else:
+            prefetched[spec.tool_name] = str(output)
+    if prefetched:
+        logger.info(f"📦 已预取 {len(prefetched)} 项数据: {', '.join(prefetched)}")
+    return {"prefetched_data": prefetched}
+
+
+def _safe_invoke(fetch_tool: BaseTool, args: Dict[str, Any]) -> Any:
     try:
-        result = fundamental_agent.invoke({"messages": [HumanMessage(content=task)]})
-        analysis_content = result["messages"][-1].content
-        
-        formatted_output = format_analysis_output(
-            "基本面分析报告",
-            analysis_content,
-            "基本面分析专家"
-        )
-        
-        logger.info("✅ 基本面分析完成")
-        
-        return {
-            "messages": [AIMessage(content=formatted_output)],
-            "analyses": [f"基本面分析: {analysis_content}"],
-            "completion_status": {"fundamental": True}
-        }
-        
+        return fetch_tool.invoke(args)
     except Exception as e:
-        logger.error(f"❌ 基本面分析失败: {e}")
-        error_msg = format_analysis_output(
-            "基本面分析报告",
-            f"分析过程中出现错误: {str(e)}",
-            "基本面分析专家"
-        )
-        return {
-            "messages": [AIMessage(content=error_msg)],
-            "analyses": [f"基本面分析: 分析失败 - {str(e)}"],
-            "completion_status": {"fundamental": False}
-        }
+        return e
+
+
+def prefetch_data_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """数据预取节点 - 并行获取所有分析师共用的标准数据"""
+    calls = _prefetch_calls(state, config)
+    if not calls:
+        return {"prefetched_data": {}}
+    with ContextThreadPoolExecutor(max_workers=len(calls)) as executor:
+        outputs = list(executor.map(lambda call: _safe_invoke(call[1], call[2]), calls))
+    return _prefetch_result(
+        [(spec, output) for (spec, _, _), output in zip(calls, outputs)]
+    )
 
-def technical_analysis_node(state: MultiAgentState) -> Dict[str, Any]:
-    """技术分析节点"""
-    # 安全获取查询内容
+
+async def aprefetch_data_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """数据预取节点（异步）"""
+    calls = _prefetch_calls(state, config)
+    if not calls:
+        return {"prefetched_data": {}}
+    outputs = await asyncio.gather(
+        *(fetch_tool.ainvoke(args) for _, fetch_tool, args in calls),
+        return_exceptions=True,
+    )
+    return _prefetch_result(
+        [(spec, output) for (spec, _, _), output in zip(calls, outputs)]
+    )
+
+
+def _prefetch_context(state: MultiAgentState) -> str:
+    """将预取数据格式化为分析任务的附加上下文"""
+    prefetched = state.get("prefetched_data") or {}
+    titles = {spec.tool_name: spec.title for spec in PREFETCH_SPECS}
+    sections = [
+        f"【{titles.get(name, name)}】（{name}）\n{truncate_to_tokens(output.strip(), PREFETCH_TOKEN_BUDGET)}"
+        for name, output in prefetched.items()
+    ]
+    if not sections:
+        return ""
+    return (
+        "\n\n以下数据已由系统预先获取，请直接使用，无需再次调用对应工具：\n\n"
+        + "\n\n".join(sections)
+    )
+
+
+class AnalystSpec(NamedTuple):
+    """专业分析师节点配置"""
+
+    agent_key: str
+    task_template: str
+    report_title: str
+    agent_name: str
+    analysis_label: str
+    start_log: str
+    done_log: str
+
+
+ANALYST_SPECS: Dict[str, AnalystSpec] = {
+    "fundamental": AnalystSpec(
+        agent_key="fundamental",
+        task_template="请对以下投资标的进行深入的基本面分析: {query}",
+        report_title="基本面分析报告",
+        agent_name="基本面分析专家",
+        analysis_label="基本面分析",
+        start_log="📊 基本面分析师开始工作",
+        done_log="✅ 基本面分析完成",
+    ),
+    "technical": AnalystSpec(
+        agent_key="technical",
+        task_template="请对以下投资标的进行专业的技术面分析: {query}",
+        report_title="技术分析报告",
+        agent_name="技术分析专家",
+        analysis_label="技术分析",
+        start_log="📈 技术分析师开始工作",
+        done_log="✅ 技术分析完成",
+    ),
+    "risk": AnalystSpec(
+        agent_key="risk",
+        task_template="请对以下投资标的进行全面的风险评估: {query}",
+        report_title="风险评估报告",
+        agent_name="风险管理专家",
+        analysis_label="风险分析",
+        start_log="⚠️ 风险分析师开始工作",
+        done_log="✅ 风险分析完成",
+    ),
+}
+
+
+def _get_query(state: MultiAgentState) -> str:
+    """安全获取查询内容"""
     query = state.get("original_query", "")
     if not query and state.get("messages"):
         query = state["messages"][0].content
-    
-    logger.info("📈 技术分析师开始工作")
-    
-    task = f"请对以下投资标的进行专业的技术面分析: {query}"
-    
+    return query
+
+
+def _analysis_success(analyst: str, analysis_content: str) -> Dict[str, Any]:
+    """构造分析成功时的状态更新"""
+    spec = ANALYST_SPECS[analyst]
+    formatted_output = format_analysis_output(
+        spec.report_title, analysis_content, spec.agent_name
+    )
+    logger.info(spec.done_log)
+    return {
+        "messages": [AIMessage(content=formatted_output)],
+        "analyses": [f"{spec.analysis_label}: {analysis_content}"],
+        "completion_status": {analyst: True},
+    }
+
+
+def _analysis_failure(analyst: str, e: Exception) -> Dict[str, Any]:
+    """构造分析失败时的状态更新"""
+    spec = ANALYST_SPECS[analyst]
+    logger.error(f"❌ {spec.analysis_label}失败: {e}")
+    error_msg = format_analysis_output(
+        spec.report_title, f"分析过程中出现错误: {str(e)}", spec.agent_name
+    )
+    return {
+        "messages": [AIMessage(content=error_msg)],
+        "analyses": [f"{spec.analysis_label}: 分析失败 - {str(e)}"],
+        "completion_status": {analyst: False},
+    }
+
+
+class _CancelOnTimeout(BaseCallbackHandler):
+    """同步超时后中止后台线程中的Agent：在下一次模型或工具调用开始时抛出异常（进行中的单次请求无法中断）"""
+
+    raise_error = True
+
+    def __init__(self) -> None:
+        self.cancelled = threading.Event()
+
+    def _check(self, *args: Any, **kwargs: Any) -> None:
+        if self.cancelled.is_set():
+            raise TimeoutError("调用已超时取消")
+
+    on_llm_start = on_chat_model_start = on_tool_start = _check
+
+
+def _invoke_with_timeout(
+    runnable: Runnable, payload: Dict[str, Any], timeout: Optional[float]
+) -> Any:
+    """同步调用Runnable，超时后不再等待，并让后台线程在下一次模型/工具调用前中止，避免继续消耗token与限流额度"""
+    if timeout is None:
+        return runnable.invoke(payload)
+    cancel = _CancelOnTimeout()
+    config = merge_configs(ensure_config(), {"callbacks": [cancel]})
+    executor = ContextThreadPoolExecutor(max_workers=1)
     try:
-        result = technical_agent.invoke({"messages": [HumanMessage(content=task)]})
-        analysis_content = result["messages"][-1].content
-        
-        formatted_output = format_analysis_output(
-            "技术分析报告",
-            analysis_content,
-            "技术分析专家"
+        return executor.submit(runnable.invoke, payload, config).result(timeout=timeout)
+    except FuturesTimeoutError:
+        cancel.cancelled.set()
+        logger.warning(
+            f"⏱️ 调用超过{timeout}秒，已放弃等待；进行中的请求结束后后台线程将中止，不再发起新的模型/工具调用"
         )
-        
-        logger.info("✅ 技术分析完成")
-        
-        return {
-            "messages": [AIMessage(content=formatted_output)],
-            "analyses": [f"技术分析: {analysis_content}"],
-            "completion_status": {"technical": True}
-        }
-        
+        raise TimeoutError(f"超过{timeout}秒未完成") from None
+    finally:
+        executor.shutdown(wait=False)
+
+
+async def _ainvoke_with_timeout(
+    runnable: Runnable, payload: Dict[str, Any], timeout: Optional[float]
+) -> Any:
+    """异步调用Runnable，超时后取消任务（进行中的请求随之中断）"""
+    try:
+        return await asyncio.wait_for(runnable.ainvoke(payload), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"超过{timeout}秒未完成") from None
+
+
+def _run_analyst(
+    analyst: str, state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """执行专业分析（同步）"""
+    spec = ANALYST_SPECS[analyst]
+    logger.info(spec.start_log)
+    task = spec.task_template.format(query=_get_query(state)) + _prefetch_context(state)
+    timeout = Configuration.from_runnable_config(config).analyst_timeout_seconds
+    try:
+        result = _invoke_with_timeout(
+            get_agent(spec.agent_key),
+            {"messages": [HumanMessage(content=task)]},
+            timeout,
+        )
+        return _analysis_success(analyst, result["messages"][-1].content)
     except Exception as e:
-        logger.error(f"❌ 技术分析失败: {e}")
-        error_msg = format_analysis_output(
-            "技术分析报告",
-            f"分析过程中出现错误: {str(e)}",
-            "技术分析专家"
+        return _analysis_failure(analyst, e)
+
+
+async def _arun_analyst(
+    analyst: str, state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """执行专业分析（异步），不占用工作线程"""
+    spec = ANALYST_SPECS[analyst]
+    logger.info(spec.start_log)
+    task = spec.task_template.format(query=_get_query(state)) + _prefetch_context(state)
+    timeout = Configuration.from_runnable_config(config).analyst_timeout_seconds
+    try:
+        result = await _ainvoke_with_timeout(
+            get_agent(spec.agent_key),
+            {"messages": [HumanMessage(content=task)]},
+            timeout,
         )
-        return {
-            "messages": [AIMessage(content=error_msg)],
-            "analyses": [f"技术分析: 分析失败 - {str(e)}"],
-            "completion_status": {"technical": False}
-        }
+        return _analysis_success(analyst, result["messages"][-1].content)
+    except Exception as e:
+        return _analysis_failure(analyst, e)
+
+
+def fundamental_analysis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """基本面分析节点"""
+    return _run_analyst("fundamental", state, config)
 
-def risk_analysis_node(state: MultiAgentState) -> Dict[str, Any]:
+
+async def afundamental_analysis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """基本面分析节点（异步）"""
+    return await _arun_analyst("fundamental", state, config)
+
+
+def technical_analysis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """技术分析节点"""
+    return _run_analyst("technical", state, config)
+
+
+async def atechnical_analysis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """技术分析节点（异步）"""
+    return await _arun_analyst("technical", state, config)
+
+
+def risk_analysis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
     """风险分析节点"""
-    # 安全获取查询内容
-    query = state.get("original_query", "")
-    if not query and state.get("messages"):
-        query = state["messages"][0].content
-    
-    logger.info("⚠️ 风险分析师开始工作")
-    
-    task = f"请对以下投资标的进行全面的风险评估: {query}"
-    
+    return _run_analyst("risk", state, config)
+
+
+async def arisk_analysis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """风险分析节点（异步）"""
+    return await _arun_analyst("risk", state, config)
+
+
+# ============= 单个分析师重跑 =============
+# 分析完成后单独重跑某位分析师：保留其余分析师的结果，以汇聚节点身份写回检查点，
+# 之后只需继续运行同行评议及其下游节点（见 agent.checkpoint.rerun_analyst）
+
+RERUN_AS_NODE = "wait_for_analyses"
+
+
+def _rerun_update(
+    state: MultiAgentState, update: Dict[str, Any], config: Optional[RunnableConfig]
+) -> Dict[str, Any]:
+    """合并重跑结果并重新判定法定数量，共识轮次从头开始"""
+    merged: Dict[str, Any] = {
+        **state,
+        "analyses": add_analyses(state.get("analyses"), update["analyses"]),
+        "completion_status": add_completion_status(
+            state.get("completion_status"), update["completion_status"]
+        ),
+    }
+    barrier = wait_for_analyses_node(merged, config)
+    return {
+        **update,
+        **barrier,
+        "messages": update["messages"] + barrier.get("messages", []),
+        "agent_feedbacks": None,  # 旧评议不针对重跑后的分析，清空后重新评议
+        "revision_count": 0,
+        "consensus_reached": False,
+    }
+
+
+def rerun_analyst_update(
+    state: MultiAgentState, analyst: str, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """重新执行单个分析师，返回以汇聚节点身份写入的状态更新"""
+    if analyst not in ANALYST_SPECS:
+        raise ValueError(f"未知的分析师: {analyst}，可选: {', '.join(ANALYST_SPECS)}")
+    return _rerun_update(state, _run_analyst(analyst, state, config), config)
+
+
+async def arerun_analyst_update(
+    state: MultiAgentState, analyst: str, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """rerun_analyst_update 的异步版本"""
+    if analyst not in ANALYST_SPECS:
+        raise ValueError(f"未知的分析师: {analyst}，可选: {', '.join(ANALYST_SPECS)}")
+    return _rerun_update(state, await _arun_analyst(analyst, state, config), config)
+
+
+# ============= 计划驱动的分析执行 =============
+
+PLANNER_PROMPT = """你是投资研究团队的协调者，请为下面的分析请求制定分析计划。
+
+可分配的分析师（assigned_agent 只能取以下值）:
+- fundamental: 基本面分析专家（财务、估值、行业竞争）
+- technical: 技术分析专家（价格走势、技术指标、量价关系）
+- risk: 风险管理专家（波动、回撤、组合风险与对冲）
+
+要求:
+1. 每个步骤给出唯一的 step_id，以及步骤名称、分析方法、所需数据和负责的分析师
+2. 只有确实需要前一步骤结论的步骤才填写 depends_on，其余步骤保持独立以便并行执行
+3. 步骤总数不超过{max_steps}个，每位分析师至少负责一个步骤
+
+分析请求: {query}"""
+
+PLAN_STEP_TOKEN_BUDGET = 1500  # 每个前置步骤结果注入提示词的token上限
+
+
+def default_analysis_plan() -> FinancialAnalysisPlan:
+    """默认计划：三位分析师各一个相互独立的步骤（与固定扇出等价）"""
+    return FinancialAnalysisPlan(
+        analysis_steps=[
+            FinancialAnalysisStep(
+                step_id=key,
+                step=spec.report_title,
+                method=spec.task_template.split("{query}")[0].rstrip(": "),
+                data_needed="行情数据、近期新闻与技术指标",
+                assigned_agent=key,
+            )
+            for key, spec in ANALYST_SPECS.items()
+        ]
+    )
+
+
+def _normalize_agent(name: str) -> Optional[str]:
+    """将计划中的负责人映射为分析师键（兼容中文名称）"""
+    name = name.strip()
+    for key, spec in ANALYST_SPECS.items():
+        if (
+            name.lower() == key
+            or name in (spec.agent_name, spec.analysis_label)
+            or name.startswith(spec.analysis_label[:2])
+        ):
+            return key
+    return None
+
+
+def _fit_plan_steps(
+    steps: List[FinancialAnalysisStep], max_steps: Optional[int]
+) -> List[FinancialAnalysisStep]:
+    """补全默认步骤后仍不超过步骤上限：保留每位分析师的首个步骤，其余按原顺序填满，并丢弃指向被删步骤的依赖"""
+    if max_steps is None or len(steps) <= max_steps:
+        return steps
+    first_steps: Dict[str, int] = {}
+    for index, step in enumerate(steps):
+        first_steps.setdefault(step.assigned_agent, index)
+    keep = set(first_steps.values())
+    for index in range(len(steps)):
+        if len(keep) >= max(max_steps, len(ANALYST_SPECS)):
+            break
+        keep.add(index)
+    kept = [steps[index] for index in sorted(keep)]
+    logger.warning(
+        f"⚠️ 分析计划超出步骤上限({len(steps)}/{max_steps})，已截断为{len(kept)}步"
+    )
+    ids = {step.step_id for step in kept}
+    return [
+        step.model_copy(update={"depends_on": [d for d in step.depends_on if d in ids]})
+        for step in kept
+    ]
+
+
+def validate_analysis_plan(
+    plan: FinancialAnalysisPlan, max_steps: Optional[int] = None
+) -> FinancialAnalysisPlan:
+    """修正计划：截断超出的步骤、补全step_id、丢弃未知负责人与依赖、为缺席的分析师补默认步骤（总数仍不超过上限）；存在环时改用默认计划"""
+    steps: List[FinancialAnalysisStep] = []
+    seen = set()
+    for index, step in enumerate(plan.analysis_steps[:max_steps]):
+        agent = _normalize_agent(step.assigned_agent)
+        if agent is None:
+            logger.warning(
+                f"⚠️ 计划步骤负责人未知，已忽略: {step.step} ({step.assigned_agent})"
+            )
+            continue
+        step_id = step.step_id.strip() or f"step_{index + 1}"
+        while step_id in seen:
+            step_id += "_"
+        seen.add(step_id)
+        steps.append(
+            step.model_copy(update={"step_id": step_id, "assigned_agent": agent})
+        )
+
+    ids = {step.step_id for step in steps}
+    steps = [
+        step.model_copy(
+            update={
+                "depends_on": [
+                    d for d in step.depends_on if d in ids and d != step.step_id
+                ]
+            }
+        )
+        for step in steps
+    ]
+    assigned = {step.assigned_agent for step in steps}
+    defaults = {step.step_id: step for step in default_analysis_plan().analysis_steps}
+    for key in ANALYST_SPECS:
+        if key not in assigned:
+            default_step = defaults[key]
+            while default_step.step_id in ids:
+                default_step = default_step.model_copy(
+                    update={"step_id": default_step.step_id + "_"}
+                )
+            ids.add(default_step.step_id)
+            steps.append(default_step)
+
+    validated = FinancialAnalysisPlan(analysis_steps=_fit_plan_steps(steps, max_steps))
     try:
-        result = risk_agent.invoke({"messages": [HumanMessage(content=task)]})
-        analysis_content = result["messages"][-1].content
-        
-        formatted_output = format_analysis_output(
-            "风险评估报告",
-            analysis_content,
-            "风险管理专家"
+        _topological_order(validated)
+    except ValueError as e:
+        logger.warning(f"⚠️ {e}，改用默认计划")
+        return default_analysis_plan()
+    return validated
+
+
+def _topological_order(plan: FinancialAnalysisPlan) -> List[str]:
+    """检查计划是否为有向无环图，返回一个拓扑顺序"""
+    remaining = {step.step_id: set(step.depends_on) for step in plan.analysis_steps}
+    order: List[str] = []
+    while remaining:
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"计划存在循环依赖: {', '.join(remaining)}")
+        for step_id in ready:
+            del remaining[step_id]
+            order.append(step_id)
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return order
+
+
+def _planner_messages(state: MultiAgentState, max_steps: int) -> List[HumanMessage]:
+    return [
+        HumanMessage(
+            content=PLANNER_PROMPT.format(query=_get_query(state), max_steps=max_steps)
         )
-        
-        logger.info("✅ 风险分析完成")
-        
-        return {
-            "messages": [AIMessage(content=formatted_output)],
-            "analyses": [f"风险分析: {analysis_content}"],
-            "completion_status": {"risk": True}
-        }
-        
+    ]
+
+
+def _plan_result(plan: FinancialAnalysisPlan) -> Dict[str, Any]:
+    """构造规划完成时的状态更新"""
+    summary = "\n".join(
+        f"- [{step.step_id}] {step.step}（{ANALYST_SPECS[step.assigned_agent].agent_name}）"
+        + (f" ← {', '.join(step.depends_on)}" if step.depends_on else "")
+        for step in plan.analysis_steps
+    )
+    logger.info(f"🗺️ 分析计划共 {len(plan.analysis_steps)} 个步骤")
+    return {
+        "analysis_plan": plan,
+        "messages": [
+            AIMessage(content=format_analysis_output("分析计划", summary, "系统协调器"))
+        ],
+        "workflow_stage": "analysis_planned",
+    }
+
+
+def _plan_failure(e: Exception) -> Dict[str, Any]:
+    logger.warning(f"⚠️ 分析计划生成失败，使用默认计划: {e}")
+    return _plan_result(default_analysis_plan())
+
+
+def plan_analysis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """规划节点 - 用结构化输出生成分析计划"""
+    max_steps = Configuration.from_runnable_config(config).max_plan_steps
+    try:
+        plan = (
+            get_model()
+            .with_structured_output(FinancialAnalysisPlan)
+            .invoke(_planner_messages(state, max_steps))
+        )
+        return _plan_result(validate_analysis_plan(plan, max_steps))
     except Exception as e:
-        logger.error(f"❌ 风险分析失败: {e}")
-        error_msg = format_analysis_output(
-            "风险评估报告",
-            f"分析过程中出现错误: {str(e)}",
-            "风险管理专家"
+        return _plan_failure(e)
+
+
+async def aplan_analysis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """规划节点（异步）"""
+    max_steps = Configuration.from_runnable_config(config).max_plan_steps
+    try:
+        plan = (
+            await get_model()
+            .with_structured_output(FinancialAnalysisPlan)
+            .ainvoke(_planner_messages(state, max_steps))
         )
-        return {
-            "messages": [AIMessage(content=error_msg)],
-            "analyses": [f"风险分析: 分析失败 - {str(e)}"],
-            "completion_status": {"risk": False}
-        }
+        return _plan_result(validate_analysis_plan(plan, max_steps))
+    except Exception as e:
+        return _plan_failure(e)
+
+
+def _build_step_task(
+    step: FinancialAnalysisStep, state: MultiAgentState, outputs: Dict[str, str]
+) -> str:
+    """构造单个计划步骤的任务：步骤说明 + 预取数据 + 前置步骤结论"""
+    task = (
+        f"请完成以下分析步骤（投资标的: {_get_query(state)}）\n"
+        f"步骤: {step.step}\n分析方法: {step.method}\n所需数据: {step.data_needed}"
+    )
+    dependencies = [
+        f"【{dep}】\n{truncate_to_tokens(outputs[dep], PLAN_STEP_TOKEN_BUDGET)}"
+        for dep in step.depends_on
+        if dep in outputs
+    ]
+    if dependencies:
+        task += "\n\n前置步骤结论:\n\n" + "\n\n".join(dependencies)
+    return task + _prefetch_context(state)
+
+
+def _plan_outcome(
+    plan: FinancialAnalysisPlan, outputs: Dict[str, str], errors: Dict[str, Exception]
+) -> Dict[str, Any]:
+    """按分析师汇总步骤结果，生成与固定扇出相同格式的状态更新"""
+    update: Dict[str, Any] = {"messages": [], "analyses": [], "completion_status": {}}
+    for key in ANALYST_SPECS:
+        steps = [step for step in plan.analysis_steps if step.assigned_agent == key]
+        done = [step for step in steps if step.step_id in outputs]
+        if done:
+            content = "\n\n".join(
+                f"### {step.step}\n{outputs[step.step_id]}" for step in done
+            )
+            partial = _analysis_success(key, content)
+        else:
+            error = next(
+                (errors[step.step_id] for step in steps if step.step_id in errors),
+                RuntimeError("没有执行任何步骤"),
+            )
+            partial = _analysis_failure(key, error)
+        for field in ("messages", "analyses"):
+            update[field].extend(partial[field])
+        update["completion_status"].update(partial["completion_status"])
+    return update
+
+
+def _ready_steps(
+    plan: FinancialAnalysisPlan, finished: set, started: set
+) -> List[FinancialAnalysisStep]:
+    """依赖已全部结束（成功或失败）且尚未启动的步骤"""
+    return [
+        step
+        for step in plan.analysis_steps
+        if step.step_id not in started
+        and all(dep in finished for dep in step.depends_on)
+    ]
+
 
-def wait_for_analyses_node(state: MultiAgentState) -> Dict[str, Any]:
-    """等待所有分析完成的汇聚节点"""
+def execute_plan_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """执行节点 - 按依赖关系调度计划步骤，依赖满足即启动，最大化并行"""
+    plan = state.get("analysis_plan") or default_analysis_plan()
+    timeout = Configuration.from_runnable_config(config).analyst_timeout_seconds
+    outputs: Dict[str, str] = {}
+    errors: Dict[str, Exception] = {}
+    finished: set = set()
+    started: set = set()
+    with ContextThreadPoolExecutor(max_workers=len(plan.analysis_steps)) as executor:
+        running = {}
+        while True:
+            for step in _ready_steps(plan, finished, started):
+                started.add(step.step_id)
+                logger.info(f"▶️ 执行计划步骤 [{step.step_id}] {step.step}")
+                payload = {
+                    "messages": [
+                        HumanMessage(content=_build_step_task(step, state, outputs))
+                    ]
+                }
+                running[
+                    executor.submit(
+                        _invoke_with_timeout,
+                        get_agent(step.assigned_agent),
+                        payload,
+                        timeout,
+                    )
+                ] = step
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                finished.add(step.step_id)
+                try:
+                    outputs[step.step_id] = future.result()["messages"][-1].content
+                except Exception as e:
+                    logger.error(f"❌ 计划步骤 [{step.step_id}] 失败: {e}")
+                    errors[step.step_id] = e
+    return _plan_outcome(plan, outputs, errors)
+
+
+async def aexecute_plan_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """执行节点（异步）"""
+    plan = state.get("analysis_plan") or default_analysis_plan()
+    timeout = Configuration.from_runnable_config(config).analyst_timeout_seconds
+    outputs: Dict[str, str] = {}
+    errors: Dict[str, Exception] = {}
+    finished: set = set()
+    started: set = set()
+    running: Dict[asyncio.Task, FinancialAnalysisStep] = {}
+    while True:
+        for step in _ready_steps(plan, finished, started):
+            started.add(step.step_id)
+            logger.info(f"▶️ 执行计划步骤 [{step.step_id}] {step.step}")
+            payload = {
+                "messages": [
+                    HumanMessage(content=_build_step_task(step, state, outputs))
+                ]
+            }
+            task = asyncio.ensure_future(
+                _ainvoke_with_timeout(get_agent(step.assigned_agent), payload, timeout)
+            )
+            running[task] = step
+        if not running:
+            break
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            step = running.pop(task)
+            finished.add(step.step_id)
+            try:
+                outputs[step.step_id] = task.result()["messages"][-1].content
+            except Exception as e:
+                logger.error(f"❌ 计划步骤 [{step.step_id}] 失败: {e}")
+                errors[step.step_id] = e
+    return _plan_outcome(plan, outputs, errors)
+
+
+ANALYST_NODES = ["fundamental_analysis", "technical_analysis", "risk_analysis"]
+
+
+def route_analysis_mode(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Any:
+    """固定模式并行启动三个分析师，计划模式先进入规划节点，流水线模式进入分析评议重叠的节点"""
+    analysis_mode = Configuration.from_runnable_config(config).analysis_mode
+    if analysis_mode == "planned":
+        return "plan_analysis"
+    if analysis_mode == "pipelined":
+        return "pipelined_analysis"
+    return ANALYST_NODES
+
+
+def _analysis_outcome(state: MultiAgentState) -> Dict[str, List[str]]:
+    """按完成状态划分成功与失败的分析师"""
+    completion_status = state.get("completion_status") or {}
+    succeeded = [key for key in ANALYST_SPECS if completion_status.get(key, False)]
+    failed = [key for key in ANALYST_SPECS if key not in succeeded]
+    return {"succeeded": succeeded, "failed": failed}
+
+
+def wait_for_analyses_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """汇聚节点：三个分析节点全部结束（成功、失败或超时）后执行一次，按法定数量决定是否继续"""
     completion_status = state.get("completion_status", {})
-    completed = [completion_status.get("fundamental", False), 
-                completion_status.get("technical", False), 
-                completion_status.get("risk", False)]
-    
-    logger.info(f"📋 分析完成状态检查: 基本面={completion_status.get('fundamental', False)}, "
-                f"技术面={completion_status.get('technical', False)}, "
-                f"风险={completion_status.get('risk', False)}")
-    
-    if all(completed):
+
+    logger.info(
+        f"📋 分析完成状态检查: 基本面={completion_status.get('fundamental', False)}, "
+        f"技术面={completion_status.get('technical', False)}, "
+        f"风险={completion_status.get('risk', False)}"
+    )
+
+    configuration = Configuration.from_runnable_config(config)
+    outcome = _analysis_outcome(state)
+    quorum = min(configuration.analysis_quorum, len(ANALYST_SPECS))
+
+    if not outcome["failed"]:
         logger.info("✅ 所有专业分析已完成，准备进入同行评议阶段")
         return {
             "workflow_stage": "all_analyses_completed",
-            "messages": [AIMessage(content="📝 所有专业分析已完成，正在准备同行评议...")]
-        }
-    else:
-        logger.warning("⏳ 部分分析尚未完成，继续等待...")
-        return {
-            "workflow_stage": "waiting_for_analyses"
+            "messages": [
+                AIMessage(content="📝 所有专业分析已完成，正在准备同行评议...")
+            ],
         }
 
-def peer_review_node(state: MultiAgentState) -> Dict[str, Any]:
-    """同行评议节点 - Agent互相评审"""
-    
-    logger.info("🔍 开始同行评议阶段 - Agent互评互改")
-    
-    # 从analyses字段收集所有分析结果
-    analyses = state.get("analyses", [])
-    combined_analysis = "\n\n".join(analyses)
-    
-    logger.info(f"📊 收集到的分析结果数量: {len(analyses)}")
-    
-    if not combined_analysis:
-        logger.warning("⚠️ 没有找到分析结果，跳过同行评议")
+    failed_labels = "、".join(
+        ANALYST_SPECS[key].analysis_label for key in outcome["failed"]
+    )
+    if len(outcome["succeeded"]) >= quorum:
+        logger.warning(
+            f"⚠️ {failed_labels}未完成，已满足法定数量({len(outcome['succeeded'])}/{quorum})，继续同行评议"
+        )
         return {
-            "messages": [AIMessage(content="【同行评议】没有分析结果可供评议")],
-            "workflow_stage": "peer_review_completed"
+            "workflow_stage": "analyses_quorum_met",
+            "messages": [
+                AIMessage(
+                    content=f"📝 {failed_labels}未能完成，基于其余分析进入同行评议..."
+                )
+            ],
         }
+
+    logger.error(f"❌ 有效分析数量不足({len(outcome['succeeded'])}/{quorum})，终止流程")
+    return {"workflow_stage": "analyses_insufficient"}
+
+
+def insufficient_analyses_node(state: MultiAgentState) -> Dict[str, Any]:
+    """有效分析不足法定数量时输出失败报告并结束流程"""
+    failed_analyses = [
+        entry for entry in state.get("analyses") or [] if "分析失败 - " in entry
+    ]
+    report = "有效的专业分析数量不足，无法形成可靠的综合投资建议。\n\n" + "\n".join(
+        failed_analyses
+    )
+    return {
+        "messages": [AIMessage(content=format_final_report(report))],
+        "final_report": report,
+        "consensus_reached": False,
+        "workflow_stage": "analyses_insufficient",
+    }
+
+
+class ReviewerSpec(NamedTuple):
+    """同行评议评审人配置"""
+
+    agent_key: str
+    reviews: Tuple[str, ...]  # 需要评审的分析师（不含自己）
+    header: str
+    role: str
+    focus: str  # 评审重点（编号列表）
+    start_log: str
+    done_log: str
+
+
+# 评审任务模板：labels 为本次被评审分析的名称，整轮评议时为该评审人负责的全部分析，逐份评审时只有一份
+REVIEW_TASK_TEMPLATE = """
+    作为{role}，请评审以下{labels}的质量：
     
-    # 让每个Agent评审其他Agent的工作
-    feedbacks = []
-    
-    # 基本面分析师评审技术和风险分析
-    fundamental_review_task = f"""
-    作为基本面分析专家，请评审以下技术分析和风险分析的质量：
-    
-    {combined_analysis}
+    {analysis}
     
     请重点关注：
-    1. 分析逻辑是否合理
+{focus}
+    """
+
+REVIEWER_SPECS: Dict[str, ReviewerSpec] = {
+    # 基本面分析师评审技术和风险分析
+    "fundamental": ReviewerSpec(
+        agent_key="fundamental",
+        reviews=("technical", "risk"),
+        header="【基本面分析师评审】",
+        role="基本面分析专家",
+        focus="""    1. 分析逻辑是否合理
     2. 是否与基本面分析结果一致
     3. 有哪些遗漏或错误
-    4. 提出具体改进建议
-    
-    格式：【基本面分析师评审】
-    评审意见：...
-    改进建议：...
-    """
-    
-    try:
-        logger.info("👨‍💼 基本面分析师开始评审其他分析")
-        fundamental_review = fundamental_agent.invoke({"messages": [HumanMessage(content=fundamental_review_task)]})
-        feedbacks.append(f"【基本面分析师评审】\n{fundamental_review['messages'][-1].content}")
-        logger.info("✅ 基本面分析师评审完成")
-    except Exception as e:
-        logger.error(f"❌ 基本面分析师评审失败: {e}")
-        feedbacks.append("【基本面分析师评审】评审过程中出现错误")
-    
+    4. 提出具体改进建议""",
+        start_log="👨‍💼 基本面分析师开始评审其他分析",
+        done_log="✅ 基本面分析师评审完成",
+    ),
     # 技术分析师评审基本面和风险分析
-    technical_review_task = f"""
-    作为技术分析专家，请评审以下基本面分析和风险分析的质量：
-    
-    {combined_analysis}
-    
-    请重点关注：
-    1. 分析是否结合了市场技术面情况
+    "technical": ReviewerSpec(
+        agent_key="technical",
+        reviews=("fundamental", "risk"),
+        header="【技术分析师评审】",
+        role="技术分析专家",
+        focus="""    1. 分析是否结合了市场技术面情况
     2. 时机判断是否合理
     3. 价格目标是否符合技术面支撑
-    4. 提出具体改进建议
-    
-    格式：【技术分析师评审】
-    评审意见：...
-    改进建议：...
-    """
-    
-    try:
-        logger.info("👨‍💻 技术分析师开始评审其他分析")
-        technical_review = technical_agent.invoke({"messages": [HumanMessage(content=technical_review_task)]})
-        feedbacks.append(f"【技术分析师评审】\n{technical_review['messages'][-1].content}")
-        logger.info("✅ 技术分析师评审完成")
-    except Exception as e:
-        logger.error(f"❌ 技术分析师评审失败: {e}")
-        feedbacks.append("【技术分析师评审】评审过程中出现错误")
-    
+    4. 提出具体改进建议""",
+        start_log="👨‍💻 技术分析师开始评审其他分析",
+        done_log="✅ 技术分析师评审完成",
+    ),
     # 风险分析师评审基本面和技术分析
-    risk_review_task = f"""
-    作为风险管理专家，请评审以下基本面分析和技术分析的质量：
-    
-    {combined_analysis}
-    
-    请重点关注：
-    1. 风险因素是否被充分识别
+    "risk": ReviewerSpec(
+        agent_key="risk",
+        reviews=("fundamental", "technical"),
+        header="【风险分析师评审】",
+        role="风险管理专家",
+        focus="""    1. 风险因素是否被充分识别
     2. 风险评估是否客观准确
     3. 风险控制建议是否实用
-    4. 提出具体改进建议
-    
-    格式：【风险分析师评审】
-    评审意见：...
-    改进建议：...
+    4. 提出具体改进建议""",
+        start_log="👨‍⚖️ 风险分析师开始评审其他分析",
+        done_log="✅ 风险分析师评审完成",
+    ),
+}
+
+FEEDBACK_TYPES = ("critique", "suggestion", "approval")
+
+REVIEW_OUTPUT_INSTRUCTIONS = """
+    请先简要给出评审意见，然后在最后输出一个```json代码块，字段如下：
+    {{
+      "feedback_type": "critique/suggestion/approval 之一（approval表示无需修改）",
+      "confidence_score": 0到1之间的置信度,
+      "feedback_content": "一两句话的评审结论",
+      "improvements": {{{targets}}}
+    }}
+    improvements 中每个键对应被评审的分析（{labels}），值为给该分析的具体改进建议列表，无建议时为空列表。
     """
-    
+
+_JSON_BLOCK_PATTERN = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+
+
+def _build_review_task(
+    reviewer: str, analysis: str, targets: Optional[Sequence[str]] = None
+) -> str:
+    """构造评审任务，要求以JSON输出结构化反馈（targets为本次评审的分析师，默认为该评审人负责的全部）"""
+    spec = REVIEWER_SPECS[reviewer]
+    targets = targets or spec.reviews
+    task = REVIEW_TASK_TEMPLATE.format(
+        role=spec.role,
+        labels="和".join(ANALYST_SPECS[key].analysis_label for key in targets),
+        analysis=analysis,
+        focus=spec.focus,
+    )
+    instructions = REVIEW_OUTPUT_INSTRUCTIONS.format(
+        targets=", ".join(f'"{key}": ["..."]' for key in targets),
+        labels="、".join(
+            f"{key}={ANALYST_SPECS[key].analysis_label}" for key in targets
+        ),
+    )
+    return task + instructions
+
+
+def _parse_improvements(
+    reviewer: str, raw: Any, targets: Sequence[str]
+) -> Dict[str, List[str]]:
+    """规整improvements字段：须为字典；单个字符串视为一条建议，其他非列表的值忽略"""
+    if raw is None:
+        raw = {}
+    if not isinstance(raw, dict):
+        logger.warning(
+            f"⚠️ {REVIEWER_SPECS[reviewer].header}improvements不是字典，忽略改进建议: {type(raw).__name__}"
+        )
+        raw = {}
+    improvements = {}
+    for key in targets:
+        value = raw.get(key)
+        if isinstance(value, str):
+            value = [value] if value.strip() else []
+        elif not isinstance(value, list):
+            if value is not None:
+                logger.warning(
+                    f"⚠️ {REVIEWER_SPECS[reviewer].header}{key}的改进建议不是列表，已忽略"
+                )
+            value = []
+        improvements[key] = [
+            str(item) for item in value if item is not None and str(item).strip()
+        ]
+    return improvements
+
+
+def parse_review_feedback(
+    reviewer: str, review_content: str, targets: Optional[Sequence[str]] = None
+) -> AgentFeedback:
+    """将评审输出解析为AgentFeedback，无法解析时退化为低置信度的critique"""
+    spec = REVIEWER_SPECS[reviewer]
+    targets = targets or spec.reviews
+    matches = _JSON_BLOCK_PATTERN.findall(review_content)
     try:
-        logger.info("👨‍⚖️ 风险分析师开始评审其他分析")
-        risk_review = risk_agent.invoke({"messages": [HumanMessage(content=risk_review_task)]})
-        feedbacks.append(f"【风险分析师评审】\n{risk_review['messages'][-1].content}")
-        logger.info("✅ 风险分析师评审完成")
+        if not matches:
+            raise ValueError("评审输出中没有JSON代码块")
+        data = json.loads(matches[-1])
+        improvements = _parse_improvements(reviewer, data.get("improvements"), targets)
+        feedback_type = str(data.get("feedback_type", "critique")).strip().lower()
+        return AgentFeedback(
+            agent_name=reviewer,
+            feedback_type=feedback_type
+            if feedback_type in FEEDBACK_TYPES
+            else "critique",
+            feedback_content=str(data.get("feedback_content", "")),
+            confidence_score=min(
+                max(float(data.get("confidence_score", 0.5)), 0.0), 1.0
+            ),
+            suggested_improvements=[
+                item for items in improvements.values() for item in items
+            ],
+            target_agents=list(targets),
+            improvements_by_agent=improvements,
+        )
+    except (AttributeError, TypeError, ValueError, ValidationError) as e:
+        logger.warning(f"⚠️ {spec.header}结构化反馈解析失败，使用原文摘要: {e}")
+        return AgentFeedback(
+            agent_name=reviewer,
+            feedback_type="critique",
+            feedback_content=truncate_to_tokens(review_content, 300),
+            confidence_score=0.5,
+            suggested_improvements=[],
+            target_agents=list(targets),
+        )
+
+
+def _run_review(
+    reviewer: str, analysis: str, targets: Optional[Sequence[str]] = None
+) -> Tuple[str, Optional[AgentFeedback]]:
+    """执行单个评审人的评议（同步），失败时仅影响该评审人"""
+    spec = REVIEWER_SPECS[reviewer]
+    task = _build_review_task(reviewer, analysis, targets)
+    try:
+        logger.info(spec.start_log)
+        review = get_agent(spec.agent_key).invoke(
+            {"messages": [HumanMessage(content=task)]}
+        )
+        logger.info(spec.done_log)
+        content = review["messages"][-1].content
+        return f"{spec.header}\n{content}", parse_review_feedback(
+            reviewer, content, targets
+        )
     except Exception as e:
-        logger.error(f"❌ 风险分析师评审失败: {e}")
-        feedbacks.append("【风险分析师评审】评审过程中出现错误")
-    
-    formatted_feedback = format_review_output(feedbacks)
-    
-    logger.info("🎯 同行评议阶段完成，共收集到 {} 条评审意见".format(len(feedbacks)))
-    
+        logger.error(f"❌ {spec.header}失败: {e}")
+        return f"{spec.header}评审过程中出现错误", None
+
+
+async def _arun_review(
+    reviewer: str, analysis: str, targets: Optional[Sequence[str]] = None
+) -> Tuple[str, Optional[AgentFeedback]]:
+    """执行单个评审人的评议（异步），失败时仅影响该评审人"""
+    spec = REVIEWER_SPECS[reviewer]
+    task = _build_review_task(reviewer, analysis, targets)
+    try:
+        logger.info(spec.start_log)
+        review = await get_agent(spec.agent_key).ainvoke(
+            {"messages": [HumanMessage(content=task)]}
+        )
+        logger.info(spec.done_log)
+        content = review["messages"][-1].content
+        return f"{spec.header}\n{content}", parse_review_feedback(
+            reviewer, content, targets
+        )
+    except Exception as e:
+        logger.error(f"❌ {spec.header}失败: {e}")
+        return f"{spec.header}评审过程中出现错误", None
+
+
+def _latest_analyses(state: MultiAgentState) -> Dict[str, str]:
+    """按分析师取最新的有效分析（不含失败记录）"""
+    labels = {spec.analysis_label: key for key, spec in ANALYST_SPECS.items()}
+    latest = latest_by_label(state.get("analyses") or [], list(labels))
+    return {
+        labels[label]: content
+        for label, content in latest.items()
+        if not content.startswith("分析失败 - ")
+    }
+
+
+def _review_contexts(state: MultiAgentState) -> Dict[str, str]:
+    """为每位评审人切分其需要评审的分析，没有可评审内容的评审人不参与"""
+    latest = _latest_analyses(state)
+    logger.info(f"📊 收集到的有效分析数量: {len(latest)}")
+
+    contexts = {}
+    for reviewer, spec in REVIEWER_SPECS.items():
+        sections = [
+            f"{ANALYST_SPECS[key].analysis_label}: {latest[key]}"
+            for key in spec.reviews
+            if key in latest
+        ]
+        if sections:
+            contexts[reviewer] = "\n\n".join(sections)
+    return contexts
+
+
+def review_cache_key(
+    reviewer: str, analysis: str, targets: Optional[Sequence[str]] = None
+) -> str:
+    """评议缓存键：评审人 + 评审对象（默认为该评审人负责的全部分析师）+ 被评审内容的哈希，内容不变时复用上一轮的评议"""
+    targets = sorted(targets or REVIEWER_SPECS[reviewer].reviews)
+    return f"{reviewer}[{','.join(targets)}]:{hashlib.sha256(analysis.encode('utf-8')).hexdigest()}"
+
+
+def _split_cached_reviews(
+    state: MultiAgentState,
+    contexts: Dict[str, str],
+    targets: Optional[Sequence[str]] = None,
+) -> Tuple[Dict[str, Tuple[str, Optional[AgentFeedback]]], Dict[str, str]]:
+    """区分可复用缓存的评审人与需要重新评议的评审人"""
+    cache = state.get("review_cache") or {}
+    cached = {}
+    pending = {}
+    for reviewer, analysis in contexts.items():
+        entry = cache.get(review_cache_key(reviewer, analysis, targets))
+        if entry is None:
+            pending[reviewer] = analysis
+        else:
+            logger.info(
+                f"♻️ {REVIEWER_SPECS[reviewer].header}被评审内容未变化，复用上一轮评议"
+            )
+            cached[reviewer] = (entry.review, entry.feedback)
+    return cached, pending
+
+
+def _new_cache_entries(
+    contexts: Dict[str, str],
+    reviews: Dict[str, Tuple[str, Optional[AgentFeedback]]],
+    targets: Optional[Sequence[str]] = None,
+) -> Dict[str, CachedReview]:
+    """新完成的评议写入缓存（失败的评议不缓存）"""
+    return {
+        review_cache_key(reviewer, contexts[reviewer], targets): CachedReview(
+            review=review, feedback=feedback
+        )
+        for reviewer, (review, feedback) in reviews.items()
+        if feedback is not None
+    }
+
+
+def _peer_review_skipped() -> Dict[str, Any]:
+    """没有分析结果时跳过同行评议"""
+    logger.warning("⚠️ 没有找到分析结果，跳过同行评议")
+    return {
+        "messages": [AIMessage(content="【同行评议】没有分析结果可供评议")],
+        "workflow_stage": "peer_review_completed",
+    }
+
+
+def _peer_review_result(
+    contexts: Dict[str, str],
+    cached: Dict[str, Tuple[str, Optional[AgentFeedback]]],
+    fresh: Dict[str, Tuple[str, Optional[AgentFeedback]]],
+) -> Dict[str, Any]:
+    """汇总各评审人意见，构造同行评议的状态更新（每位评审人一条结构化反馈）"""
+    reviews = [
+        cached[reviewer] if reviewer in cached else fresh[reviewer]
+        for reviewer in contexts
+    ]
+    formatted_feedback = format_review_output([text for text, _ in reviews])
+    agent_feedbacks = [feedback for _, feedback in reviews if feedback is not None]
+
+    logger.info(
+        f"🎯 同行评议阶段完成，共收集到 {len(reviews)} 条评审意见（复用 {len(cached)} 条）"
+    )
+
     return {
         "messages": [AIMessage(content=formatted_feedback)],
-        "agent_feedbacks": [
-            AgentFeedback(
-                agent_name="peer_review",
-                feedback_type="critique", 
-                feedback_content=formatted_feedback,
-                confidence_score=0.8,
-                suggested_improvements=["基于评议结果优化分析"]
+        "agent_feedbacks": agent_feedbacks,
+        "review_cache": _new_cache_entries(contexts, fresh),
+        "workflow_stage": "peer_review_completed",
+    }
+
+
+def peer_review_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """同行评议节点 - Agent互相评审（三位评审人并发执行，推测综合模式下同时起草综合报告）"""
+    logger.info("🔍 开始同行评议阶段 - Agent互评互改")
+
+    contexts = _review_contexts(state)
+    if not contexts:
+        return _peer_review_skipped()
+
+    cached, pending = _split_cached_reviews(state, contexts)
+    drafting = _should_draft_synthesis(state, config)
+    fresh: Dict[str, Tuple[str, Optional[AgentFeedback]]] = {}
+    draft = None
+    if pending or drafting:
+        # 每个Agent只评审其他Agent的工作，并发执行，耗时约等于最慢的评审人
+        with ContextThreadPoolExecutor(max_workers=len(pending) + drafting) as executor:
+            draft_future = (
+                executor.submit(_draft_synthesis, state, config) if drafting else None
             )
+            fresh = dict(
+                zip(
+                    pending,
+                    executor.map(lambda item: _run_review(*item), pending.items()),
+                )
+            )
+            draft = draft_future.result() if draft_future is not None else None
+
+    return {**_peer_review_result(contexts, cached, fresh), **_draft_update(draft)}
+
+
+async def apeer_review_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """同行评议节点（异步）- 三位评审人并发执行，推测综合模式下同时起草综合报告"""
+    logger.info("🔍 开始同行评议阶段 - Agent互评互改")
+
+    contexts = _review_contexts(state)
+    if not contexts:
+        return _peer_review_skipped()
+
+    cached, pending = _split_cached_reviews(state, contexts)
+    draft_task = (
+        asyncio.ensure_future(_adraft_synthesis(state, config))
+        if _should_draft_synthesis(state, config)
+        else None
+    )
+    reviews = await asyncio.gather(
+        *(_arun_review(reviewer, analysis) for reviewer, analysis in pending.items())
+    )
+    draft = await draft_task if draft_task is not None else None
+
+    return {
+        **_peer_review_result(contexts, cached, dict(zip(pending, reviews))),
+        **_draft_update(draft),
+    }
+
+
+# ============= 流水线评议 =============
+# 流水线模式下分析与评议在同一节点内重叠执行：每份分析完成后立即启动评审它的评审人（逐份评审），
+# 不必等最慢的分析师；每位评审人的逐份评审结果最后合并为一条结构化反馈。
+# 代价：逐份评审使评审调用从每轮3次（每位评审人一次）增加到6次（每个评审人-分析组合一次），
+# 用更多的调用与token换取更短的端到端时延；逐份评审同样按被评审内容写入/复用评议缓存
+
+_FEEDBACK_SEVERITY = {"critique": 0, "suggestion": 1, "approval": 2}
+_DRAFT_JOB = ("synthesis_draft",)  # 推测综合草稿任务的标识
+
+
+def merge_review_feedbacks(
+    reviewer: str, feedbacks: List[AgentFeedback]
+) -> AgentFeedback:
+    """合并同一评审人的逐份评审：取最严重的结论与最低置信度，改进建议按分析师汇总"""
+    improvements: Dict[str, List[str]] = {}
+    for feedback in feedbacks:
+        for key, items in feedback.improvements_by_agent.items():
+            improvements.setdefault(key, []).extend(items)
+    targets = [
+        key
+        for key in REVIEWER_SPECS[reviewer].reviews
+        if any(key in f.target_agents for f in feedbacks)
+    ]
+    return AgentFeedback(
+        agent_name=reviewer,
+        feedback_type=min(
+            (f.feedback_type for f in feedbacks),
+            key=lambda t: _FEEDBACK_SEVERITY.get(t, 0),
+        ),
+        feedback_content="；".join(
+            f.feedback_content for f in feedbacks if f.feedback_content
+        ),
+        confidence_score=min(f.confidence_score for f in feedbacks),
+        suggested_improvements=[
+            item for items in improvements.values() for item in items
         ],
-        "workflow_stage": "peer_review_completed"
+        target_agents=targets,
+        improvements_by_agent=improvements,
+    )
+
+
+def _review_pairs(analyst: str) -> List[str]:
+    """评审指定分析师的评审人"""
+    return [
+        reviewer for reviewer, spec in REVIEWER_SPECS.items() if analyst in spec.reviews
+    ]
+
+
+def _analysis_section(analyst_update: Dict[str, Any]) -> str:
+    """分析段落（"标签: 内容"）即逐份评审的输入"""
+    return analyst_update["analyses"][0]
+
+
+def _split_pair_reviews(
+    state: MultiAgentState, analyst: str, section: str
+) -> Tuple[Dict[Tuple[str, str], Tuple[str, Optional[AgentFeedback]]], List[str]]:
+    """区分可复用缓存的逐份评审与需要启动的评审人"""
+    cached, pending = _split_cached_reviews(
+        state, {reviewer: section for reviewer in _review_pairs(analyst)}, (analyst,)
+    )
+    return {(reviewer, analyst): review for reviewer, review in cached.items()}, list(
+        pending
+    )
+
+
+def _pipelined_draft_state(
+    state: MultiAgentState,
+    analyst_updates: Dict[str, Dict[str, Any]],
+    config: Optional[RunnableConfig],
+) -> Optional[MultiAgentState]:
+    """全部分析结束且满足法定数量时，返回用于起草综合报告的状态（草稿与剩余评审重叠执行），否则返回None"""
+    succeeded = [
+        key
+        for key, update in analyst_updates.items()
+        if update["completion_status"][key]
+    ]
+    quorum = min(
+        Configuration.from_runnable_config(config).analysis_quorum, len(ANALYST_SPECS)
+    )
+    if len(analyst_updates) < len(ANALYST_SPECS) or len(succeeded) < quorum:
+        return None
+    new_analyses = [
+        entry for key in ANALYST_SPECS for entry in analyst_updates[key]["analyses"]
+    ]
+    return {
+        **state,
+        "analyses": add_analyses(state.get("analyses") or [], new_analyses),
     }
 
-def senior_synthesis_node(state: MultiAgentState) -> Dict[str, Any]:
-    """高级综合分析节点"""
-    
-    logger.info("🎯 高级投资总监开始综合分析和质量控制")
-    
-    # 收集所有分析和评议结果
-    all_content = []
-    for msg in state["messages"]:
-        if isinstance(msg, AIMessage):
-            all_content.append(msg.content)
-    
-    combined_content = "\n\n".join(all_content)
-    
-    synthesis_task = f"""
+
+def _pipelined_result(
+    analyst_updates: Dict[str, Dict[str, Any]],
+    cached: Dict[Tuple[str, str], Tuple[str, Optional[AgentFeedback]]],
+    fresh: Dict[Tuple[str, str], Tuple[str, Optional[AgentFeedback]]],
+) -> Dict[str, Any]:
+    """汇总分析与逐份评审，生成与“分析 + 同行评议”相同格式的状态更新"""
+    update: Dict[str, Any] = {"messages": [], "analyses": [], "completion_status": {}}
+    for key in ANALYST_SPECS:
+        partial = analyst_updates[key]
+        update["messages"].extend(partial["messages"])
+        update["analyses"].extend(partial["analyses"])
+        update["completion_status"].update(partial["completion_status"])
+
+    pair_reviews = {**cached, **fresh}
+    review_texts = []
+    agent_feedbacks = []
+    for reviewer, spec in REVIEWER_SPECS.items():
+        reviews = [
+            pair_reviews[(reviewer, key)]
+            for key in spec.reviews
+            if (reviewer, key) in pair_reviews
+        ]
+        if not reviews:
+            continue
+        review_texts.append(
+            spec.header
+            + "\n"
+            + "\n\n".join(text[len(spec.header) :].lstrip("\n") for text, _ in reviews)
+        )
+        feedbacks = [feedback for _, feedback in reviews if feedback is not None]
+        if feedbacks:
+            agent_feedbacks.append(merge_review_feedbacks(reviewer, feedbacks))
+
+    review_cache: Dict[str, CachedReview] = {}
+    for (reviewer, analyst), review in fresh.items():
+        review_cache.update(
+            _new_cache_entries(
+                {reviewer: _analysis_section(analyst_updates[analyst])},
+                {reviewer: review},
+                (analyst,),
+            )
+        )
+
+    logger.info(
+        f"🎯 流水线评议完成，共 {len(pair_reviews)} 份逐份评审（复用 {len(cached)} 份）"
+    )
+    update["messages"].append(AIMessage(content=format_review_output(review_texts)))
+    update["agent_feedbacks"] = agent_feedbacks
+    update["review_cache"] = review_cache
+    update["revision_targets"] = None
+    return update
+
+
+def pipelined_analysis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """流水线节点 - 三位分析师并行执行，每份分析完成即由其评审人逐份评审（推测综合模式下全部分析完成即起草）"""
+    logger.info("🔀 流水线模式：分析完成即开始评议")
+    drafting = _should_draft_synthesis(state, config)
+    analyst_updates: Dict[str, Dict[str, Any]] = {}
+    cached: Dict[Tuple[str, str], Tuple[str, Optional[AgentFeedback]]] = {}
+    fresh: Dict[Tuple[str, str], Tuple[str, Optional[AgentFeedback]]] = {}
+    draft = None
+    max_workers = (
+        len(ANALYST_SPECS)
+        + sum(len(spec.reviews) for spec in REVIEWER_SPECS.values())
+        + drafting
+    )
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        running: Dict[Any, Tuple[str, ...]] = {
+            executor.submit(_run_analyst, key, state, config): (key,)
+            for key in ANALYST_SPECS
+        }
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                if job == _DRAFT_JOB:
+                    draft = future.result()
+                    continue
+                if len(job) == 2:
+                    fresh[job] = future.result()
+                    continue
+                analyst = job[0]
+                analyst_updates[analyst] = future.result()
+                draft_state = (
+                    _pipelined_draft_state(state, analyst_updates, config)
+                    if drafting
+                    else None
+                )
+                if draft_state is not None:
+                    running[executor.submit(_draft_synthesis, draft_state, config)] = (
+                        _DRAFT_JOB
+                    )
+                if not analyst_updates[analyst]["completion_status"][analyst]:
+                    continue
+                section = _analysis_section(analyst_updates[analyst])
+                reused, pending = _split_pair_reviews(state, analyst, section)
+                cached.update(reused)
+                for reviewer in pending:
+                    running[
+                        executor.submit(_run_review, reviewer, section, (analyst,))
+                    ] = (reviewer, analyst)
+    return {**_pipelined_result(analyst_updates, cached, fresh), **_draft_update(draft)}
+
+
+async def apipelined_analysis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """流水线节点（异步）"""
+    logger.info("🔀 流水线模式：分析完成即开始评议")
+    drafting = _should_draft_synthesis(state, config)
+    analyst_updates: Dict[str, Dict[str, Any]] = {}
+    cached: Dict[Tuple[str, str], Tuple[str, Optional[AgentFeedback]]] = {}
+    fresh: Dict[Tuple[str, str], Tuple[str, Optional[AgentFeedback]]] = {}
+    draft = None
+    running: Dict[asyncio.Task, Tuple[str, ...]] = {
+        asyncio.ensure_future(_arun_analyst(key, state, config)): (key,)
+        for key in ANALYST_SPECS
+    }
+    while running:
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            job = running.pop(task)
+            if job == _DRAFT_JOB:
+                draft = task.result()
+                continue
+            if len(job) == 2:
+                fresh[job] = task.result()
+                continue
+            analyst = job[0]
+            analyst_updates[analyst] = task.result()
+            draft_state = (
+                _pipelined_draft_state(state, analyst_updates, config)
+                if drafting
+                else None
+            )
+            if draft_state is not None:
+                running[
+                    asyncio.ensure_future(_adraft_synthesis(draft_state, config))
+                ] = _DRAFT_JOB
+            if not analyst_updates[analyst]["completion_status"][analyst]:
+                continue
+            section = _analysis_section(analyst_updates[analyst])
+            reused, pending = _split_pair_reviews(state, analyst, section)
+            cached.update(reused)
+            for reviewer in pending:
+                running[
+                    asyncio.ensure_future(_arun_review(reviewer, section, (analyst,)))
+                ] = (reviewer, analyst)
+    return {**_pipelined_result(analyst_updates, cached, fresh), **_draft_update(draft)}
+
+
+def _reviewer_header(agent_name: str) -> str:
+    """评审人名称对应的标题"""
+    spec = REVIEWER_SPECS.get(agent_name)
+    return spec.header.strip("【】") if spec else agent_name
+
+
+def _format_feedback_summary(feedback: AgentFeedback) -> str:
+    """将结构化反馈压缩为简短文本"""
+    lines = [
+        f"结论({feedback.feedback_type}, 置信度{feedback.confidence_score:.2f}): {feedback.feedback_content}"
+    ]
+    for key, items in feedback.improvements_by_agent.items():
+        label = ANALYST_SPECS[key].analysis_label if key in ANALYST_SPECS else key
+        lines.extend(f"- [{label}] {item}" for item in items)
+    return "\n".join(lines)
+
+
+def _build_synthesis_context(
+    state: MultiAgentState, token_budget: Optional[int]
+) -> str:
+    """组装综合分析上下文：仅取各分析师最新分析与本轮评议，并控制在token预算内"""
+    labels = [spec.analysis_label for spec in ANALYST_SPECS.values()]
+    sections = list(latest_by_label(state.get("analyses") or [], labels).items())
+    for feedback in state.get("agent_feedbacks") or []:
+        sections.append(
+            (
+                f"{_reviewer_header(feedback.agent_name)}",
+                _format_feedback_summary(feedback),
+            )
+        )
+
+    sections = fit_sections(sections, token_budget)
+    combined_content = "\n\n".join(f"【{title}】\n{body}" for title, body in sections)
+    logger.info(
+        f"🧮 综合分析上下文约 {estimate_tokens(combined_content)} tokens（预算: {token_budget}）"
+    )
+    return combined_content
+
+
+def _build_synthesis_task(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> str:
+    """构造高级综合分析任务"""
+    configuration = Configuration.from_runnable_config(config)
+    combined_content = _build_synthesis_context(
+        state, configuration.synthesis_token_budget
+    )
+
+    return f"""
     作为资深投资总监，请基于以下专业分析师的工作成果和同行评议结果，
     形成最终的综合投资分析报告：
     
@@ -681,44 +2169,254 @@ def senior_synthesis_node(state: MultiAgentState) -> Dict[str, Any]:
     - 提供实用的投资指导
     - 格式美观，条理清晰
     """
+
+
+def _synthesis_success(final_report_content: str) -> Dict[str, Any]:
+    """构造综合分析成功时的状态更新"""
+    formatted_final_report = format_final_report(final_report_content)
+
+    logger.info("✅ 最终综合报告生成完成")
+
+    return {
+        "messages": [AIMessage(content=formatted_final_report)],
+        "final_report": final_report_content,
+        "consensus_reached": True,
+        "synthesis_draft": None,  # 草稿只用于本轮综合
+        "workflow_stage": "synthesis_completed",
+    }
+
+
+def _synthesis_failure(e: Exception) -> Dict[str, Any]:
+    """构造综合分析失败时的状态更新"""
+    logger.error(f"❌ 综合分析失败: {e}")
+    error_report = format_final_report(f"综合分析过程中出现错误: {str(e)}")
+    return {
+        "messages": [AIMessage(content=error_report)],
+        "final_report": f"综合分析失败: {str(e)}",
+        "consensus_reached": True,  # 即使失败也结束流程
+        "synthesis_draft": None,
+        "workflow_stage": "synthesis_failed",
+    }
+
+
+def senior_synthesis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """高级综合分析节点"""
+    logger.info("🎯 高级投资总监开始综合分析和质量控制")
+
+    draft = state.get("synthesis_draft")
+    if draft is not None:
+        try:
+            result = get_agent("senior").invoke(
+                {
+                    "messages": [
+                        HumanMessage(content=_build_patch_task(state, draft, config))
+                    ]
+                }
+            )
+            return _patch_success(draft, result["messages"][-1].content)
+        except Exception as e:
+            logger.warning(f"⚠️ 草稿修订失败，改为完整综合: {e}")
+
+    synthesis_task = _build_synthesis_task(state, config)
+
+    try:
+        result = get_agent("senior").invoke(
+            {"messages": [HumanMessage(content=synthesis_task)]}
+        )
+        return _synthesis_success(result["messages"][-1].content)
+    except Exception as e:
+        return _synthesis_failure(e)
+
+
+async def asenior_synthesis_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """高级综合分析节点（异步）"""
+    logger.info("🎯 高级投资总监开始综合分析和质量控制")
+
+    draft = state.get("synthesis_draft")
+    if draft is not None:
+        try:
+            result = await get_agent("senior").ainvoke(
+                {
+                    "messages": [
+                        HumanMessage(content=_build_patch_task(state, draft, config))
+                    ]
+                }
+            )
+            return _patch_success(draft, result["messages"][-1].content)
+        except Exception as e:
+            logger.warning(f"⚠️ 草稿修订失败，改为完整综合: {e}")
+
+    synthesis_task = _build_synthesis_task(state, config)
+
+    try:
+        result = await get_agent("senior").ainvoke(
+            {"messages": [HumanMessage(content=synthesis_task)]}
+        )
+        return _synthesis_success(result["messages"][-1].content)
+    except Exception as e:
+        return _synthesis_failure(e)
+
+
+# ============= 推测综合 =============
+# 推测综合模式下，高级投资总监在同行评议进行的同时基于原始分析起草报告；
+# 评议（及分析师修订）完成后只做一次简短的修订，以查找/替换编辑吸收评议意见，重叠两个最耗时的阶段
+
+SYNTHESIS_PATCH_TEMPLATE = """
+    你已基于各分析师的原始分析起草了综合投资报告，现在同行评议已经完成。
+    请根据以下评议意见{revised_hint}修订草稿：只修改受影响的内容，其余保持不变。
+    
+    报告草稿:
+    {draft}
+    
+    {context}
     
+    不要重写全文，只输出一个```json代码块描述修改：
+    {{
+      "edits": [{{"find": "草稿中需要修改的原文片段（逐字摘录）", "replace": "修改后的内容"}}],
+      "append": "需要补充在报告末尾的新内容，没有时为空字符串"
+    }}
+    """
+
+
+def _analysis_hashes(state: MultiAgentState) -> Dict[str, str]:
+    return {
+        key: hashlib.sha256(content.encode("utf-8")).hexdigest()
+        for key, content in _latest_analyses(state).items()
+    }
+
+
+def _should_draft_synthesis(
+    state: MultiAgentState, config: Optional[RunnableConfig]
+) -> bool:
+    """仅在首轮评议时起草：修订轮次中直接完整综合"""
+    return (
+        Configuration.from_runnable_config(config).speculative_synthesis
+        and state.get("synthesis_draft") is None
+        and not state.get("revision_count")
+    )
+
+
+def _draft_task(state: MultiAgentState, config: Optional[RunnableConfig]) -> str:
+    """草稿任务：与完整综合相同，但此时还没有评议意见"""
+    return _build_synthesis_task({**state, "agent_feedbacks": []}, config)
+
+
+def _draft_result(state: MultiAgentState, result: Any) -> SynthesisDraft:
+    logger.info("📝 综合报告草稿完成（与同行评议并行）")
+    return SynthesisDraft(
+        report=result["messages"][-1].content, analysis_hashes=_analysis_hashes(state)
+    )
+
+
+def _draft_synthesis(
+    state: MultiAgentState, config: Optional[RunnableConfig]
+) -> Optional[SynthesisDraft]:
+    """起草综合报告（同步），失败时返回None，之后按常规完整综合"""
+    logger.info("📝 高级投资总监开始起草综合报告")
     try:
-        result = senior_agent.invoke({"messages": [HumanMessage(content=synthesis_task)]})
-        final_report_content = result["messages"][-1].content
-        
-        formatted_final_report = format_final_report(final_report_content)
-        
-        logger.info("✅ 最终综合报告生成完成")
-        
-        return {
-            "messages": [AIMessage(content=formatted_final_report)],
-            "final_report": final_report_content,
-            "consensus_reached": True,
-            "workflow_stage": "synthesis_completed"
-        }
-        
+        result = get_agent("senior").invoke(
+            {"messages": [HumanMessage(content=_draft_task(state, config))]}
+        )
+        return _draft_result(state, result)
     except Exception as e:
-        logger.error(f"❌ 综合分析失败: {e}")
-        error_report = format_final_report(f"综合分析过程中出现错误: {str(e)}")
-        return {
-            "messages": [AIMessage(content=error_report)],
-            "final_report": f"综合分析失败: {str(e)}",
-            "consensus_reached": True,  # 即使失败也结束流程
-            "workflow_stage": "synthesis_failed"
-        }
+        logger.warning(f"⚠️ 综合报告草稿失败，评议后完整综合: {e}")
+        return None
+
 
-def consensus_check_node(state: MultiAgentState) -> Dict[str, Any]:
+async def _adraft_synthesis(
+    state: MultiAgentState, config: Optional[RunnableConfig]
+) -> Optional[SynthesisDraft]:
+    """起草综合报告（异步）"""
+    logger.info("📝 高级投资总监开始起草综合报告")
+    try:
+        result = await get_agent("senior").ainvoke(
+            {"messages": [HumanMessage(content=_draft_task(state, config))]}
+        )
+        return _draft_result(state, result)
+    except Exception as e:
+        logger.warning(f"⚠️ 综合报告草稿失败，评议后完整综合: {e}")
+        return None
+
+
+def _draft_update(draft: Optional[SynthesisDraft]) -> Dict[str, Any]:
+    return {"synthesis_draft": draft} if draft is not None else {}
+
+
+def _build_patch_task(
+    state: MultiAgentState,
+    draft: SynthesisDraft,
+    config: Optional[RunnableConfig] = None,
+) -> str:
+    """修订任务：草稿 + 评议意见 + 起草后被修订过的分析，控制在综合上下文预算内"""
+    sections = [
+        (_reviewer_header(feedback.agent_name), _format_feedback_summary(feedback))
+        for feedback in state.get("agent_feedbacks") or []
+    ]
+    hashes = _analysis_hashes(state)
+    revised = [
+        key
+        for key, digest in hashes.items()
+        if draft.analysis_hashes.get(key) != digest
+    ]
+    latest = _latest_analyses(state)
+    sections.extend(
+        (f"{ANALYST_SPECS[key].analysis_label}（修订后）", latest[key])
+        for key in revised
+    )
+    sections = fit_sections(
+        sections, Configuration.from_runnable_config(config).synthesis_token_budget
+    )
+    return SYNTHESIS_PATCH_TEMPLATE.format(
+        revised_hint="和分析师修订后的分析" if revised else "",
+        draft=draft.report,
+        context="\n\n".join(f"【{title}】\n{body}" for title, body in sections),
+    )
+
+
+def _patch_success(draft: SynthesisDraft, patch_output: str) -> Dict[str, Any]:
+    """将修订编辑应用到草稿；编辑列表为空时草稿即为最终报告
+
+    输出无法解析或编辑全部无法应用时抛出ValueError，由调用方改为完整综合，避免丢弃评议意见。
+    """
+    edits, append = parse_revision_edits(patch_output)
+    report, applied = _apply_edits(draft.report, edits, append)
+    if edits and not applied and not append:
+        raise ValueError("修订编辑均无法应用到草稿")
+    if report == draft.report:
+        logger.info("✅ 评议意见未要求修改草稿，直接采用")
+    return _synthesis_success(report)
+
+
+def _all_reviewers_approve(state: MultiAgentState, threshold: float) -> bool:
+    """所有评审人均以高置信度给出approval"""
+    feedbacks = state.get("agent_feedbacks") or []
+    return bool(feedbacks) and all(
+        feedback.feedback_type == "approval" and feedback.confidence_score >= threshold
+        for feedback in feedbacks
+    )
+
+
+def consensus_check_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
     """共识检查节点"""
-    
     logger.info("🔍 检查Agent共识状态")
-    
+
     revision_count = state.get("revision_count", 0)
-    
+    configuration = Configuration.from_runnable_config(config)
+
     # 简单的共识检查逻辑
-    if revision_count < 2:  # 最多允许2轮修订
+    if _all_reviewers_approve(state, configuration.approval_confidence_threshold):
+        consensus_reached = True  # 评审人一致高置信度认可，无需再修订
+        logger.info("✅ 共识达成 - 所有评审人高置信度认可")
+    elif revision_count < 2:  # 最多允许2轮修订
         # 检查是否需要进一步修订
         final_report = state.get("final_report", "")
-        
+
         if len(final_report) > 500:  # 简单的质量检查
             consensus_reached = True
             logger.info("✅ 共识达成 - 报告质量满足要求")
@@ -729,105 +2427,453 @@ def consensus_check_node(state: MultiAgentState) -> Dict[str, Any]:
     else:
         consensus_reached = True  # 超过修订次数限制，强制达成共识
         logger.info("✅ 共识达成 - 已达到最大修订次数")
-    
+
+    revision_targets = None
+    if not consensus_reached and configuration.revision_mode == "targeted":
+        # 没有待处理建议时综合的输入未变，重新综合只是重复调用：改为整轮重新评议（修订后的分析）
+        revision_targets = identify_revision_targets(state) or None
+        logger.info(
+            f"🎯 定向修订目标: {', '.join(revision_targets or []) or '无（改为整轮重新评议）'}"
+        )
+
     return {
         "consensus_reached": consensus_reached,
         "revision_count": revision_count,
-        "workflow_stage": "consensus_checked"
+        "revision_targets": revision_targets,
+        "workflow_stage": "consensus_checked",
     }
 
+
+# ============= 分析师修订 =============
+# 同行评议后，每位分析师只收到写给自己的改进建议，以查找/替换编辑的形式增量修订自己的分析（并发执行），
+# 高级综合读取修订后的最新分析；已处理的建议从评审意见中移除。
+# 定向修订模式下，共识检查挑出仍有未处理建议的分析师，同样只修订这些分析并直接重新综合，复用其余评议
+
+REVISION_TASK_TEMPLATE = """
+    请根据同行评议意见修订你之前的分析：保留正确的内容，只修改评审指出的问题。
+    
+    分析请求: {query}
+    
+    你之前的分析:
+    {analysis}
+    
+    评审意见:
+    {feedback}
+    
+    不要重写全文，只输出一个```json代码块描述修改：
+    {{
+      "edits": [{{"find": "原分析中需要修改的原文片段（逐字摘录）", "replace": "修改后的内容"}}],
+      "append": "需要补充在分析末尾的新内容，没有时为空字符串"
+    }}
+    """
+
+
+def _feedback_for(state: MultiAgentState, analyst: str) -> List[str]:
+    """收集各评审人写给指定分析师的改进建议"""
+    return [
+        f"- [{_reviewer_header(feedback.agent_name)}] {item}"
+        for feedback in state.get("agent_feedbacks") or []
+        for item in feedback.improvements_by_agent.get(analyst, [])
+    ]
+
+
+def identify_revision_targets(state: MultiAgentState) -> List[str]:
+    """找出有有效分析且收到改进建议的分析师"""
+    latest = _latest_analyses(state)
+    return [key for key in ANALYST_SPECS if key in latest and _feedback_for(state, key)]
+
+
+def _build_revision_task(state: MultiAgentState, analyst: str) -> str:
+    return REVISION_TASK_TEMPLATE.format(
+        query=_get_query(state),
+        analysis=_latest_analyses(state)[analyst],
+        feedback="\n".join(_feedback_for(state, analyst)),
+    )
+
+
+def parse_revision_edits(revision_output: str) -> Tuple[List[Dict[str, Any]], str]:
+    """解析修订输出中的查找/替换编辑与追加内容，没有可解析的JSON编辑块时抛出ValueError"""
+    matches = _JSON_BLOCK_PATTERN.findall(revision_output)
+    if not matches:
+        raise ValueError("修订输出中没有JSON编辑块")
+    data = json.loads(matches[-1])
+    edits = data.get("edits") or []
+    if not isinstance(edits, list):
+        raise ValueError("edits不是列表")
+    return [edit for edit in edits if isinstance(edit, dict)], str(
+        data.get("append") or ""
+    ).strip()
+
+
+def _apply_edits(
+    text: str, edits: List[Dict[str, Any]], append: str
+) -> Tuple[str, int]:
+    """依次应用编辑与追加内容，返回修改后的文本与成功应用的编辑数"""
+    applied = 0
+    for edit in edits:
+        find = str(edit.get("find", ""))
+        if find and find in text:
+            text = text.replace(find, str(edit.get("replace", "")), 1)
+            applied += 1
+        elif find:
+            logger.warning(
+                f"⚠️ 修订片段在原文中不存在，已跳过: {truncate_to_tokens(find, 30)}"
+            )
+    if append:
+        text = f"{text}\n\n{append}"
+    return text, applied
+
+
+def apply_revision_edits(analysis: str, revision_output: str) -> Optional[str]:
+    """将修订输出中的查找/替换编辑应用到原分析，无法解析或没有可应用的修改时返回None"""
+    try:
+        edits, append = parse_revision_edits(revision_output)
+    except ValueError:
+        return None
+    revised, _ = _apply_edits(analysis, edits, append)
+    return revised if revised != analysis else None
+
+
+def _revision_outcome(
+    state: MultiAgentState,
+    analyst: str,
+    result: Any = None,
+    error: Optional[Exception] = None,
+) -> Optional[str]:
+    """修订成功返回新分析；失败或没有有效修改时保留原分析（不写入失败记录）"""
+    spec = ANALYST_SPECS[analyst]
+    if error is not None:
+        logger.error(f"❌ {spec.analysis_label}修订失败，保留原分析: {error}")
+        return None
+    revised = apply_revision_edits(
+        _latest_analyses(state)[analyst], result["messages"][-1].content
+    )
+    if revised is None:
+        logger.warning(f"⚠️ {spec.analysis_label}修订没有可应用的修改，保留原分析")
+        return None
+    logger.info(f"✅ {spec.analysis_label}修订完成")
+    return revised
+
+
+def _revise_analyses(
+    state: MultiAgentState, targets: List[str], config: Optional[RunnableConfig]
+) -> Dict[str, Optional[str]]:
+    """并发修订多位分析师的分析（同步）"""
+    timeout = Configuration.from_runnable_config(config).analyst_timeout_seconds
+
+    def revise(analyst: str) -> Optional[str]:
+        task = _build_revision_task(state, analyst)
+        try:
+            agent = get_agent(ANALYST_SPECS[analyst].agent_key)
+            result = _invoke_with_timeout(
+                agent, {"messages": [HumanMessage(content=task)]}, timeout
+            )
+            return _revision_outcome(state, analyst, result)
+        except Exception as e:
+            return _revision_outcome(state, analyst, error=e)
+
+    if not targets:
+        return {}
+    with ContextThreadPoolExecutor(max_workers=len(targets)) as executor:
+        return dict(zip(targets, executor.map(revise, targets)))
+
+
+async def _arevise_analyses(
+    state: MultiAgentState, targets: List[str], config: Optional[RunnableConfig]
+) -> Dict[str, Optional[str]]:
+    """并发修订多位分析师的分析（异步）"""
+    timeout = Configuration.from_runnable_config(config).analyst_timeout_seconds
+
+    async def revise(analyst: str) -> Optional[str]:
+        task = _build_revision_task(state, analyst)
+        try:
+            agent = get_agent(ANALYST_SPECS[analyst].agent_key)
+            result = await _ainvoke_with_timeout(
+                agent, {"messages": [HumanMessage(content=task)]}, timeout
+            )
+            return _revision_outcome(state, analyst, result)
+        except Exception as e:
+            return _revision_outcome(state, analyst, error=e)
+
+    revisions = await asyncio.gather(*(revise(analyst) for analyst in targets))
+    return dict(zip(targets, revisions))
+
+
+def _addressed_feedbacks(
+    state: MultiAgentState, revised: List[str]
+) -> List[AgentFeedback]:
+    """从评审意见中移除已被修订处理的改进建议"""
+    feedbacks = []
+    for feedback in state.get("agent_feedbacks") or []:
+        remaining = {
+            key: items
+            for key, items in feedback.improvements_by_agent.items()
+            if key not in revised
+        }
+        feedbacks.append(
+            feedback.model_copy(
+                update={
+                    "improvements_by_agent": remaining,
+                    "suggested_improvements": [
+                        item for items in remaining.values() for item in items
+                    ],
+                }
+            )
+        )
+    return feedbacks
+
+
+def _revision_result(
+    state: MultiAgentState, revisions: Dict[str, Optional[str]], stage: str
+) -> Dict[str, Any]:
+    revised = [key for key, content in revisions.items() if content is not None]
+    messages = [
+        AIMessage(
+            content=format_analysis_output(
+                f"{ANALYST_SPECS[key].report_title}（修订）",
+                revisions[key],
+                ANALYST_SPECS[key].agent_name,
+            )
+        )
+        for key in revised
+    ]
+    return {
+        "messages": messages,
+        "analyses": [
+            f"{ANALYST_SPECS[key].analysis_label}: {revisions[key]}" for key in revised
+        ],
+        "agent_feedbacks": _addressed_feedbacks(state, revised),
+        "revision_targets": [],
+        "workflow_stage": stage,
+    }
+
+
+def _analyst_revision_targets(
+    state: MultiAgentState, config: Optional[RunnableConfig]
+) -> List[str]:
+    if not Configuration.from_runnable_config(config).analyst_revision_enabled:
+        return []
+    targets = identify_revision_targets(state)
+    logger.info(f"✏️ 分析师按评议修订: {', '.join(targets) or '没有收到改进建议的分析'}")
+    return targets
+
+
+def analyst_revision_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """分析师修订节点 - 各分析师按写给自己的评审意见增量修订（并发执行）"""
+    targets = _analyst_revision_targets(state, config)
+    if not targets:
+        return {"workflow_stage": "analyst_revision_skipped"}
+    return _revision_result(
+        state, _revise_analyses(state, targets, config), "analyst_revision_completed"
+    )
+
+
+async def aanalyst_revision_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """分析师修订节点（异步）"""
+    targets = _analyst_revision_targets(state, config)
+    if not targets:
+        return {"workflow_stage": "analyst_revision_skipped"}
+    return _revision_result(
+        state,
+        await _arevise_analyses(state, targets, config),
+        "analyst_revision_completed",
+    )
+
+
+def targeted_revision_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """定向修订节点 - 只重新调用共识检查挑出的分析师（并发执行）"""
+    targets = state.get("revision_targets") or []
+    logger.info(f"✏️ 定向修订开始: {', '.join(targets)}")
+    return _revision_result(
+        state, _revise_analyses(state, targets, config), "targeted_revision_completed"
+    )
+
+
+async def atargeted_revision_node(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """定向修订节点（异步）"""
+    targets = state.get("revision_targets") or []
+    logger.info(f"✏️ 定向修订开始: {', '.join(targets)}")
+    return _revision_result(
+        state,
+        await _arevise_analyses(state, targets, config),
+        "targeted_revision_completed",
+    )
+
+
 # ============= 路由条件函数 =============
 
+
 def check_consensus_routing(state: MultiAgentState) -> str:
     """检查是否达成共识"""
     if state.get("consensus_reached", False):
         logger.info("🎯 工作流程完成，准备输出最终结果")
         return END
-    else:
-        logger.info("🔄 未达成共识，继续修订流程")
-        return "peer_review"  # 继续修订流程
+    if state.get("revision_targets"):
+        logger.info("🔄 未达成共识，定向修订相关分析")
+        return "targeted_revision"
+    logger.info("🔄 未达成共识，继续修订流程")
+    return "peer_review"  # 继续修订流程
+
+
+def check_analyses_completion(
+    state: MultiAgentState, config: Optional[RunnableConfig] = None
+) -> str:
+    """根据汇聚节点的判定决定进入同行评议或终止（流水线模式已完成评议，直接进入修订）"""
+    if state.get("workflow_stage") == "analyses_insufficient":
+        return "insufficient_analyses"
+    if (
+        Configuration.from_runnable_config(config).analysis_mode == "pipelined"
+        and state.get("agent_feedbacks") is not None
+    ):
+        return "analyst_revision"
+    return "peer_review"
 
-def check_analyses_completion(state: MultiAgentState) -> str:
-    """检查所有分析是否完成"""
-    completion_status = state.get("completion_status", {})
-    completed = [completion_status.get("fundamental", False), 
-                completion_status.get("technical", False), 
-                completion_status.get("risk", False)]
-    
-    if all(completed):
-        logger.info("✅ 所有分析已完成，进入同行评议")
-        return "peer_review"
-    else:
-        missing = []
-        if not completion_status.get("fundamental", False):
-            missing.append("基本面分析")
-        if not completion_status.get("technical", False):
-            missing.append("技术分析") 
-        if not completion_status.get("risk", False):
-            missing.append("风险分析")
-        logger.info(f"⏳ 等待分析完成，缺少: {', '.join(missing)}")
-        return "wait_for_analyses"
 
 # ============= 构建多Agent工作流图 =============
 
-def build_multi_agent_graph():
-    """构建多Agent协作工作流图"""
+
+def _dual_node(
+    name: str, func: Callable[..., Any], afunc: Callable[..., Any]
+) -> RunnableLambda:
+    """将同步与异步实现组合为同一个图节点（两条路径都记录节点指标）"""
+    return RunnableLambda(
+        instrument_node(name, func), afunc=instrument_node(name, afunc), name=name
+    )
+
+
+def build_multi_agent_graph(checkpointer: Optional[BaseCheckpointSaver] = None):
+    """构建多Agent协作工作流图；传入checkpointer时每个超步写入检查点，可从中断处续跑（见 agent.checkpoint）"""
     builder = StateGraph(MultiAgentState)
-    
+
     # 添加节点
-    builder.add_node("coordinator", coordinator_node)
-    builder.add_node("fundamental_analysis", fundamental_analysis_node)
-    builder.add_node("technical_analysis", technical_analysis_node) 
-    builder.add_node("risk_analysis", risk_analysis_node)
-    builder.add_node("wait_for_analyses", wait_for_analyses_node)  # 新增汇聚节点
-    builder.add_node("peer_review", peer_review_node)
-    builder.add_node("senior_synthesis", senior_synthesis_node)
-    builder.add_node("consensus_check", consensus_check_node)
-    
+    builder.add_node("coordinator", instrument_node("coordinator", coordinator_node))
+    builder.add_node(
+        "prefetch_data",
+        _dual_node("prefetch_data", prefetch_data_node, aprefetch_data_node),
+    )
+    builder.add_node(
+        "plan_analysis",
+        _dual_node("plan_analysis", plan_analysis_node, aplan_analysis_node),
+    )
+    builder.add_node(
+        "execute_plan",
+        _dual_node("execute_plan", execute_plan_node, aexecute_plan_node),
+    )
+    builder.add_node(
+        "pipelined_analysis",
+        _dual_node(
+            "pipelined_analysis", pipelined_analysis_node, apipelined_analysis_node
+        ),
+    )
+    # 分析师节点同时提供同步/异步实现：invoke走同步路径，ainvoke走异步路径不占用工作线程
+    builder.add_node(
+        "fundamental_analysis",
+        _dual_node(
+            "fundamental_analysis",
+            fundamental_analysis_node,
+            afundamental_analysis_node,
+        ),
+    )
+    builder.add_node(
+        "technical_analysis",
+        _dual_node(
+            "technical_analysis", technical_analysis_node, atechnical_analysis_node
+        ),
+    )
+    builder.add_node(
+        "risk_analysis",
+        _dual_node("risk_analysis", risk_analysis_node, arisk_analysis_node),
+    )
+    builder.add_node(
+        "wait_for_analyses",
+        instrument_node("wait_for_analyses", wait_for_analyses_node),
+    )  # 汇聚节点
+    builder.add_node(
+        "insufficient_analyses",
+        instrument_node("insufficient_analyses", insufficient_analyses_node),
+    )
+    builder.add_node(
+        "peer_review", _dual_node("peer_review", peer_review_node, apeer_review_node)
+    )
+    builder.add_node(
+        "senior_synthesis",
+        _dual_node("senior_synthesis", senior_synthesis_node, asenior_synthesis_node),
+    )
+    builder.add_node(
+        "consensus_check", instrument_node("consensus_check", consensus_check_node)
+    )
+    builder.add_node(
+        "analyst_revision",
+        _dual_node("analyst_revision", analyst_revision_node, aanalyst_revision_node),
+    )
+    builder.add_node(
+        "targeted_revision",
+        _dual_node(
+            "targeted_revision", targeted_revision_node, atargeted_revision_node
+        ),
+    )
+
     # 设置入口点
     builder.add_edge(START, "coordinator")
-    
-    # 修复：使用正确的并行边设置
-    # 协调器完成后，启动三个并行的分析任务
-    builder.add_edge("coordinator", "fundamental_analysis")
-    builder.add_edge("coordinator", "technical_analysis")
-    builder.add_edge("coordinator", "risk_analysis")
-    
-    # 所有分析完成后都流向等待节点
-    builder.add_edge("fundamental_analysis", "wait_for_analyses")
-    builder.add_edge("technical_analysis", "wait_for_analyses") 
-    builder.add_edge("risk_analysis", "wait_for_analyses")
-    
-    # 等待节点根据完成状态决定下一步
+
+    # 协调器完成后先预取共用数据，再启动三个并行的分析任务（计划模式下改为先规划再按依赖执行）
+    builder.add_edge("coordinator", "prefetch_data")
+    builder.add_conditional_edges(
+        "prefetch_data",
+        route_analysis_mode,
+        ANALYST_NODES + ["plan_analysis", "pipelined_analysis"],
+    )
+    builder.add_edge("plan_analysis", "execute_plan")
+
+    # 汇聚屏障：三个分析节点都结束后才执行一次等待节点（失败/超时也算结束，不再自循环）
+    builder.add_edge(ANALYST_NODES, "wait_for_analyses")
+    # 计划模式的执行节点、流水线节点结束后直接进入汇聚节点
+    builder.add_edge("execute_plan", "wait_for_analyses")
+    builder.add_edge("pipelined_analysis", "wait_for_analyses")
+
+    # 满足法定数量进入同行评议，否则输出失败报告并结束
     builder.add_conditional_edges(
         "wait_for_analyses",
         check_analyses_completion,
         {
             "peer_review": "peer_review",
-            "wait_for_analyses": "wait_for_analyses"  # 继续等待
-        }
+            "analyst_revision": "analyst_revision",
+            "insufficient_analyses": "insufficient_analyses",
+        },
     )
-    
-    # 评议后进行高级综合
-    builder.add_edge("peer_review", "senior_synthesis")
-    
+    builder.add_edge("insufficient_analyses", END)
+
+    # 评议后各分析师按意见修订，再进行高级综合
+    builder.add_edge("peer_review", "analyst_revision")
+    builder.add_edge("analyst_revision", "senior_synthesis")
+
     # 综合后检查共识
     builder.add_edge("senior_synthesis", "consensus_check")
-    
+
     # 条件边：根据共识情况决定是否结束
     builder.add_conditional_edges(
         "consensus_check",
         check_consensus_routing,
         {
             END: END,
-            "peer_review": "peer_review"  # 未达成共识时继续评议
-        }
+            "peer_review": "peer_review",  # 未达成共识时继续评议
+            "targeted_revision": "targeted_revision",  # 定向修订模式：只修订收到改进建议的分析
+        },
     )
-    
-    return builder.compile()
+    builder.add_edge("targeted_revision", "senior_synthesis")
+
+    return builder.compile(checkpointer=checkpointer)
 
 
 # sample_query = "请分析腾讯控股(0700.HK)的投资价值，我想了解其基本面、技术面以及风险评估"
 
 # 构建图实例供外部调用
-graph = build_multi_agent_graph()
\ No newline at end of file
+graph = build_multi_agent_graph()
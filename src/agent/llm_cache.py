@@ -0,0 +1,185 @@
+"""磁盘持久化的LLM响应精确匹配缓存（SQLite，LRU淘汰 + TTL）。"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+logger = logging.getLogger(__name__)
+
+
+# 不会发送给模型、但每次运行都会变化的消息字段：add_messages生成的随机uuid，
+# 以及响应元数据（缓存命中时usage_metadata会被改写为total_cost=0）
+_VOLATILE_MESSAGE_FIELDS = ("id", "usage_metadata", "response_metadata")
+
+
+def _strip_volatile_fields(node: Any) -> Any:
+    """移除序列化消息中与请求内容无关的易变字段"""
+    if isinstance(node, list):
+        return [_strip_volatile_fields(item) for item in node]
+    if isinstance(node, dict):
+        if node.get("type") == "constructor" and isinstance(node.get("kwargs"), dict):
+            kwargs = {
+                k: v
+                for k, v in node["kwargs"].items()
+                if k not in _VOLATILE_MESSAGE_FIELDS
+            }
+            return {**node, "kwargs": _strip_volatile_fields(kwargs)}
+        return {k: _strip_volatile_fields(v) for k, v in node.items()}
+    return node
+
+
+def make_cache_key(prompt: str, llm_string: str) -> str:
+    """由完整消息列表与模型参数（含模型名、采样参数、绑定的工具schema）生成缓存键"""
+    try:
+        prompt = json.dumps(
+            _strip_volatile_fields(json.loads(prompt)),
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+    except ValueError:
+        pass
+    return hashlib.sha256(f"{llm_string}\n{prompt}".encode()).hexdigest()
+
+
+class SQLiteResponseCache(BaseCache):
+    """按总字节数做LRU淘汰、按TTL过期的SQLite响应缓存"""
+
+    def __init__(
+        self,
+        database_path: str,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        """初始化SQLite缓存路径、过期时间与容量上限"""
+        self.database_path = database_path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(database_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(database_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)"
+        )
+        self._conn.commit()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """查询缓存，过期条目视为未命中并删除"""
+        key = make_cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl_seconds is not None and created_at + self.ttl_seconds <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+        return _loads_generations(value)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """写入缓存并按容量上限淘汰最久未访问的条目"""
+        value = _dumps_generations(return_val)
+        if value is None:
+            return
+        key = make_cache_key(prompt, llm_string)
+        size = len(value.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE created_at <= ?",
+                (time.time() - self.ttl_seconds,),
+            )
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM llm_cache ORDER BY last_access"
+        ).fetchall():
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self, **kwargs: Any) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+
+def _dumps_generations(generations: Sequence[Generation]) -> Optional[str]:
+    if not all(isinstance(gen, ChatGeneration) for gen in generations):
+        return None
+    return json.dumps(
+        [
+            {
+                "message": message_to_dict(gen.message),
+                "generation_info": gen.generation_info,
+            }
+            for gen in generations
+        ],
+        ensure_ascii=False,
+    )
+
+
+def _loads_generations(value: str) -> Optional[RETURN_VAL_TYPE]:
+    try:
+        return [
+            ChatGeneration(
+                message=messages_from_dict([item["message"]])[0],
+                generation_info=item.get("generation_info"),
+            )
+            for item in json.loads(value)
+        ]
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning(f"LLM缓存条目无法解析，按未命中处理: {e}")
+        return None
+
+
+def create_llm_cache_from_env() -> Optional[SQLiteResponseCache]:
+    """按环境变量创建响应缓存；未设置 LLM_CACHE_PATH 时不启用"""
+    path = os.getenv("LLM_CACHE_PATH")
+    if not path:
+        return None
+    ttl = os.getenv("LLM_CACHE_TTL_SECONDS")
+    cache = SQLiteResponseCache(
+        path,
+        ttl_seconds=float(ttl) if ttl else 7 * 24 * 3600,
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    )
+    logger.info(f"💾 已启用LLM响应缓存: {path}")
+    return cache
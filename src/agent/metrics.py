@@ -0,0 +1,356 @@
+"""运行指标：节点耗时、LLM/工具调用耗时、排队时间、token用量与费用，按节点汇总p50/p95/p99。"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+
+from agent.configuration import load_environment
+
+logger = logging.getLogger(__name__)
+
+
+class ModelPricing(NamedTuple):
+    """每百万token的价格（美元）"""
+
+    input_cache_hit: float
+    input_cache_miss: float
+    output: float
+
+
+# deepseek-chat 官方标价
+DEEPSEEK_PRICING = ModelPricing(
+    input_cache_hit=0.028, input_cache_miss=0.28, output=0.42
+)
+
+# 当前正在执行的图节点，LLM/工具调用的指标归属到该节点
+_current_node: ContextVar[Optional[str]] = ContextVar(
+    "agent_current_node", default=None
+)
+# 节点内创建的所有回调管理器（包括ReAct Agent内部）都会自动挂上该handler
+_metrics_handler: ContextVar[Optional["MetricsCallbackHandler"]] = ContextVar(
+    "agent_metrics_handler", default=None
+)
+register_configure_hook(_metrics_handler, inheritable=True)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值计算分位数（q取0-100）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class _Series:
+    """单个指标键（如 node:peer_review）的样本与累计值"""
+
+    def __init__(self, max_samples: int):
+        """创建指标序列，耗时样本最多保留 max_samples 个"""
+        self.durations: Deque[float] = deque(maxlen=max_samples)
+        self.queue_waits: Deque[float] = deque(maxlen=max_samples)
+        self.counters: Dict[str, float] = {}
+
+    def add(self, field: str, amount: float = 1) -> None:
+        """累加计数器（调用方持有锁）"""
+        self.counters[field] = self.counters.get(field, 0) + amount
+
+
+class MetricsRecorder:
+    """进程内指标汇总（线程安全），每个键最多保留 max_samples 个耗时样本"""
+
+    def __init__(
+        self, pricing: ModelPricing = DEEPSEEK_PRICING, max_samples: int = 10000
+    ):
+        """创建指标汇总器，按 pricing 估算调用成本"""
+        self.pricing = pricing
+        self.max_samples = max_samples
+        self._series: Dict[str, _Series] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> _Series:
+        """获取或创建指标键对应的序列（调用方持有锁）"""
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series(self.max_samples)
+        return series
+
+    def record_duration(self, key: str, seconds: float, error: bool = False) -> None:
+        """记录一次节点/工具调用耗时"""
+        with self._lock:
+            series = self._get(key)
+            series.durations.append(seconds)
+            series.add("count")
+            if error:
+                series.add("errors")
+
+    def record_llm(
+        self,
+        key: str,
+        seconds: float,
+        queue_seconds: Optional[float] = None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cache_hit_tokens: int = 0,
+        cached: bool = False,
+    ) -> None:
+        """记录一次LLM调用；cached表示由本地响应缓存直接返回（不计token与费用）"""
+        with self._lock:
+            series = self._get(key)
+            series.durations.append(seconds)
+            series.add("count")
+            if cached:
+                series.add("cached_responses")
+                return
+            if queue_seconds is not None:
+                series.queue_waits.append(queue_seconds)
+            series.add("prompt_tokens", prompt_tokens)
+            series.add("completion_tokens", completion_tokens)
+            series.add("prompt_cache_hit_tokens", cache_hit_tokens)
+            series.add(
+                "cost_usd",
+                (
+                    cache_hit_tokens * self.pricing.input_cache_hit
+                    + (prompt_tokens - cache_hit_tokens) * self.pricing.input_cache_miss
+                    + completion_tokens * self.pricing.output
+                )
+                / 1_000_000,
+            )
+
+    def record_count(self, key: str, field: str) -> None:
+        """累加计数（如 retries、errors）"""
+        with self._lock:
+            self._get(key).add(field)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """按键返回次数、累计值与耗时/排队时间的p50/p95/p99（秒）"""
+        with self._lock:
+            snapshot = {
+                key: (list(s.durations), list(s.queue_waits), dict(s.counters))
+                for key, s in self._series.items()
+            }
+        result: Dict[str, Dict[str, Any]] = {}
+        for key, (durations, queue_waits, counters) in sorted(snapshot.items()):
+            entry: Dict[str, Any] = {**counters}
+            for q in (50, 95, 99):
+                entry[f"p{q}"] = percentile(durations, q)
+            if queue_waits:
+                for q in (50, 95, 99):
+                    entry[f"queue_p{q}"] = percentile(queue_waits, q)
+            result[key] = entry
+        return result
+
+    def clear(self) -> None:
+        """清空所有指标"""
+        with self._lock:
+            self._series.clear()
+
+
+def _usage_from_result(response: LLMResult) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """取出首个generation的 usage_metadata 与 response_metadata"""
+    try:
+        message = response.generations[0][0].message  # type: ignore[attr-defined]
+    except (IndexError, AttributeError):
+        return {}, {}
+    return dict(getattr(message, "usage_metadata", None) or {}), dict(
+        message.response_metadata or {}
+    )
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """将LLM/工具调用的耗时与用量写入 MetricsRecorder"""
+
+    run_inline = True
+
+    def __init__(self, recorder: MetricsRecorder):
+        """创建回调处理器，指标写入 recorder"""
+        self.recorder = recorder
+        self._starts: Dict[UUID, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, key: str) -> None:
+        """记录调用开始时间"""
+        with self._lock:
+            self._starts[run_id] = (key, time.perf_counter())
+
+    def _finish(self, run_id: UUID) -> Optional[Tuple[str, float]]:
+        """结束计时，返回指标键与耗时；未记录开始时间时返回None"""
+        with self._lock:
+            started = self._starts.pop(run_id, None)
+        if started is None:
+            return None
+        return started[0], time.perf_counter() - started[1]
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        """聊天模型调用开始时计时"""
+        self._start(run_id, f"llm:{_current_node.get() or 'unknown'}")
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        """LLM调用开始时计时"""
+        self._start(run_id, f"llm:{_current_node.get() or 'unknown'}")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        """LLM调用结束时记录耗时、排队时间、token用量与缓存命中"""
+        finished = self._finish(run_id)
+        if finished is None:
+            return
+        key, seconds = finished
+        usage, metadata = _usage_from_result(response)
+        # langchain在缓存命中时将 total_cost 置0，真实响应不含该字段
+        if usage.get("total_cost") == 0:
+            self.recorder.record_llm(key, seconds, cached=True)
+            return
+        # DeepSeek在 token_usage.prompt_cache_hit_tokens 中返回服务端上下文缓存命中数
+        token_usage = metadata.get("token_usage") or {}
+        cache_hit = token_usage.get("prompt_cache_hit_tokens")
+        if cache_hit is None:
+            cache_hit = (usage.get("input_token_details") or {}).get("cache_read", 0)
+        self.recorder.record_llm(
+            key,
+            seconds,
+            queue_seconds=metadata.get("queue_wait_seconds"),
+            prompt_tokens=usage.get("input_tokens", 0),
+            completion_tokens=usage.get("output_tokens", 0),
+            cache_hit_tokens=cache_hit or 0,
+        )
+
+    def on_llm_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        """LLM调用失败时记录耗时与错误"""
+        finished = self._finish(run_id)
+        if finished is not None:
+            self.recorder.record_duration(finished[0], finished[1], error=True)
+
+    def on_tool_start(
+        self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        """工具调用开始时计时"""
+        self._start(
+            run_id,
+            f"tool:{(serialized or {}).get('name') or kwargs.get('name') or 'unknown'}",
+        )
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        """工具调用结束时记录耗时"""
+        finished = self._finish(run_id)
+        if finished is not None:
+            self.recorder.record_duration(*finished)
+
+    def on_tool_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        """工具调用失败时记录耗时与错误"""
+        finished = self._finish(run_id)
+        if finished is not None:
+            self.recorder.record_duration(finished[0], finished[1], error=True)
+
+    def on_retry(self, retry_state: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        """记录所在节点的重试次数"""
+        self.recorder.record_count(
+            f"node:{_current_node.get() or 'unknown'}", "retries"
+        )
+
+
+_recorder: Optional[MetricsRecorder] = None
+_handler: Optional[MetricsCallbackHandler] = None
+_metrics_configured = False
+
+
+def get_metrics() -> Optional[MetricsRecorder]:
+    """获取进程级指标汇总（AGENT_METRICS_ENABLED=false 时禁用）"""
+    global _metrics_configured
+    if not _metrics_configured:
+        load_environment()
+        enabled = os.getenv("AGENT_METRICS_ENABLED", "true").lower() not in (
+            "0",
+            "false",
+            "no",
+        )
+        set_metrics(MetricsRecorder() if enabled else None)
+    return _recorder
+
+
+def set_metrics(recorder: Optional[MetricsRecorder]) -> None:
+    """替换进程级指标汇总（传入 None 禁用）"""
+    global _recorder, _handler, _metrics_configured
+    _recorder = recorder
+    _handler = MetricsCallbackHandler(recorder) if recorder is not None else None
+    _metrics_configured = True
+
+
+def metrics_summary() -> Dict[str, Dict[str, Any]]:
+    """返回当前的指标汇总"""
+    recorder = get_metrics()
+    return recorder.summary() if recorder is not None else {}
+
+
+@contextmanager
+def _node_scope(name: str) -> Iterator[None]:
+    """在节点执行期间记录耗时，并将其中的LLM/工具调用归属到该节点"""
+    recorder = get_metrics()
+    if recorder is None:
+        yield
+        return
+    node_token = _current_node.set(name)
+    handler_token = _metrics_handler.set(_handler)
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        recorder.record_duration(
+            f"node:{name}", time.perf_counter() - start, error=error
+        )
+        _metrics_handler.reset(handler_token)
+        _current_node.reset(node_token)
+
+
+def instrument_node(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    """为节点函数记录耗时，并将节点内的LLM/工具调用指标归属到该节点"""
+    if asyncio.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def awrapper(*args: Any, **kwargs: Any) -> Any:
+            with _node_scope(name):
+                return await func(*args, **kwargs)
+
+        return awrapper
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with _node_scope(name):
+            return func(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,139 @@
+"""用户查询解析：提取股票代码与分析意图，生成规范化查询键。"""
+
+import re
+from typing import List, Optional
+
+# A股/港股/美股代码：600519.SH、000001.SZ、0700.HK、AAPL、BRK.B
+_TICKER_PATTERNS = [
+    re.compile(r"(?<![0-9A-Za-z])(\d{6})\.?(SH|SZ|BJ)?(?![0-9A-Za-z])", re.IGNORECASE),
+    re.compile(r"(?<![0-9A-Za-z])(\d{4,5})\.(HK)(?![0-9A-Za-z])", re.IGNORECASE),
+    re.compile(r"(?<![0-9A-Za-z])([A-Z]{1,5}(?:\.[A-Z])?)(?![0-9A-Za-z])"),
+]
+# 常见的非代码大写缩写
+_NON_TICKERS = {
+    "A",
+    "AI",
+    "ETF",
+    "PE",
+    "PB",
+    "PS",
+    "ROE",
+    "ROA",
+    "EPS",
+    "CEO",
+    "CFO",
+    "IPO",
+    "USD",
+    "CNY",
+    "HKD",
+    "VAR",
+    "MACD",
+    "RSI",
+    "KDJ",
+    "GDP",
+    "CPI",
+    "ESG",
+    "API",
+    "IT",
+    "OK",
+    "VS",
+}
+
+# 意图关键词，一个查询可以命中多个意图
+INTENT_KEYWORDS = {
+    "fundamental": (
+        "基本面",
+        "估值",
+        "财报",
+        "业绩",
+        "盈利",
+        "市盈率",
+        "市净率",
+        "PE",
+        "PB",
+        "ROE",
+        "EPS",
+    ),
+    "technical": (
+        "技术面",
+        "技术分析",
+        "走势",
+        "K线",
+        "均线",
+        "MACD",
+        "RSI",
+        "支撑",
+        "阻力",
+        "趋势",
+    ),
+    "risk": ("风险", "波动", "回撤", "VaR", "止损", "对冲"),
+    "portfolio": ("组合", "配置", "仓位", "权重", "分散"),
+}
+GENERAL_INTENT = "general"
+
+
+def extract_ticker(query: str) -> Optional[str]:
+    """提取查询中的第一个股票代码（统一大写），没有时返回None"""
+    for pattern in _TICKER_PATTERNS:
+        for match in pattern.finditer(query):
+            code = match.group(1).upper()
+            if code in _NON_TICKERS:
+                continue
+            suffix = (
+                match.group(2) if match.lastindex and match.lastindex >= 2 else None
+            )
+            return f"{code}.{suffix.upper()}" if suffix else code
+    return None
+
+
+def extract_tickers(query: str) -> List[str]:
+    """提取查询中的全部股票代码（统一大写、去重，按出现顺序）"""
+    found = []
+    for pattern in _TICKER_PATTERNS:
+        for match in pattern.finditer(query):
+            code = match.group(1).upper()
+            # 跳过与高优先级模式已匹配区间重叠的片段（如 600519.SH 中的 SH）
+            if code in _NON_TICKERS or any(
+                match.start() < end and start < match.end() for start, end, _ in found
+            ):
+                continue
+            suffix = (
+                match.group(2) if match.lastindex and match.lastindex >= 2 else None
+            )
+            found.append(
+                (
+                    match.start(),
+                    match.end(),
+                    f"{code}.{suffix.upper()}" if suffix else code,
+                )
+            )
+    tickers: List[str] = []
+    for _, _, ticker in sorted(found):
+        if ticker not in tickers:
+            tickers.append(ticker)
+    return tickers
+
+
+def detect_intents(query: str) -> List[str]:
+    """识别查询的分析意图（按名称排序），未命中任何关键词时为 general"""
+    folded = query.casefold()
+    intents = [
+        intent
+        for intent, keywords in INTENT_KEYWORDS.items()
+        if any(keyword.casefold() in folded for keyword in keywords)
+    ]
+    return sorted(intents) or [GENERAL_INTENT]
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本：去除标点、合并空白、忽略大小写"""
+    text = re.sub(r"[\s\W_]+", " ", query.casefold())
+    return text.strip()
+
+
+def query_key(query: str) -> str:
+    """查询键：有股票代码时为 全部代码（排序）+意图，否则为规范化后的文本"""
+    tickers = extract_tickers(query)
+    if not tickers:
+        return f"text:{normalize_query(query)}"
+    return f"{','.join(sorted(tickers))}:{'+'.join(detect_intents(query))}"
@@ -0,0 +1,380 @@
+"""进程级DeepSeek调用限流：请求/分钟与token/分钟令牌桶 + 最大并发数。"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+
+from agent.configuration import load_environment
+from agent.context import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """按分钟额度匀速补充的令牌桶，允许透支（实际用量超出预估时由后续请求偿还）"""
+
+    def __init__(self, per_minute: float):
+        """创建令牌桶，初始为满额"""
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """按流逝时间补充额度（调用方持有锁）"""
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def try_acquire(self, amount: float) -> float:
+        """尝试扣减额度：成功返回0，否则返回需要等待的秒数"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def adjust(self, amount: float) -> None:
+        """按实际用量修正额度（正数为补扣，负数为退还）"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class _SlotWaiter:
+    """等待并发槽位的调用方；槽位在线程与事件循环间共享，释放时直接移交给队首等待者"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """创建等待者：线程使用Event等待，协程使用所属事件循环的Future等待"""
+        self.loop = loop
+        self.granted = False
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self) -> bool:
+        """通知等待者已获得槽位，事件循环已关闭时返回False"""
+        if self.loop is None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(self._resolve)
+            return True
+        except RuntimeError:
+            return False
+
+    def _resolve(self) -> None:
+        """在等待者的事件循环中完成Future（已取消时忽略）"""
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ChatModelGovernor:
+    """所有Agent共享的限流器，记录排队等待时间"""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_in_flight: Optional[int] = None,
+    ):
+        """创建限流器，各项限制为None时不启用"""
+        self.request_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        )
+        self.max_in_flight = max_in_flight
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "queued_requests": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    def _take_slot(
+        self, loop: Optional[asyncio.AbstractEventLoop] = None
+    ) -> Optional[_SlotWaiter]:
+        """有空闲槽位时立即占用并返回None，否则排队（先到先得）并返回等待者"""
+        with self._lock:
+            if self.max_in_flight is None or (
+                self._in_flight < self.max_in_flight and not self._waiters
+            ):
+                self._in_flight += 1
+                return None
+            waiter = _SlotWaiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _release_slot(self) -> None:
+        """释放槽位：有等待者时直接移交（占用数不变），否则归还"""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                if waiter.wake():
+                    return
+            self._in_flight -= 1
+
+    def _abandon(self, waiter: _SlotWaiter) -> None:
+        """异步等待被取消：尚未获得槽位时移出队列，已获得则释放"""
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return
+        self._release_slot()
+
+    def _bucket_wait(self, estimated_tokens: int) -> float:
+        """依次检查请求桶与token桶，返回还需等待的秒数"""
+        if self.request_bucket is not None:
+            wait = self.request_bucket.try_acquire(1)
+            if wait:
+                return wait
+        if self.token_bucket is not None:
+            wait = self.token_bucket.try_acquire(estimated_tokens)
+            if wait:
+                if self.request_bucket is not None:
+                    self.request_bucket.adjust(-1)
+                return wait
+        return 0.0
+
+    def _record(self, waited: float) -> None:
+        """记录一次调用的排队等待时间"""
+        with self._lock:
+            self._stats["requests"] += 1
+            if waited > 0.001:
+                self._stats["queued_requests"] += 1
+            self._stats["total_wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(
+                self._stats["max_wait_seconds"], waited
+            )
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """请求完成后按实际token用量修正token桶"""
+        if self.token_bucket is not None and actual_tokens is not None:
+            self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+    @contextmanager
+    def acquire(self, estimated_tokens: int) -> Iterator[float]:
+        """同步获取调用许可，返回排队等待的秒数"""
+        start = time.monotonic()
+        waiter = self._take_slot()
+        if waiter is not None:
+            waiter.event.wait()
+        try:
+            while True:
+                wait = self._bucket_wait(estimated_tokens)
+                if not wait:
+                    break
+                time.sleep(wait)
+            waited = time.monotonic() - start
+            self._record(waited)
+            yield waited
+        finally:
+            self._release_slot()
+
+    @asynccontextmanager
+    async def aacquire(self, estimated_tokens: int) -> AsyncIterator[float]:
+        """异步获取调用许可，返回排队等待的秒数"""
+        start = time.monotonic()
+        waiter = self._take_slot(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        try:
+            while True:
+                wait = self._bucket_wait(estimated_tokens)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+            waited = time.monotonic() - start
+            self._record(waited)
+            yield waited
+        finally:
+            self._release_slot()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回排队统计"""
+        with self._lock:
+            stats = dict(self._stats, in_flight=self._in_flight)
+        stats["mean_wait_seconds"] = (
+            stats["total_wait_seconds"] / stats["requests"]
+            if stats["requests"]
+            else 0.0
+        )
+        return stats
+
+
+def _estimate_prompt_tokens(messages: List[BaseMessage]) -> int:
+    """按内容长度估算请求的输入token数（每条消息另加4个格式token）"""
+    return sum(estimate_tokens(str(message.content)) + 4 for message in messages)
+
+
+def _actual_tokens(result: ChatResult) -> Optional[int]:
+    """读取响应中的实际token用量，模型未返回用量时为None"""
+    usage = (
+        getattr(result.generations[0].message, "usage_metadata", None)
+        if result.generations
+        else None
+    )
+    return usage.get("total_tokens") if usage else None
+
+
+class GovernedChatModel(BaseChatModel):
+    """在限流器控制下调用内部聊天模型，排队时间写入 response_metadata["queue_wait_seconds"]"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    inner: BaseChatModel
+    governor: ChatModelGovernor
+
+    @property
+    def _llm_type(self) -> str:
+        """沿用内部模型的类型名"""
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        """沿用内部模型的标识参数"""
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Any:
+        """沿用内部模型的工具格式转换，调用仍经过限流"""
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """在限流许可下同步调用内部模型"""
+        estimated = _estimate_prompt_tokens(messages)
+        with self.governor.acquire(estimated) as waited:
+            result = self.inner._generate(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            )
+        self.governor.settle(estimated, _actual_tokens(result))
+        for generation in result.generations:
+            generation.message.response_metadata["queue_wait_seconds"] = waited
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """在限流许可下异步调用内部模型"""
+        estimated = _estimate_prompt_tokens(messages)
+        async with self.governor.aacquire(estimated) as waited:
+            result = await self.inner._agenerate(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            )
+        self.governor.settle(estimated, _actual_tokens(result))
+        for generation in result.generations:
+            generation.message.response_metadata["queue_wait_seconds"] = waited
+        return result
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        """在限流许可下流式调用内部模型（同步）"""
+        # 逐token回调由外层负责，内部模型不再重复上报
+        estimated = _estimate_prompt_tokens(messages)
+        actual = None
+        with self.governor.acquire(estimated) as waited:
+            first = True
+            for chunk in self.inner._stream(messages, stop=stop, **kwargs):
+                if first:
+                    chunk.message.response_metadata["queue_wait_seconds"] = waited
+                    first = False
+                if getattr(chunk.message, "usage_metadata", None):
+                    actual = chunk.message.usage_metadata.get("total_tokens")
+                yield chunk
+        self.governor.settle(estimated, actual)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """在限流许可下流式调用内部模型（异步）"""
+        estimated = _estimate_prompt_tokens(messages)
+        actual = None
+        async with self.governor.aacquire(estimated) as waited:
+            first = True
+            async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+                if first:
+                    chunk.message.response_metadata["queue_wait_seconds"] = waited
+                    first = False
+                if getattr(chunk.message, "usage_metadata", None):
+                    actual = chunk.message.usage_metadata.get("total_tokens")
+                yield chunk
+        self.governor.settle(estimated, actual)
+
+
+_governor: Optional[ChatModelGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def _env_number(name: str) -> Optional[float]:
+    """读取数值型环境变量，未设置或为空时返回None"""
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def get_governor() -> ChatModelGovernor:
+    """获取进程级限流器（按环境变量首次创建）"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            load_environment()
+            max_in_flight = _env_number("DEEPSEEK_MAX_IN_FLIGHT")
+            _governor = ChatModelGovernor(
+                requests_per_minute=_env_number("DEEPSEEK_REQUESTS_PER_MINUTE"),
+                tokens_per_minute=_env_number("DEEPSEEK_TOKENS_PER_MINUTE"),
+                max_in_flight=int(max_in_flight) if max_in_flight else None,
+            )
+            logger.info(
+                f"🚦 DeepSeek限流器: 并发上限{_governor.max_in_flight or '不限'}"
+            )
+        return _governor
+
+
+def governor_stats() -> Dict[str, Any]:
+    """返回进程级限流器的排队统计"""
+    return get_governor().stats()
@@ -0,0 +1,128 @@
+"""模拟聊天模型，用于离线基准测试与单元测试。"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from agent.context import estimate_tokens
+
+DEFAULT_RESPONSE = (
+    "【模拟分析结论】标的基本面稳健，估值处于合理区间，技术面呈多头排列，"
+    "主要风险集中在行业政策与市场波动，建议控制仓位、分批建仓。"
+) * 8
+
+
+class SimulatedChatModel(BaseChatModel):
+    """可配置延迟的模拟聊天模型，支持工具绑定以驱动ReAct循环"""
+
+    response: str = DEFAULT_RESPONSE
+    latency_seconds: float = 0.0
+    latency_jitter: float = 0.0
+    tool_rounds: int = 1
+    tool_name: str = "get_stock_data"
+    tool_args: Dict[str, Any] = {"symbol": "DEMO"}
+    honor_prefetch: bool = True
+    """任务中已注明预取了该工具的数据时直接作答（模拟遵循预取提示的模型）"""
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "response": self.response,
+            "tool_rounds": self.tool_rounds,
+            "tool_name": self.tool_name,
+        }
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Any:
+        """绑定工具（转换为OpenAI格式，与真实模型保持一致）"""
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _delay(self) -> float:
+        """计算本次调用的模拟延迟"""
+        if self.latency_jitter:
+            return max(
+                0.0,
+                self.latency_seconds
+                + random.uniform(-self.latency_jitter, self.latency_jitter),
+            )
+        return self.latency_seconds
+
+    def _respond(
+        self, messages: List[BaseMessage], tools: Optional[List[Dict[str, Any]]]
+    ) -> ChatResult:
+        """根据当前ReAct轮次决定调用工具或给出最终回答"""
+        tool_turns = 0
+        prefetched = False
+        for msg in reversed(messages):
+            if isinstance(msg, HumanMessage):
+                prefetched = self.honor_prefetch and f"（{self.tool_name}）" in str(
+                    msg.content
+                )
+                break
+            if isinstance(msg, ToolMessage):
+                tool_turns += 1
+
+        bound_names = {t["function"]["name"] for t in tools or []}
+        if (
+            self.tool_name in bound_names
+            and tool_turns < self.tool_rounds
+            and not prefetched
+        ):
+            message = AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": self.tool_name,
+                        "args": dict(self.tool_args),
+                        "id": f"call_{tool_turns}_{random.getrandbits(32):08x}",
+                    }
+                ],
+            )
+        else:
+            message = AIMessage(content=self.response)
+        # 按本地估算填充token用量，便于离线验证指标统计
+        input_tokens = sum(estimate_tokens(str(msg.content)) for msg in messages)
+        output_tokens = estimate_tokens(message.content or str(message.tool_calls))
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        return self._respond(messages, kwargs.get("tools"))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._respond(messages, kwargs.get("tools"))
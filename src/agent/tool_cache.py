@@ -0,0 +1,187 @@
+"""工具结果缓存：内存LRU（按工具TTL）+ 可选SQLite持久层。"""
+
+import functools
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from agent.configuration import load_environment
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _bind_arguments(
+    func: Callable[..., Any], args: Tuple[Any, ...], kwargs: Dict[str, Any]
+) -> inspect.BoundArguments:
+    """绑定调用参数：补齐默认值、去除字符串首尾空白"""
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    for name, value in bound.arguments.items():
+        if isinstance(value, str):
+            bound.arguments[name] = value.strip()
+    return bound
+
+
+def _arguments_key(bound: inspect.BoundArguments) -> str:
+    return json.dumps(bound.arguments, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def normalize_arguments(
+    func: Callable[..., Any], args: Tuple[Any, ...], kwargs: Dict[str, Any]
+) -> str:
+    """将调用参数规范化为缓存键：补齐默认值、去除首尾空白（区分大小写，大小写不同的参数可能产生不同的输出）"""
+    return _arguments_key(_bind_arguments(func, args, kwargs))
+
+
+class ToolResultCache:
+    """工具结果缓存，统计各工具的命中/未命中次数"""
+
+    def __init__(self, max_entries: int = 1024, sqlite_path: Optional[str] = None):
+        """初始化内存条目上限与可选的SQLite持久化路径"""
+        self.max_entries = max_entries
+        self.sqlite_path = sqlite_path
+        self._entries: OrderedDict[Tuple[str, str], Tuple[float, Any]] = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self._conn = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache ("
+                "tool TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (tool, key))"
+            )
+            self._conn.commit()
+
+    def _count(self, tool_name: str, field: str) -> None:
+        counters = self._stats.setdefault(
+            tool_name, {"hits": 0, "sqlite_hits": 0, "misses": 0}
+        )
+        counters[field] += 1
+
+    def get(self, tool_name: str, key: str) -> Any:
+        """查询缓存，未命中或已过期时返回 _MISSING"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((tool_name, key))
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end((tool_name, key))
+                    self._count(tool_name, "hits")
+                    return value
+                del self._entries[(tool_name, key)]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM tool_cache WHERE tool = ? AND key = ?",
+                    (tool_name, key),
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    self._store_memory(tool_name, key, value, row[1])
+                    self._count(tool_name, "sqlite_hits")
+                    return value
+
+            self._count(tool_name, "misses")
+            return _MISSING
+
+    def set(self, tool_name: str, key: str, value: Any, ttl: float) -> None:
+        """写入缓存"""
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._store_memory(tool_name, key, value, expires_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO tool_cache (tool, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (tool_name, key, json.dumps(value, ensure_ascii=False), expires_at),
+                )
+                self._conn.commit()
+
+    def _store_memory(
+        self, tool_name: str, key: str, value: Any, expires_at: float
+    ) -> None:
+        self._entries[(tool_name, key)] = (expires_at, value)
+        self._entries.move_to_end((tool_name, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """返回各工具的命中统计"""
+        with self._lock:
+            return {name: dict(counters) for name, counters in self._stats.items()}
+
+    def clear(self) -> None:
+        """清空缓存与统计"""
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM tool_cache")
+                self._conn.commit()
+
+
+_tool_cache: Optional[ToolResultCache] = None
+_tool_cache_configured = False
+
+
+def get_tool_cache() -> Optional[ToolResultCache]:
+    """获取进程级工具缓存（按环境变量首次创建，TOOL_CACHE_ENABLED=false 时禁用）"""
+    global _tool_cache, _tool_cache_configured
+    if not _tool_cache_configured:
+        load_environment()
+        if os.getenv("TOOL_CACHE_ENABLED", "true").lower() not in ("0", "false", "no"):
+            _tool_cache = ToolResultCache(
+                max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024")),
+                sqlite_path=os.getenv("TOOL_CACHE_SQLITE_PATH") or None,
+            )
+        _tool_cache_configured = True
+    return _tool_cache
+
+
+def set_tool_cache(cache: Optional[ToolResultCache]) -> None:
+    """替换进程级工具缓存（传入 None 禁用缓存）"""
+    global _tool_cache, _tool_cache_configured
+    _tool_cache = cache
+    _tool_cache_configured = True
+
+
+def tool_cache_stats() -> Dict[str, Dict[str, int]]:
+    """返回当前工具缓存的命中统计"""
+    cache = get_tool_cache()
+    return cache.stats() if cache is not None else {}
+
+
+def cached_tool(ttl: float) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """为返回可JSON序列化结果的数据函数（如 graph.py 中的 fetch_* 函数）添加结果缓存
+
+    未命中时以规范化后的参数调用原函数，保证缓存值只取决于缓存键，而不是首个调用方的原始写法。
+    """
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            cache = get_tool_cache()
+            if cache is None:
+                return func(*args, **kwargs)
+            bound = _bind_arguments(func, args, kwargs)
+            key = _arguments_key(bound)
+            value = cache.get(func.__name__, key)
+            if value is not _MISSING:
+                logger.debug(f"工具缓存命中: {func.__name__} {key}")
+                return value
+            value = func(*bound.args, **bound.kwargs)
+            cache.set(func.__name__, key, value, ttl)
+            return value
+
+        return wrapper
+
+    return decorator
@@ -1,6 +1,43 @@
+import importlib
+import os
+
 import pytest
 
+# 单元测试不上报LangSmith追踪（load_dotenv不会覆盖已存在的环境变量）
+os.environ["LANGSMITH_TRACING"] = "false"
+
 
 @pytest.fixture(scope="session")
 def anyio_backend():
     return "asyncio"
+
+
+@pytest.fixture
+def simulated_agents():
+    """用模拟聊天模型和本地工具替换所有Agent依赖，返回graph模块"""
+    from agent.simulation import SimulatedChatModel
+
+    graph_module = importlib.import_module("agent.graph")
+    tools = [graph_module.get_stock_data, graph_module.technical_analysis]
+    graph_module.override_components(
+        model=SimulatedChatModel(),
+        basic_tools=tools,
+        advanced_tools=tools,
+    )
+    yield graph_module
+    graph_module.reset_components()
+
+
+class FailingAgent:
+    """调用即抛出异常的Agent，模拟分析或评审失败"""
+
+    def invoke(self, *args, **kwargs):
+        raise RuntimeError("boom")
+
+    async def ainvoke(self, *args, **kwargs):
+        raise RuntimeError("boom")
+
+
+@pytest.fixture
+def failing_agent():
+    return FailingAgent()
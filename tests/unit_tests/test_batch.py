@@ -0,0 +1,39 @@
+import pytest
+
+from agent.batch import as_query
+
+
+def test_bare_tickers_become_queries() -> None:
+    assert as_query(" aapl ") == "请分析 AAPL 的投资价值"
+    assert as_query("600519.sh") == "请分析 600519.SH 的投资价值"
+    assert as_query("分析一下特斯拉的估值") == "分析一下特斯拉的估值"
+
+
+def test_stream_batch_yields_one_report_per_query(simulated_agents) -> None:
+    from agent.batch import stream_batch
+
+    reports = list(stream_batch(["AAPL", "MSFT", "分析一下特斯拉"], max_concurrency=2))
+    assert sorted(r["query"] for r in reports) == sorted(
+        ["请分析 AAPL 的投资价值", "请分析 MSFT 的投资价值", "分析一下特斯拉"]
+    )
+    assert all(r["final_report"] for r in reports)
+
+
+@pytest.mark.anyio
+async def test_astream_batch_isolates_failures(monkeypatch) -> None:
+    import agent.batch as batch
+
+    class _FlakyGraph:
+        async def ainvoke(self, inputs, config=None):
+            if "MSFT" in inputs["original_query"]:
+                raise RuntimeError("boom")
+            return {
+                "final_report": "ok",
+                "consensus_reached": True,
+                "workflow_stage": "completed",
+            }
+
+    monkeypatch.setattr(batch, "analysis_graph", _FlakyGraph())
+    reports = {r["query"]: r async for r in batch.astream_batch(["AAPL", "MSFT"])}
+    assert reports["请分析 AAPL 的投资价值"]["final_report"] == "ok"
+    assert reports["请分析 MSFT 的投资价值"]["error"] == "boom"
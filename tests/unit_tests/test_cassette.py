@@ -0,0 +1,76 @@
+import pytest
+
+from agent.cassette import Cassette, CassetteChatModel, cassette_tool, parse_latency
+from agent.simulation import SimulatedChatModel
+
+
+def _run(graph_module, model, tools):
+    graph_module.reset_components()
+    graph_module.override_components(
+        model=model, basic_tools=tools, advanced_tools=tools
+    )
+    try:
+        return graph_module.graph.invoke({"messages": [("user", "分析DEMO")]})
+    finally:
+        graph_module.reset_components()
+
+
+def test_recorded_run_replays_without_live_model(tmp_path) -> None:
+    import importlib
+
+    graph_module = importlib.import_module("agent.graph")
+    path = str(tmp_path / "run.json")
+
+    with Cassette(path, mode="record") as recorder:
+        recorded = _run(
+            graph_module,
+            CassetteChatModel(
+                cassette=recorder,
+                inner=SimulatedChatModel(tool_args={"symbol": "DEMO", "period": "1y"}),
+            ),
+            [cassette_tool(recorder, graph_module.get_stock_data)],
+        )
+
+    player = Cassette(path, mode="replay")
+    replayed = _run(
+        graph_module,
+        CassetteChatModel(cassette=player),
+        [cassette_tool(player, graph_module.get_stock_data)],
+    )
+
+    assert replayed["final_report"] == recorded["final_report"]
+    assert replayed["analyses"] == recorded["analyses"]
+
+
+def test_recording_is_written_once_on_close(tmp_path) -> None:
+    path = tmp_path / "run.json"
+    recorder = Cassette(str(path), mode="record")
+    model = CassetteChatModel(
+        cassette=recorder, inner=SimulatedChatModel(tool_rounds=0)
+    )
+    model.invoke("分析A")
+    model.invoke("分析B")
+    assert not path.exists()
+
+    recorder.close()
+    assert len(Cassette(str(path), mode="replay")._data["llm"]) == 2
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_replay_miss_raises(tmp_path) -> None:
+    path = str(tmp_path / "empty.json")
+    Cassette(path, mode="record").save()
+    model = CassetteChatModel(cassette=Cassette(path, mode="replay"))
+    with pytest.raises(LookupError):
+        model.invoke("没有录制过的请求")
+
+
+def test_parse_latency() -> None:
+    assert parse_latency(None)(1.5) == 0.0
+    assert parse_latency("recorded")(1.5) == 1.5
+    assert parse_latency("recorded*0.5")(1.5) == 0.75
+    assert parse_latency("fixed:0.2")(1.5) == 0.2
+    assert 0.1 <= parse_latency("uniform:0.1,0.3")(1.5) <= 0.3
+    assert parse_latency("lognormal:1.0,0.3")(1.5) > 0
+    with pytest.raises(ValueError):
+        parse_latency("gaussian")
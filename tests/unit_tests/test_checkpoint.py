@@ -0,0 +1,116 @@
+import importlib
+
+import pytest
+from langgraph.checkpoint.memory import InMemorySaver
+
+from agent.checkpoint import (
+    SQLiteCheckpointSaver,
+    failed_analysts,
+    pending_nodes,
+    rerun_analyst,
+    resume,
+    run,
+    set_checkpointer,
+)
+from agent.metrics import MetricsRecorder, set_metrics
+
+
+@pytest.fixture
+def saver(tmp_path):
+    saver = SQLiteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"))
+    set_checkpointer(saver)
+    yield saver
+    set_checkpointer(None)
+    saver.close()
+
+
+@pytest.fixture
+def recorder():
+    recorder = MetricsRecorder()
+    set_metrics(recorder)
+    yield recorder
+    set_metrics(MetricsRecorder())
+
+
+def test_sqlite_saver_matches_in_memory_saver(simulated_agents, saver) -> None:
+    config = {"configurable": {"thread_id": "t1"}}
+    expected = simulated_agents.build_multi_agent_graph(
+        checkpointer=InMemorySaver()
+    ).invoke({"original_query": "分析DEMO"}, config)
+    result = simulated_agents.build_multi_agent_graph(checkpointer=saver).invoke(
+        {"original_query": "分析DEMO"}, config
+    )
+
+    assert result["final_report"] == expected["final_report"]
+    history = list(saver.list(config))
+    assert len(history) > 5
+    assert history[0].checkpoint["id"] > history[-1].checkpoint["id"]
+    assert list(saver.list(config, limit=2))[1].config == history[1].config
+    assert (
+        list(saver.list(config, before=history[0].config))[0].config
+        == history[1].config
+    )
+    assert (
+        saver.get_tuple(config).checkpoint["channel_values"]["final_report"]
+        == result["final_report"]
+    )
+
+    saver.delete_thread("t1")
+    assert saver.get_tuple(config) is None
+
+
+def test_resume_reruns_only_the_failed_node(
+    simulated_agents, saver, recorder, monkeypatch
+) -> None:
+    graph_module = importlib.import_module("agent.graph")
+    build_task = graph_module._build_synthesis_task
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("进程崩溃")
+
+    monkeypatch.setattr(graph_module, "_build_synthesis_task", crash)
+    with pytest.raises(RuntimeError):
+        run("分析DEMO", "t2")
+    assert pending_nodes("t2") == ("senior_synthesis",)
+
+    monkeypatch.setattr(graph_module, "_build_synthesis_task", build_task)
+    result = resume("t2")
+
+    assert result["final_report"]
+    assert pending_nodes("t2") == ()
+    summary = recorder.summary()
+    assert summary["node:fundamental_analysis"]["count"] == 1
+    assert summary["node:peer_review"]["count"] == 1
+    assert summary["node:senior_synthesis"]["count"] == 2
+    # 已结束的线程再次续跑直接返回最终状态
+    assert resume("t2")["final_report"] == result["final_report"]
+
+
+def test_rerun_failed_analyst_reuses_other_analyses(
+    simulated_agents, saver, recorder, failing_agent
+) -> None:
+    simulated_agents.override_components(risk_agent=failing_agent)
+    first = run("分析DEMO", "t3")
+    assert first["completion_status"]["risk"] is False
+    assert failed_analysts("t3") == ["risk"]
+
+    simulated_agents._components.pop("risk_agent")
+    result = rerun_analyst("t3", "risk")
+
+    assert result["completion_status"] == {
+        "fundamental": True,
+        "technical": True,
+        "risk": True,
+    }
+    assert failed_analysts("t3") == []
+    assert "分析失败" not in result["final_report"]
+    summary = recorder.summary()
+    assert summary["node:fundamental_analysis"]["count"] == 1
+    assert summary["node:risk_analysis"]["count"] == 1
+    assert summary["node:peer_review"]["count"] == 2
+    assert summary["node:senior_synthesis"]["count"] == 2
+
+
+def test_rerun_requires_completed_analysis_phase(simulated_agents, saver) -> None:
+    with pytest.raises(ValueError):
+        rerun_analyst("missing-thread", "risk")
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agent.coalesce import SingleFlight
+
+
+def test_concurrent_sync_calls_share_one_run() -> None:
+    flight = SingleFlight()
+    calls = []
+    gate = threading.Event()
+
+    def work():
+        calls.append(1)
+        gate.wait(1)
+        return {"final_report": "报告"}
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(flight.do, "AAPL:general", work) for _ in range(5)]
+        time.sleep(0.1)
+        gate.set()
+        results = [f.result() for f in futures]
+
+    assert len(calls) == 1
+    assert all(r["final_report"] == "报告" for r in results)
+    assert flight.stats()["coalesced"] == 4
+
+
+@pytest.mark.anyio
+async def test_async_calls_share_run_and_failures_are_not_cached() -> None:
+    flight = SingleFlight()
+    calls = []
+
+    async def boom():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(
+        *(flight.ado("k", boom) for _ in range(3)), return_exceptions=True
+    )
+    assert len(calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def ok():
+        calls.append(1)
+        return "ok"
+
+    assert await flight.ado("k", ok) == "ok"
+    assert len(calls) == 2
+
+
+@pytest.mark.anyio
+async def test_stale_result_is_served_while_revalidating() -> None:
+    flight = SingleFlight(fresh_seconds=0.05, stale_seconds=5)
+    versions = iter(["v1", "v2"])
+
+    async def work():
+        return next(versions)
+
+    assert await flight.ado("k", work) == "v1"
+    assert await flight.ado("k", work) == "v1"  # 新鲜期内直接复用
+    await asyncio.sleep(0.06)
+    assert await flight.ado("k", work) == "v1"  # 过期但在复用窗口内，后台刷新
+    await asyncio.sleep(0.01)
+    assert await flight.ado("k", work) == "v2"
+    assert flight.stats() == {
+        "runs": 2,
+        "coalesced": 0,
+        "fresh_hits": 2,
+        "stale_hits": 1,
+    }
+
+
+@pytest.mark.anyio
+async def test_identical_queries_share_one_graph_run(simulated_agents) -> None:
+    from agent.coalesce import aanalyze, set_single_flight
+
+    flight = SingleFlight()
+    set_single_flight(flight)
+    first, second = await asyncio.gather(
+        aanalyze("请分析AAPL的估值"), aanalyze("AAPL 估值如何？")
+    )
+    assert first["final_report"] == second["final_report"]
+    assert flight.stats()["runs"] == 1
+    assert flight.stats()["coalesced"] == 1
+
+
+def test_coalesce_key_includes_run_configuration() -> None:
+    from agent.coalesce import coalesce_key
+
+    planned = {"configurable": {"analysis_mode": "planned", "thread_id": "a"}}
+    assert coalesce_key("请分析AAPL的估值", planned) == coalesce_key(
+        "AAPL 估值如何？",
+        {"configurable": {"thread_id": "b", "analysis_mode": "planned"}},
+    )
+    assert coalesce_key("请分析AAPL的估值", planned) != coalesce_key("请分析AAPL的估值")
+    assert coalesce_key("请分析AAPL的估值") != coalesce_key("请分析AAPL和MSFT的估值")
@@ -7,3 +7,31 @@ def test_placeholder() -> None:
     # TODO: You can add actual unit tests
     # for your graph and other logic here.
     assert isinstance(graph, Pregel)
+
+
+def test_configuration_from_runnable_config() -> None:
+    from agent.configuration import Configuration
+
+    assert Configuration.from_runnable_config(None).synthesis_token_budget == 12000
+    config = {"configurable": {"synthesis_token_budget": 500, "thread_id": "t"}}
+    assert Configuration.from_runnable_config(config).synthesis_token_budget == 500
+
+
+def test_configuration_rejects_unknown_modes() -> None:
+    import pytest
+
+    from agent.configuration import Configuration
+
+    assert (
+        Configuration(analysis_mode="pipelined", revision_mode="targeted").revision_mode
+        == "targeted"
+    )
+    for configurable in (
+        {"analysis_mode": "pipeline"},
+        {"revision_mode": "partial"},
+        {"tool_output_format": "json"},
+        {"max_plan_steps": 2},
+        {"analysis_quorum": 0},
+    ):
+        with pytest.raises(ValueError):
+            Configuration.from_runnable_config({"configurable": configurable})
@@ -0,0 +1,35 @@
+from agent.context import (
+    TRUNCATION_MARKER,
+    estimate_tokens,
+    fit_sections,
+    latest_by_label,
+    truncate_to_tokens,
+)
+
+
+def test_estimate_tokens_weights_cjk_higher() -> None:
+    assert estimate_tokens("一" * 10) == 6
+    assert estimate_tokens("a" * 10) == 3
+
+
+def test_truncate_to_tokens_respects_budget() -> None:
+    text = truncate_to_tokens("一" * 1000, 100)
+    assert text.endswith(TRUNCATION_MARKER)
+    assert estimate_tokens(text) <= 100
+
+
+def test_latest_by_label_keeps_newest_entry() -> None:
+    entries = ["风险分析: 分析失败 - timeout", "基本面分析: A", "风险分析: B"]
+    assert latest_by_label(entries, ["基本面分析", "技术分析", "风险分析"]) == {
+        "基本面分析": "A",
+        "风险分析": "B",
+    }
+
+
+def test_fit_sections_gives_unused_share_to_longer_sections() -> None:
+    sections = fit_sections(
+        [("a", "一" * 10), ("b", "二" * 1000), ("c", "三" * 1000)], 300
+    )
+    assert sections[0][1] == "一" * 10
+    assert sum(estimate_tokens(body) for _, body in sections) <= 300
+    assert estimate_tokens(sections[1][1]) > 100
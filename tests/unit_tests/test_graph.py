@@ -0,0 +1,964 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+
+def test_analyst_node_sync(simulated_agents) -> None:
+    result = simulated_agents.fundamental_analysis_node({"original_query": "分析DEMO"})
+    assert result["completion_status"] == {"fundamental": True}
+    assert result["analyses"][0].startswith("基本面分析: ")
+
+
+@pytest.mark.anyio
+async def test_analyst_node_async(simulated_agents) -> None:
+    result = await simulated_agents.arisk_analysis_node({"original_query": "分析DEMO"})
+    assert result["completion_status"] == {"risk": True}
+
+
+@pytest.mark.anyio
+async def test_graph_ainvoke_uses_async_path(simulated_agents) -> None:
+    graph = simulated_agents.build_multi_agent_graph()
+    result = await graph.ainvoke({"original_query": "分析DEMO"})
+    assert result["completion_status"] == {
+        "fundamental": True,
+        "technical": True,
+        "risk": True,
+    }
+    assert result["final_report"]
+
+
+def test_peer_review_isolates_reviewer_errors(simulated_agents, failing_agent) -> None:
+    simulated_agents.override_components(technical_agent=failing_agent)
+    result = simulated_agents.peer_review_node(
+        {"analyses": ["基本面分析: ok", "技术分析: ok"]}
+    )
+    content = result["messages"][0].content
+    assert "【技术分析师评审】评审过程中出现错误" in content
+    assert "【基本面分析师评审】\n" in content and "【风险分析师评审】\n" in content
+
+
+@pytest.mark.anyio
+async def test_peer_review_async_isolates_reviewer_errors(
+    simulated_agents, failing_agent
+) -> None:
+    simulated_agents.override_components(risk_agent=failing_agent)
+    result = await simulated_agents.apeer_review_node({"analyses": ["基本面分析: ok"]})
+    assert "【风险分析师评审】评审过程中出现错误" in result["messages"][0].content
+
+
+def test_synthesis_context_uses_latest_analyses_only(simulated_agents) -> None:
+    state = {
+        "messages": [
+            AIMessage(content="多Agent协作分析启动"),
+            AIMessage(content="旧的最终报告"),
+        ],
+        "analyses": ["基本面分析: 旧版本", "技术分析: T", "基本面分析: 新版本"],
+        "agent_feedbacks": [],
+    }
+    context = simulated_agents._build_synthesis_context(state, token_budget=None)
+    assert "新版本" in context and "T" in context
+    assert (
+        "旧版本" not in context
+        and "旧的最终报告" not in context
+        and "协作分析启动" not in context
+    )
+
+
+def test_failed_analyst_proceeds_with_quorum(simulated_agents, failing_agent) -> None:
+    simulated_agents.override_components(risk_agent=failing_agent)
+    graph = simulated_agents.build_multi_agent_graph()
+    updates = list(graph.stream({"original_query": "分析DEMO"}, stream_mode="updates"))
+    assert sum("wait_for_analyses" in update for update in updates) == 1
+    assert any("senior_synthesis" in update for update in updates)
+
+
+def test_below_quorum_stops_with_failure_report(
+    simulated_agents, failing_agent
+) -> None:
+    simulated_agents.override_components(
+        risk_agent=failing_agent, technical_agent=failing_agent
+    )
+    graph = simulated_agents.build_multi_agent_graph()
+    result = graph.invoke({"original_query": "分析DEMO"})
+    assert result["workflow_stage"] == "analyses_insufficient"
+    assert "分析失败" in result["final_report"]
+
+
+@pytest.mark.anyio
+async def test_slow_analyst_times_out(simulated_agents) -> None:
+    from langgraph.prebuilt import create_react_agent
+
+    from agent.simulation import SimulatedChatModel
+
+    slow = create_react_agent(model=SimulatedChatModel(latency_seconds=5), tools=[])
+    simulated_agents.override_components(technical_agent=slow)
+    config = {"configurable": {"analyst_timeout_seconds": 0.05}}
+    result = await simulated_agents.atechnical_analysis_node(
+        {"original_query": "分析DEMO"}, config
+    )
+    assert result["completion_status"] == {"technical": False}
+    assert "超过0.05秒未完成" in result["analyses"][0]
+
+
+def test_sync_timeout_stops_abandoned_agent(simulated_agents) -> None:
+    from langgraph.prebuilt import create_react_agent
+
+    from agent.simulation import SimulatedChatModel
+
+    class CountingModel(SimulatedChatModel):
+        calls: list = []
+
+        def _generate(self, *args, **kwargs):
+            self.calls.append(1)
+            return super()._generate(*args, **kwargs)
+
+    model = CountingModel(latency_seconds=0.1, tool_rounds=3)
+    simulated_agents.override_components(
+        technical_agent=create_react_agent(
+            model=model, tools=[simulated_agents.get_stock_data]
+        )
+    )
+    config = {"configurable": {"analyst_timeout_seconds": 0.05}}
+    result = simulated_agents.technical_analysis_node(
+        {"original_query": "分析DEMO"}, config
+    )
+    assert result["completion_status"] == {"technical": False}
+
+    # 超时后后台线程完成进行中的请求即中止，不再继续工具调用与后续3轮模型调用
+    time.sleep(0.5)
+    assert len(model.calls) == 1
+
+
+def test_review_contexts_exclude_own_and_failed_analyses(simulated_agents) -> None:
+    state = {"analyses": ["基本面分析: F", "技术分析: T", "风险分析: 分析失败 - boom"]}
+    contexts = simulated_agents._review_contexts(state)
+    assert contexts["fundamental"] == "技术分析: T"
+    assert contexts["technical"] == "基本面分析: F"
+    assert contexts["risk"] == "基本面分析: F\n\n技术分析: T"
+
+
+def test_parse_review_feedback_reads_json_block(simulated_agents) -> None:
+    content = """评审意见：整体合理。
+```json
+{"feedback_type": "Approval", "confidence_score": 1.3, "feedback_content": "结论可信",
+ "improvements": {"technical": ["补充成交量分析"], "risk": [], "fundamental": ["越界"]}}
+```"""
+    feedback = simulated_agents.parse_review_feedback("fundamental", content)
+    assert feedback.feedback_type == "approval"
+    assert feedback.confidence_score == 1.0
+    assert feedback.improvements_by_agent == {
+        "technical": ["补充成交量分析"],
+        "risk": [],
+    }
+    assert feedback.suggested_improvements == ["补充成交量分析"]
+
+
+@pytest.mark.parametrize(
+    "improvements, expected",
+    [
+        ('["补充成交量分析"]', {"technical": [], "risk": []}),
+        ('"补充成交量分析"', {"technical": [], "risk": []}),
+        ("null", {"technical": [], "risk": []}),
+        (
+            '{"technical": "补充成交量分析", "risk": ""}',
+            {"technical": ["补充成交量分析"], "risk": []},
+        ),
+        ('{"technical": {"note": "x"}, "risk": 3}', {"technical": [], "risk": []}),
+        (
+            '{"technical": ["补充成交量分析", null, ""], "risk": [1]}',
+            {"technical": ["补充成交量分析"], "risk": ["1"]},
+        ),
+    ],
+)
+def test_parse_review_feedback_tolerates_malformed_improvements(
+    simulated_agents, improvements, expected
+) -> None:
+    content = (
+        '```json\n{"feedback_type": "suggestion", "confidence_score": 0.7, '
+        f'"feedback_content": "需补充", "improvements": {improvements}}}\n```'
+    )
+    feedback = simulated_agents.parse_review_feedback("fundamental", content)
+    # 结构化结论保留，畸形的改进建议被规整而不是整体退化为原文摘要
+    assert feedback.feedback_type == "suggestion"
+    assert feedback.confidence_score == 0.7
+    assert feedback.improvements_by_agent == expected
+    assert feedback.suggested_improvements == [
+        item for items in expected.values() for item in items
+    ]
+
+
+def test_parse_review_feedback_falls_back_on_prose(simulated_agents) -> None:
+    feedback = simulated_agents.parse_review_feedback("risk", "评审意见：缺少压力测试")
+    assert feedback.feedback_type == "critique"
+    assert feedback.confidence_score == 0.5
+    assert feedback.target_agents == ["fundamental", "technical"]
+
+
+def test_consensus_skips_revision_when_all_approve(simulated_agents) -> None:
+    approval = simulated_agents.AgentFeedback(
+        agent_name="risk",
+        feedback_type="approval",
+        feedback_content="ok",
+        confidence_score=0.9,
+        suggested_improvements=[],
+    )
+    state = {
+        "final_report": "短",
+        "revision_count": 0,
+        "agent_feedbacks": [approval] * 3,
+    }
+    assert simulated_agents.consensus_check_node(state)["consensus_reached"] is True
+    critique = approval.model_copy(update={"feedback_type": "critique"})
+    state["agent_feedbacks"] = [approval, critique]
+    assert simulated_agents.consensus_check_node(state)["consensus_reached"] is False
+
+
+def test_prefetched_data_is_shared_with_analysts(simulated_agents) -> None:
+    state = {"original_query": "请分析AAPL的投资价值", "messages": []}
+    update = simulated_agents.prefetch_data_node(state)
+    assert set(update["prefetched_data"]) == {"get_stock_data", "technical_analysis"}
+    assert "股票代码: AAPL" in update["prefetched_data"]["get_stock_data"]
+
+    context = simulated_agents._prefetch_context({**state, **update})
+    assert "（get_stock_data）" in context and "（technical_analysis）" in context
+
+
+def test_prefetch_skipped_without_ticker_or_when_disabled(simulated_agents) -> None:
+    assert simulated_agents.prefetch_data_node({"original_query": "市场怎么看"}) == {
+        "prefetched_data": {}
+    }
+    disabled = {"configurable": {"prefetch_enabled": False}}
+    assert simulated_agents.prefetch_data_node(
+        {"original_query": "分析AAPL"}, disabled
+    ) == {"prefetched_data": {}}
+
+
+_PLAN = {
+    "analysis_steps": [
+        {
+            "step_id": "valuation",
+            "step": "估值分析",
+            "method": "DCF",
+            "data_needed": "财报",
+            "assigned_agent": "fundamental",
+        },
+        {
+            "step_id": "trend",
+            "step": "趋势判断",
+            "method": "均线",
+            "data_needed": "行情",
+            "assigned_agent": "technical",
+        },
+        {
+            "step_id": "stress",
+            "step": "压力测试",
+            "method": "情景分析",
+            "data_needed": "估值结论",
+            "assigned_agent": "风险管理专家",
+            "depends_on": ["valuation", "trend"],
+        },
+    ]
+}
+
+
+def test_planner_uses_structured_output(simulated_agents) -> None:
+    from agent.simulation import SimulatedChatModel
+
+    simulated_agents.override_components(
+        model=SimulatedChatModel(tool_name="FinancialAnalysisPlan", tool_args=_PLAN)
+    )
+    update = simulated_agents.plan_analysis_node({"original_query": "分析AAPL"})
+    steps = update["analysis_plan"].analysis_steps
+    assert [s.step_id for s in steps] == ["valuation", "trend", "stress"]
+    assert steps[2].assigned_agent == "risk"
+
+
+def test_invalid_plans_are_repaired() -> None:
+    import importlib
+
+    graph_module = importlib.import_module("agent.graph")
+    cyclic = graph_module.FinancialAnalysisPlan(
+        analysis_steps=[
+            graph_module.FinancialAnalysisStep(
+                step_id="a",
+                step="A",
+                method="m",
+                data_needed="d",
+                assigned_agent="fundamental",
+                depends_on=["b"],
+            ),
+            graph_module.FinancialAnalysisStep(
+                step_id="b",
+                step="B",
+                method="m",
+                data_needed="d",
+                assigned_agent="technical",
+                depends_on=["a"],
+            ),
+        ]
+    )
+    assert (
+        graph_module.validate_analysis_plan(cyclic)
+        == graph_module.default_analysis_plan()
+    )
+
+    partial = graph_module.FinancialAnalysisPlan(
+        analysis_steps=[
+            graph_module.FinancialAnalysisStep(
+                step="A",
+                method="m",
+                data_needed="d",
+                assigned_agent="fundamental",
+                depends_on=["missing"],
+            ),
+        ]
+    )
+    repaired = graph_module.validate_analysis_plan(partial)
+    assert {s.assigned_agent for s in repaired.analysis_steps} == {
+        "fundamental",
+        "technical",
+        "risk",
+    }
+    assert repaired.analysis_steps[0].step_id == "step_1"
+    assert repaired.analysis_steps[0].depends_on == []
+
+
+def test_repaired_plan_stays_within_max_steps() -> None:
+    import importlib
+
+    graph_module = importlib.import_module("agent.graph")
+    # 4个基本面步骤，上限为4：补全技术与风险默认步骤后截断，每位分析师仍保留至少一个步骤
+    crowded = graph_module.FinancialAnalysisPlan(
+        analysis_steps=[
+            graph_module.FinancialAnalysisStep(
+                step_id=f"f{i}",
+                step=f"F{i}",
+                method="m",
+                data_needed="d",
+                assigned_agent="fundamental",
+                depends_on=[f"f{i - 1}"] if i else [],
+            )
+            for i in range(4)
+        ]
+    )
+    repaired = graph_module.validate_analysis_plan(crowded, max_steps=4)
+    steps = repaired.analysis_steps
+    assert len(steps) <= 4
+    assert [s.step_id for s in steps] == ["f0", "f1", "technical", "risk"]
+    ids = {s.step_id for s in steps}
+    assert all(d in ids for s in steps for d in s.depends_on)
+
+
+@pytest.mark.anyio
+async def test_plan_executor_respects_dependencies(simulated_agents) -> None:
+    plan = simulated_agents.FinancialAnalysisPlan.model_validate(_PLAN)
+    plan = simulated_agents.validate_analysis_plan(plan)
+    seen_tasks = []
+
+    class _RecordingAgent:
+        def __init__(self, name):
+            self.name = name
+
+        async def ainvoke(self, payload):
+            task = payload["messages"][0].content
+            seen_tasks.append((self.name, task))
+            await asyncio.sleep(0.01)
+            return {"messages": [AIMessage(content=f"{self.name}结论")]}
+
+    simulated_agents.override_components(
+        **{
+            f"{k}_agent": _RecordingAgent(k)
+            for k in ("fundamental", "technical", "risk")
+        }
+    )
+    update = await simulated_agents.aexecute_plan_node(
+        {"original_query": "分析AAPL", "analysis_plan": plan}
+    )
+
+    assert [name for name, _ in seen_tasks][-1] == "risk"
+    risk_task = seen_tasks[-1][1]
+    assert "fundamental结论" in risk_task and "technical结论" in risk_task
+    assert update["completion_status"] == {
+        "fundamental": True,
+        "technical": True,
+        "risk": True,
+    }
+    assert any(
+        entry.startswith("风险分析: ### 压力测试") for entry in update["analyses"]
+    )
+
+
+def test_planned_mode_runs_end_to_end(simulated_agents) -> None:
+    config = {"configurable": {"analysis_mode": "planned"}}
+    result = simulated_agents.graph.invoke({"messages": [("user", "分析DEMO")]}, config)
+    # 模拟模型不支持结构化输出，规划失败时退回默认计划
+    assert result["analysis_plan"] == simulated_agents.default_analysis_plan()
+    assert result["completion_status"] == {
+        "fundamental": True,
+        "technical": True,
+        "risk": True,
+    }
+    assert result["final_report"]
+
+
+def test_tool_output_text_format_is_default() -> None:
+    from agent.graph import get_stock_data
+
+    output = get_stock_data.invoke({"symbol": "AAPL"})
+    assert output.startswith("\n    股票代码: AAPL\n    时间周期: 1y\n")
+    assert "- P/E比率: 18.5\n" in output
+
+
+def test_tool_output_compact_format_saves_tokens() -> None:
+    import json
+
+    from agent.context import estimate_tokens
+    from agent.graph import (
+        get_financial_news,
+        get_stock_data,
+        risk_assessment,
+        technical_analysis,
+    )
+
+    calls = [
+        (get_stock_data, {"symbol": "AAPL"}),
+        (get_financial_news, {"keyword": "AAPL"}),
+        (technical_analysis, {"symbol": "AAPL"}),
+        (risk_assessment, {"position_size": "10%", "market_cap": "大盘"}),
+    ]
+    compact_config = {"configurable": {"tool_output_format": "compact"}}
+    for tool, args in calls:
+        text = tool.invoke(args)
+        compact = tool.invoke(args, compact_config)
+        assert isinstance(json.loads(compact), dict)
+        assert estimate_tokens(compact) < estimate_tokens(text)
+    assert (
+        json.loads(get_stock_data.invoke({"symbol": "AAPL"}, compact_config))["pe"]
+        == "18.5"
+    )
+
+
+_CRITIQUE_RESPONSE = """需要补充估值依据。
+```json
+{"feedback_type": "critique", "confidence_score": 0.6, "feedback_content": "估值依据不足",
+ "improvements": {"fundamental": ["补充估值依据"], "technical": [], "risk": []},
+ "edits": [{"find": "需要补充估值依据。", "replace": "估值依据：PE 18.5，低于行业均值。"}], "append": ""}
+```"""
+
+
+def test_targeted_revision_reinvokes_only_criticized_analyst(simulated_agents) -> None:
+    from agent.metrics import MetricsRecorder, set_metrics
+    from agent.simulation import SimulatedChatModel
+
+    recorder = MetricsRecorder()
+    set_metrics(recorder)
+    simulated_agents.override_components(
+        model=SimulatedChatModel(response=_CRITIQUE_RESPONSE)
+    )
+    graph = simulated_agents.build_multi_agent_graph()
+
+    config = {
+        "configurable": {"revision_mode": "targeted", "analyst_revision_enabled": False}
+    }
+    result = graph.invoke({"original_query": "分析DEMO"}, config)
+    set_metrics(MetricsRecorder())
+
+    summary = recorder.summary()
+    assert summary["node:targeted_revision"]["count"] == 1
+    # 只有基本面分析师执行一次ReAct循环（一次工具调用 + 一次作答）
+    assert summary["llm:targeted_revision"]["count"] == 2
+    # 定向修订处理完建议后不再以相同输入重新综合，而是对修订后的分析整轮重新评议
+    assert summary["node:peer_review"]["count"] == 2
+    assert summary["node:senior_synthesis"]["count"] == 3
+    assert result["revision_count"] == 2
+    assert [entry.split(": ")[0] for entry in result["analyses"]].count(
+        "基本面分析"
+    ) == 2
+
+
+def test_targeted_mode_with_analyst_revision_never_resynthesizes_unchanged_inputs(
+    simulated_agents,
+) -> None:
+    from agent.simulation import SimulatedChatModel
+
+    simulated_agents.override_components(
+        model=SimulatedChatModel(response=_CRITIQUE_RESPONSE)
+    )
+    graph = simulated_agents.build_multi_agent_graph()
+    config = {
+        "configurable": {"revision_mode": "targeted"}
+    }  # analyst_revision_enabled 默认开启
+    nodes = [
+        name
+        for update in graph.stream(
+            {"original_query": "分析DEMO"}, config, stream_mode="updates"
+        )
+        for name in update
+    ]
+
+    # 分析师修订已处理建议，共识检查找不到定向目标时改为整轮评议，每次综合前都有新的评议或修订
+    assert nodes.count("senior_synthesis") == 3
+    for index, name in enumerate(nodes):
+        if name == "senior_synthesis":
+            assert nodes[index - 1] in ("analyst_revision", "targeted_revision")
+    assert nodes[-1] == "consensus_check"
+
+
+def test_full_revision_mode_reruns_peer_review(simulated_agents) -> None:
+    from agent.simulation import SimulatedChatModel
+
+    simulated_agents.override_components(
+        model=SimulatedChatModel(response=_CRITIQUE_RESPONSE)
+    )
+    graph = simulated_agents.build_multi_agent_graph()
+    config = {"configurable": {"analyst_revision_enabled": False}}
+    updates = list(
+        graph.stream({"original_query": "分析DEMO"}, config, stream_mode="updates")
+    )
+    assert sum("peer_review" in update for update in updates) == 3
+    assert not any("targeted_revision" in update for update in updates)
+
+
+@pytest.mark.anyio
+async def test_targeted_revision_node_async_keeps_analysis_on_failure(
+    simulated_agents, failing_agent
+) -> None:
+    feedback = simulated_agents.parse_review_feedback("technical", _CRITIQUE_RESPONSE)
+    state = {
+        "original_query": "分析DEMO",
+        "analyses": ["基本面分析: 旧版本", "技术分析: T"],
+        "agent_feedbacks": [feedback],
+        "revision_targets": simulated_agents.identify_revision_targets(
+            {
+                "analyses": ["基本面分析: 旧版本", "技术分析: T"],
+                "agent_feedbacks": [feedback],
+            }
+        ),
+    }
+    assert state["revision_targets"] == ["fundamental"]
+    simulated_agents.override_components(fundamental_agent=failing_agent)
+    result = await simulated_agents.atargeted_revision_node(state)
+    assert result["analyses"] == []
+    assert result["agent_feedbacks"][0].improvements_by_agent["fundamental"] == [
+        "补充估值依据"
+    ]
+
+
+def test_peer_review_reuses_reviews_of_unchanged_analyses(
+    simulated_agents, failing_agent
+) -> None:
+    state = {"analyses": ["基本面分析: F", "技术分析: T", "风险分析: R"]}
+    first = simulated_agents.peer_review_node(state)
+    assert len(first["review_cache"]) == 3
+
+    # 第二轮所有评审人都不可用：内容未变化的评审直接复用缓存
+    for key in ("fundamental", "technical", "risk"):
+        simulated_agents.override_components(**{f"{key}_agent": failing_agent})
+    state["review_cache"] = first["review_cache"]
+    second = simulated_agents.peer_review_node(state)
+    assert second["agent_feedbacks"] == first["agent_feedbacks"]
+    assert second["review_cache"] == {}
+
+    # 技术分析修改后，评审技术分析的两位评审人重新评议
+    state["analyses"].append("技术分析: T2")
+    third = simulated_agents.peer_review_node(state)
+    assert "【基本面分析师评审】评审过程中出现错误" in third["messages"][0].content
+    assert "【技术分析师评审】评审过程中出现错误" not in third["messages"][0].content
+    assert [feedback.agent_name for feedback in third["agent_feedbacks"]] == [
+        "technical"
+    ]
+
+
+def test_review_cache_key_includes_review_targets() -> None:
+    from agent.graph import review_cache_key
+
+    text = "技术分析: T"
+    # 默认评审对象为该评审人负责的全部分析师，顺序无关
+    assert review_cache_key("fundamental", text) == review_cache_key(
+        "fundamental", text, ("risk", "technical")
+    )
+    assert review_cache_key("fundamental", text) != review_cache_key(
+        "fundamental", text, ("technical",)
+    )
+    assert review_cache_key("fundamental", text, ("technical",)) != review_cache_key(
+        "fundamental", text, ("risk",)
+    )
+
+
+def test_apply_revision_edits() -> None:
+    from agent.graph import apply_revision_edits
+
+    output = """```json
+{"edits": [{"find": "估值偏高", "replace": "估值合理"}, {"find": "不存在的片段", "replace": "x"}], "append": "补充：现金流稳定"}
+```"""
+    assert (
+        apply_revision_edits("结论：估值偏高。", output)
+        == "结论：估值合理。\n\n补充：现金流稳定"
+    )
+    assert apply_revision_edits("结论：估值偏高。", "修订后的全文") is None
+    assert (
+        apply_revision_edits(
+            "结论：估值偏高。", '```json\n{"edits": [], "append": ""}\n```'
+        )
+        is None
+    )
+
+
+def test_analysts_revise_from_their_own_feedback(simulated_agents) -> None:
+    from agent.simulation import SimulatedChatModel
+
+    simulated_agents.override_components(
+        model=SimulatedChatModel(response=_CRITIQUE_RESPONSE)
+    )
+    graph = simulated_agents.build_multi_agent_graph()
+    updates = list(graph.stream({"original_query": "分析DEMO"}, stream_mode="updates"))
+
+    revisions = [
+        update["analyst_revision"] for update in updates if "analyst_revision" in update
+    ]
+    first = revisions[0]
+    assert first["workflow_stage"] == "analyst_revision_completed"
+    assert len(first["analyses"]) == 1
+    assert first["analyses"][0].startswith(
+        "基本面分析: 估值依据：PE 18.5，低于行业均值。"
+    )
+    assert all(
+        not feedback.improvements_by_agent.get("fundamental")
+        for feedback in first["agent_feedbacks"]
+    )
+    # 修订后的分析才进入高级综合
+    synthesis_index = next(
+        i for i, update in enumerate(updates) if "senior_synthesis" in update
+    )
+    assert "analyst_revision" in updates[synthesis_index - 1]
+
+
+@pytest.mark.anyio
+async def test_analyst_revision_skipped_without_feedback(simulated_agents) -> None:
+    state = {"analyses": ["基本面分析: F"], "agent_feedbacks": []}
+    assert await simulated_agents.aanalyst_revision_node(state) == {
+        "workflow_stage": "analyst_revision_skipped"
+    }
+
+
+class _TimedAgent:
+    """按任务类型（分析/评审）模拟不同耗时，并记录完成顺序"""
+
+    def __init__(
+        self, name, events, analysis_delay, review_delay=0.02, review_content=None
+    ):
+        self.name = name
+        self.events = events
+        self.analysis_delay = analysis_delay
+        self.review_delay = review_delay
+        self.review_content = review_content
+
+    def _kind(self, payload):
+        return "review" if "评审" in payload["messages"][-1].content else "analysis"
+
+    def _result(self, kind):
+        self.events.append(f"{self.name}:{kind}")
+        content = (
+            self.review_content
+            if kind == "review" and self.review_content
+            else f"{self.name} {kind}"
+        )
+        return {"messages": [AIMessage(content=content)]}
+
+    def invoke(self, payload, *args, **kwargs):
+        kind = self._kind(payload)
+        time.sleep(self.analysis_delay if kind == "analysis" else self.review_delay)
+        return self._result(kind)
+
+    async def ainvoke(self, payload, *args, **kwargs):
+        kind = self._kind(payload)
+        await asyncio.sleep(
+            self.analysis_delay if kind == "analysis" else self.review_delay
+        )
+        return self._result(kind)
+
+
+def _install_timed_agents(graph_module, events):
+    graph_module.override_components(
+        fundamental_agent=_TimedAgent("fundamental", events, 0.01),
+        technical_agent=_TimedAgent("technical", events, 0.01),
+        risk_agent=_TimedAgent("risk", events, 0.3),
+    )
+
+
+def _assert_pipelined(result, events, updates=None) -> None:
+    # 风险分析完成前，基本面与技术分析的4份逐份评审已经完成
+    risk_done = events.index("risk:analysis")
+    assert sum(event.endswith(":review") for event in events[:risk_done]) == 4
+    assert sum(event.endswith(":review") for event in events[risk_done:]) == 2
+    assert sorted(feedback.agent_name for feedback in result["agent_feedbacks"]) == [
+        "fundamental",
+        "risk",
+        "technical",
+    ]
+    assert next(
+        f for f in result["agent_feedbacks"] if f.agent_name == "fundamental"
+    ).target_agents == ["technical", "risk"]
+    if updates is not None:
+        assert not any("peer_review" in update for update in updates)
+
+
+def test_pipelined_mode_reviews_each_analysis_as_it_lands(simulated_agents) -> None:
+    events = []
+    _install_timed_agents(simulated_agents, events)
+    graph = simulated_agents.build_multi_agent_graph()
+    config = {"configurable": {"analysis_mode": "pipelined"}}
+    updates = list(
+        graph.stream({"original_query": "分析DEMO"}, config, stream_mode="updates")
+    )
+    final = {}
+    for update in updates:
+        for values in update.values():
+            final.update(values or {})
+    assert [name for update in updates for name in update][:4] == [
+        "coordinator",
+        "prefetch_data",
+        "pipelined_analysis",
+        "wait_for_analyses",
+    ]
+    _assert_pipelined(final, events, updates)
+
+
+@pytest.mark.anyio
+async def test_pipelined_mode_async(simulated_agents) -> None:
+    events = []
+    _install_timed_agents(simulated_agents, events)
+    result = await simulated_agents.apipelined_analysis_node(
+        {"original_query": "分析DEMO"}
+    )
+    assert result["completion_status"] == {
+        "fundamental": True,
+        "technical": True,
+        "risk": True,
+    }
+    _assert_pipelined(result, events)
+
+
+def test_single_analysis_review_prompt_names_only_that_analysis(
+    simulated_agents,
+) -> None:
+    full = simulated_agents._build_review_task(
+        "fundamental", "技术分析: a\n\n风险分析: b"
+    )
+    single = simulated_agents._build_review_task(
+        "fundamental", "风险分析: b", ("risk",)
+    )
+    assert "请评审以下技术分析和风险分析的质量" in full
+    assert "请评审以下风险分析的质量" in single
+    assert "技术分析" not in single
+
+
+@pytest.mark.anyio
+async def test_pipelined_reviews_use_review_cache(simulated_agents) -> None:
+    events = []
+    _install_timed_agents(simulated_agents, events)
+    first = await simulated_agents.apipelined_analysis_node(
+        {"original_query": "分析DEMO"}
+    )
+    assert len(first["review_cache"]) == 6
+
+    events.clear()
+    second = await simulated_agents.apipelined_analysis_node(
+        {"original_query": "分析DEMO", "review_cache": first["review_cache"]}
+    )
+    # 分析内容未变化，6份逐份评审全部复用缓存
+    assert not any(event.endswith(":review") for event in events)
+    assert second["review_cache"] == {}
+    assert second["agent_feedbacks"] == first["agent_feedbacks"]
+
+
+@pytest.mark.anyio
+async def test_pipelined_and_batch_reviews_do_not_share_cache_entries(
+    simulated_agents,
+) -> None:
+    events = []
+    _install_timed_agents(simulated_agents, events)
+    # 风险分析失败时，基本面评审人的整轮评议内容与逐份评审技术分析的内容完全相同
+    batch = await simulated_agents.apeer_review_node(
+        {
+            "analyses": [
+                "基本面分析: fundamental analysis",
+                "技术分析: technical analysis",
+                "风险分析: 分析失败 - boom",
+            ]
+        }
+    )
+    assert batch["agent_feedbacks"][0].target_agents == ["technical", "risk"]
+
+    events.clear()
+    pipelined = await simulated_agents.apipelined_analysis_node(
+        {"original_query": "分析DEMO", "review_cache": batch["review_cache"]}
+    )
+    # 逐份评审不复用整轮评议的缓存，反之亦然
+    assert sum(event.endswith(":review") for event in events) == 6
+    assert not set(pipelined["review_cache"]) & set(batch["review_cache"])
+    fundamental = next(
+        f for f in pipelined["agent_feedbacks"] if f.agent_name == "fundamental"
+    )
+    assert fundamental.target_agents == ["technical", "risk"]
+
+
+@pytest.mark.anyio
+async def test_pipelined_speculative_synthesis_overlaps_last_reviews(
+    simulated_agents,
+) -> None:
+    events = []
+    simulated_agents.override_components(
+        fundamental_agent=_TimedAgent("fundamental", events, 0.01, review_delay=0.1),
+        technical_agent=_TimedAgent("technical", events, 0.01, review_delay=0.1),
+        risk_agent=_TimedAgent("risk", events, 0.2, review_delay=0.1),
+        senior_agent=_TimedAgent("senior", events, 0.01),
+    )
+    config = {
+        "configurable": {"analysis_mode": "pipelined", "speculative_synthesis": True}
+    }
+    result = await simulated_agents.apipelined_analysis_node(
+        {"original_query": "分析DEMO"}, config
+    )
+
+    # 全部分析完成即起草，草稿在风险分析的逐份评审完成前就已生成
+    assert events.index("senior:analysis") == events.index("risk:analysis") + 1
+    assert [
+        event
+        for event in events[events.index("senior:analysis") :]
+        if event.endswith(":review")
+    ] == ["fundamental:review", "technical:review"]
+    assert result["synthesis_draft"].report == "senior analysis"
+
+
+def test_merge_review_feedbacks(simulated_agents) -> None:
+    def feedback(target, feedback_type, confidence, items):
+        return simulated_agents.AgentFeedback(
+            agent_name="fundamental",
+            feedback_type=feedback_type,
+            feedback_content=target,
+            confidence_score=confidence,
+            suggested_improvements=items,
+            target_agents=[target],
+            improvements_by_agent={target: items},
+        )
+
+    merged = simulated_agents.merge_review_feedbacks(
+        "fundamental",
+        [
+            feedback("risk", "approval", 0.9, []),
+            feedback("technical", "suggestion", 0.7, ["补充成交量"]),
+        ],
+    )
+    assert merged.feedback_type == "suggestion"
+    assert merged.confidence_score == 0.7
+    assert merged.target_agents == ["technical", "risk"]
+    assert merged.improvements_by_agent == {"risk": [], "technical": ["补充成交量"]}
+
+
+def test_speculative_synthesis_drafts_during_peer_review(simulated_agents) -> None:
+    events = []
+    for key in ("fundamental", "technical", "risk"):
+        simulated_agents.override_components(
+            **{f"{key}_agent": _TimedAgent(key, events, 0.01, review_delay=0.2)}
+        )
+    no_edits = '```json\n{"edits": [], "append": ""}\n```'
+    simulated_agents.override_components(
+        senior_agent=_TimedAgent("senior", events, 0.05, review_content=no_edits)
+    )
+    graph = simulated_agents.build_multi_agent_graph()
+    config = {"configurable": {"speculative_synthesis": True}}
+
+    updates = list(
+        graph.stream({"original_query": "分析DEMO"}, config, stream_mode="updates")
+    )
+
+    # 草稿在评审完成前就已生成
+    first_review = next(
+        i for i, event in enumerate(events) if event.endswith(":review")
+    )
+    assert events.index("senior:analysis") < first_review
+    peer_review = next(
+        update["peer_review"] for update in updates if "peer_review" in update
+    )
+    assert peer_review["synthesis_draft"].report == "senior analysis"
+    # 修订输出的编辑列表为空时草稿即为最终报告，之后草稿被清空
+    synthesis = next(
+        update["senior_synthesis"] for update in updates if "senior_synthesis" in update
+    )
+    assert synthesis["final_report"] == "senior analysis"
+    assert synthesis["synthesis_draft"] is None
+    # 首轮综合只调用高级投资总监两次：起草 + 简短修订（修订任务含评审意见）
+    senior_calls = [event for event in events if event.startswith("senior:")]
+    assert senior_calls[:2] == ["senior:analysis", "senior:review"]
+
+
+@pytest.mark.anyio
+async def test_speculative_synthesis_patch_pass_applies_edits(simulated_agents) -> None:
+    from langchain_core.runnables import RunnableLambda
+
+    draft = simulated_agents.SynthesisDraft(
+        report="评级：持有。目标价130元。",
+        analysis_hashes={"fundamental": "stale"},
+    )
+    patch = '```json\n{"edits": [{"find": "评级：持有", "replace": "评级：增持"}], "append": ""}\n```'
+    tasks = []
+
+    async def senior(payload):
+        tasks.append(payload["messages"][-1].content)
+        return {"messages": [AIMessage(content=patch)]}
+
+    simulated_agents.override_components(
+        senior_agent=RunnableLambda(lambda payload: None, afunc=senior)
+    )
+    state = {
+        "analyses": ["基本面分析: 新版本"],
+        "agent_feedbacks": [],
+        "synthesis_draft": draft,
+    }
+    result = await simulated_agents.asenior_synthesis_node(state)
+
+    assert result["final_report"] == "评级：增持。目标价130元。"
+    assert "【基本面分析（修订后）】\n新版本" in tasks[0]
+    assert len(tasks) == 1
+
+
+@pytest.mark.parametrize(
+    "patch_output",
+    [
+        "修订后的完整报告：评级调整为增持。",
+        '```json\n{"edits": [{"find": "不存在的片段", "replace": "x"}]}\n```',
+    ],
+)
+def test_unusable_patch_output_falls_back_to_full_synthesis(
+    simulated_agents, patch_output
+) -> None:
+    from langchain_core.runnables import RunnableLambda
+
+    tasks = []
+
+    def senior(payload):
+        tasks.append(payload["messages"][-1].content)
+        return {
+            "messages": [
+                AIMessage(content=patch_output if len(tasks) == 1 else "完整综合报告")
+            ]
+        }
+
+    simulated_agents.override_components(senior_agent=RunnableLambda(senior))
+    draft = simulated_agents.SynthesisDraft(
+        report="DRAFT评级：持有", analysis_hashes={}
+    )
+    state = {
+        "analyses": ["基本面分析: ok"],
+        "agent_feedbacks": [],
+        "synthesis_draft": draft,
+    }
+    result = simulated_agents.senior_synthesis_node(state)
+
+    # 修订输出不可用时不直接采用评议前的草稿，而是完整综合
+    assert len(tasks) == 2
+    assert result["final_report"] == "完整综合报告"
+    assert result["synthesis_draft"] is None
@@ -0,0 +1,81 @@
+import time
+
+from langchain_core.messages import HumanMessage
+
+from agent.llm_cache import SQLiteResponseCache
+from agent.simulation import SimulatedChatModel
+
+
+class _CountingModel(SimulatedChatModel):
+    calls: int = 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def test_repeated_prompt_served_from_cache(tmp_path) -> None:
+    cache = SQLiteResponseCache(str(tmp_path / "llm.sqlite"))
+    model = _CountingModel(cache=cache)
+    first = model.invoke([HumanMessage(content="分析DEMO", id="a")])
+    second = model.invoke([HumanMessage(content="分析DEMO", id="b")])
+    assert model.calls == 1
+    assert first.content == second.content
+
+
+def test_cache_persists_across_instances(tmp_path) -> None:
+    path = str(tmp_path / "llm.sqlite")
+    _CountingModel(cache=SQLiteResponseCache(path)).invoke("分析DEMO")
+    model = _CountingModel(cache=SQLiteResponseCache(path))
+    model.invoke("分析DEMO")
+    assert model.calls == 0
+
+
+def test_different_parameters_do_not_share_entries(tmp_path) -> None:
+    cache = SQLiteResponseCache(str(tmp_path / "llm.sqlite"))
+    _CountingModel(cache=cache, response="A").invoke("分析DEMO")
+    model = _CountingModel(cache=cache, response="B")
+    assert model.invoke("分析DEMO").content == "B"
+    assert model.calls == 1
+
+
+def test_ttl_expiry(tmp_path) -> None:
+    model = _CountingModel(
+        cache=SQLiteResponseCache(str(tmp_path / "llm.sqlite"), ttl_seconds=0.01)
+    )
+    model.invoke("分析DEMO")
+    time.sleep(0.02)
+    model.invoke("分析DEMO")
+    assert model.calls == 2
+
+
+def test_lru_eviction_by_size(tmp_path) -> None:
+    cache = SQLiteResponseCache(str(tmp_path / "llm.sqlite"), max_bytes=2000)
+    model = _CountingModel(cache=cache, response="x" * 400)
+    model.invoke("a")
+    model.invoke("b")
+    model.invoke("a")  # 刷新a的访问时间
+    model.invoke("c")  # 超出容量，淘汰最久未访问的b
+    assert model.calls == 3
+    model.invoke("a")
+    assert model.calls == 3
+    model.invoke("b")
+    assert model.calls == 4
+
+
+def test_react_agent_replay_is_fully_cached(tmp_path) -> None:
+    from langgraph.prebuilt import create_react_agent
+
+    from agent.tool_cache import cached_tool
+
+    @cached_tool(ttl=60)
+    def get_stock_data(symbol: str) -> str:
+        """获取股票数据"""
+        return f"{symbol}: 125.50"
+
+    model = _CountingModel(cache=SQLiteResponseCache(str(tmp_path / "llm.sqlite")))
+    agent = create_react_agent(model=model, tools=[get_stock_data])
+    agent.invoke({"messages": [HumanMessage(content="分析DEMO")]})
+    assert model.calls == 2
+    agent.invoke({"messages": [HumanMessage(content="分析DEMO")]})
+    assert model.calls == 2
@@ -0,0 +1,75 @@
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from agent.metrics import (
+    MetricsCallbackHandler,
+    MetricsRecorder,
+    percentile,
+    set_metrics,
+)
+
+
+@pytest.fixture
+def recorder():
+    recorder = MetricsRecorder()
+    set_metrics(recorder)
+    yield recorder
+    set_metrics(MetricsRecorder())
+
+
+def test_percentile_interpolates() -> None:
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == pytest.approx(50.5)
+    assert percentile(values, 99) == pytest.approx(99.01)
+    assert percentile([], 95) == 0.0
+
+
+def test_llm_usage_and_cost_are_recorded() -> None:
+    recorder = MetricsRecorder()
+    handler = MetricsCallbackHandler(recorder)
+    message = AIMessage(
+        content="ok",
+        usage_metadata={
+            "input_tokens": 1000,
+            "output_tokens": 200,
+            "total_tokens": 1200,
+        },
+        response_metadata={
+            "token_usage": {"prompt_cache_hit_tokens": 600},
+            "queue_wait_seconds": 0.5,
+        },
+    )
+    handler.on_chat_model_start({}, [], run_id="run-1")
+    handler.on_llm_end(
+        LLMResult(generations=[[ChatGeneration(message=message)]]), run_id="run-1"
+    )
+
+    entry = recorder.summary()["llm:unknown"]
+    assert entry["prompt_tokens"] == 1000
+    assert entry["completion_tokens"] == 200
+    assert entry["prompt_cache_hit_tokens"] == 600
+    assert entry["queue_p50"] == 0.5
+    assert entry["cost_usd"] == pytest.approx(
+        (600 * 0.028 + 400 * 0.28 + 200 * 0.42) / 1_000_000
+    )
+
+
+def test_graph_run_reports_nodes_llm_and_tools(simulated_agents, recorder) -> None:
+    simulated_agents.graph.invoke({"messages": [("user", "分析DEMO")]})
+
+    summary = recorder.summary()
+    for node in (
+        "coordinator",
+        "fundamental_analysis",
+        "peer_review",
+        "senior_synthesis",
+        "consensus_check",
+    ):
+        assert summary[f"node:{node}"]["count"] >= 1
+        assert summary[f"node:{node}"]["p95"] >= 0
+    # 行情数据已预取，分析师一次模型调用即可作答
+    assert summary["llm:fundamental_analysis"]["count"] == 1
+    assert summary["llm:fundamental_analysis"]["prompt_tokens"] > 0
+    assert summary["tool:get_stock_data"]["count"] >= 1
+    assert summary["node:prefetch_data"]["count"] == 1
@@ -0,0 +1,40 @@
+from agent.query import (
+    detect_intents,
+    extract_ticker,
+    extract_tickers,
+    normalize_query,
+    query_key,
+)
+
+
+def test_extract_ticker() -> None:
+    assert extract_ticker("请分析AAPL的投资价值") == "AAPL"
+    assert extract_ticker("贵州茅台 600519.sh 估值如何") == "600519.SH"
+    assert extract_ticker("腾讯 0700.HK 走势") == "0700.HK"
+    assert extract_ticker("看看 PE 和 ROE 高的ETF") is None
+
+
+def test_intents_and_keys() -> None:
+    assert detect_intents("AAPL的技术面和风险") == ["risk", "technical"]
+    assert detect_intents("分析AAPL") == ["general"]
+    assert (
+        query_key("请分析 AAPL 的估值")
+        == query_key("AAPL估值怎么样？")
+        == "AAPL:fundamental"
+    )
+    assert normalize_query("  市场，怎么看？ ") == "市场 怎么看"
+    assert query_key("市场，怎么看？") == query_key("市场 怎么看") == "text:市场 怎么看"
+
+
+def test_multi_ticker_queries_use_all_tickers() -> None:
+    assert extract_tickers("对比 MSFT 与 AAPL，以及 600519.SH 和 AAPL") == [
+        "MSFT",
+        "AAPL",
+        "600519.SH",
+    ]
+    assert (
+        query_key("对比AAPL和MSFT")
+        == query_key("MSFT 和 AAPL 对比")
+        == "AAPL,MSFT:general"
+    )
+    assert query_key("对比AAPL和MSFT") != query_key("对比AAPL和NVDA")
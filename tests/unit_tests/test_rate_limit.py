@@ -0,0 +1,92 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langgraph.prebuilt import create_react_agent
+
+from agent.graph import get_stock_data
+from agent.rate_limit import ChatModelGovernor, GovernedChatModel, TokenBucket
+from agent.simulation import SimulatedChatModel
+
+
+def test_token_bucket_reports_wait_when_exhausted() -> None:
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.try_acquire(60) == 0.0
+    assert bucket.try_acquire(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_in_flight_cap_is_shared_across_threads() -> None:
+    governor = ChatModelGovernor(max_in_flight=2)
+    model = GovernedChatModel(
+        inner=SimulatedChatModel(latency_seconds=0.1, tool_rounds=0), governor=governor
+    )
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        start = time.monotonic()
+        list(pool.map(lambda _: model.invoke("分析DEMO"), range(6)))
+        elapsed = time.monotonic() - start
+
+    assert elapsed >= 0.3
+    stats = governor.stats()
+    assert stats["requests"] == 6
+    assert stats["queued_requests"] >= 4
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.anyio
+async def test_requests_per_minute_delays_async_calls() -> None:
+    governor = ChatModelGovernor(requests_per_minute=600)
+    model = GovernedChatModel(
+        inner=SimulatedChatModel(tool_rounds=0), governor=governor
+    )
+    governor.request_bucket._tokens = 1
+
+    start = time.monotonic()
+    results = await asyncio.gather(model.ainvoke("分析A"), model.ainvoke("分析B"))
+    assert time.monotonic() - start >= 0.08
+    waits = sorted(r.response_metadata["queue_wait_seconds"] for r in results)
+    assert waits[0] < 0.05 and waits[1] >= 0.08
+
+
+def test_bound_tools_pass_through_governor() -> None:
+    governor = ChatModelGovernor(max_in_flight=1)
+    model = GovernedChatModel(inner=SimulatedChatModel(), governor=governor)
+    agent = create_react_agent(model, [get_stock_data])
+    result = agent.invoke({"messages": [("user", "分析DEMO")]})
+    assert any(m.type == "tool" for m in result["messages"])
+    assert governor.stats()["requests"] == 2
+
+
+@pytest.mark.anyio
+async def test_async_waiters_are_handed_slots_in_order() -> None:
+    governor = ChatModelGovernor(max_in_flight=1)
+    order = []
+
+    async def call(name, hold):
+        async with governor.aacquire(1):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    first = asyncio.ensure_future(call("a", 0.05))
+    await asyncio.sleep(0)
+    cancelled = asyncio.ensure_future(call("cancelled", 0))
+    others = [asyncio.ensure_future(call(name, 0.01)) for name in ("b", "c")]
+    await asyncio.sleep(0.01)
+    cancelled.cancel()
+    await asyncio.gather(first, *others)
+
+    # 取消的等待者不占用槽位，其余按排队顺序获得槽位
+    assert order == ["a", "b", "c"]
+    assert governor.stats()["in_flight"] == 0
+
+
+def test_in_flight_cap_is_opt_in(monkeypatch) -> None:
+    from agent import rate_limit
+
+    monkeypatch.delenv("DEEPSEEK_MAX_IN_FLIGHT", raising=False)
+    monkeypatch.setattr(rate_limit, "_governor", None)
+    assert rate_limit.get_governor().max_in_flight is None
+    monkeypatch.setenv("DEEPSEEK_MAX_IN_FLIGHT", "4")
+    monkeypatch.setattr(rate_limit, "_governor", None)
+    assert rate_limit.get_governor().max_in_flight == 4
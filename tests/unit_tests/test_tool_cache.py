@@ -0,0 +1,63 @@
+import time
+
+from agent.tool_cache import (
+    ToolResultCache,
+    cached_tool,
+    get_tool_cache,
+    normalize_arguments,
+    set_tool_cache,
+    tool_cache_stats,
+)
+
+
+def _lookup(symbol: str, period: str = "1y") -> str:
+    return f"{symbol}:{period}"
+
+
+def test_normalize_arguments_fills_defaults_and_strips() -> None:
+    assert normalize_arguments(_lookup, ("AAPL",), {}) == normalize_arguments(
+        _lookup, (), {"symbol": " AAPL ", "period": "1y"}
+    )
+    assert normalize_arguments(_lookup, ("AAPL",), {}) != normalize_arguments(
+        _lookup, ("aapl",), {}
+    )
+
+
+def test_cached_tool_counts_hits_and_misses() -> None:
+    calls = []
+
+    @cached_tool(ttl=60)
+    def fetch(symbol: str) -> str:
+        calls.append(symbol)
+        return symbol
+
+    previous = get_tool_cache()
+    set_tool_cache(ToolResultCache())
+    try:
+        assert fetch("0700.HK") == "0700.HK"
+        # 命中的缓存值与调用方的参数一致：首尾空白被去除，大小写不同视为不同请求
+        assert fetch(" 0700.HK ") == "0700.HK"
+        assert fetch("0700.hk") == "0700.hk"
+        assert calls == ["0700.HK", "0700.hk"]
+        assert tool_cache_stats()["fetch"] == {"hits": 1, "sqlite_hits": 0, "misses": 2}
+    finally:
+        set_tool_cache(previous)
+
+
+def test_ttl_expiry_and_lru_eviction() -> None:
+    cache = ToolResultCache(max_entries=2)
+    cache.set("t", "a", "A", ttl=0.01)
+    cache.set("t", "b", "B", ttl=60)
+    cache.set("t", "c", "C", ttl=60)
+    time.sleep(0.02)
+    assert cache.get("t", "a") != "A"
+    assert cache.get("t", "b") == "B"
+    assert cache.get("t", "c") == "C"
+
+
+def test_sqlite_tier_survives_new_instance(tmp_path) -> None:
+    path = str(tmp_path / "tools.sqlite")
+    ToolResultCache(sqlite_path=path).set("t", "k", "V", ttl=60)
+    cache = ToolResultCache(sqlite_path=path)
+    assert cache.get("t", "k") == "V"
+    assert cache.stats()["t"]["sqlite_hits"] == 1